@@ -0,0 +1,228 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag, urlencode
+from rest_framework.renderers import JSONRenderer
+
+from .replicas import read_from_primary
+
+VERSION_KEY = 'reference:version:{}'
+PAYLOAD_KEY = 'reference:payload:{}:{}'
+RESPONSE_KEY = 'response:{}'
+FEED_PARAMS = ('author', 'tags', 'search', 'page', 'limit', 'cursor')
+FLIGHT_WAIT = 5
+FLIGHT_POLL = 0.05
+
+
+def get_version(name):
+    '''
+    Returns the current version of a reference data set.
+    A missing version is started from the clock, so payloads
+    cached under an evicted version are never served again.
+    '''
+    key = VERSION_KEY.format(name)
+    version = cache.get(key)
+    if version is not None:
+        return version
+    cache.add(key, time.time_ns(), None)
+    return cache.get(key)
+
+
+def bump_version(name):
+    key = VERSION_KEY.format(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def tags_changed():
+    bump_version('tags')
+
+
+def ingredients_changed():
+    bump_version('ingredients')
+
+
+def recipes_changed():
+    bump_version('recipes')
+
+
+def reference_payload(names, build):
+    '''
+    Returns (body, etag) of a reference data response.
+    The body is rendered by "build" only once per version
+    of the data sets listed in "names".
+    '''
+    key = PAYLOAD_KEY.format(
+        '+'.join(names), ':'.join(str(get_version(name)) for name in names)
+    )
+    payload = cache.get(key)
+    if payload is None:
+        with read_from_primary():
+            body = JSONRenderer().render(build())
+        payload = (body, quote_etag(hashlib.sha256(body).hexdigest()))
+        cache.set(key, payload, settings.REFERENCE_CACHE_TIMEOUT)
+    return payload
+
+
+def strip_weak(etag):
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def etag_matches(header, etag):
+    '''
+    Weak comparison of an If-None-Match header with an ETag:
+    proxies compressing the body, such as nginx with gzip,
+    turn the ETag into a weak one.
+    '''
+    etags = parse_etags(header)
+    if etags == ['*']:
+        return True
+    return strip_weak(etag) in {strip_weak(tag) for tag in etags}
+
+
+def reference_response(request, body, etag):
+    '''
+    Answers 304 if the client already has the payload.
+    Clients and proxies may reuse the payload for
+    REFERENCE_CACHE_MAX_AGE seconds before revalidating.
+    '''
+    if etag_matches(request.META.get('HTTP_IF_NONE_MATCH', ''), etag):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = (
+        f'public, max-age={settings.REFERENCE_CACHE_MAX_AGE}, '
+        'must-revalidate'
+    )
+    return response
+
+
+class SingleFlight:
+    '''
+    Runs a function once for all threads that ask for the same key
+    at the same time; the others wait and share its result.
+    '''
+
+    class Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = self.error = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, func):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = self.Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+        except Exception as error:
+            call.error = error
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+
+flights = SingleFlight()
+
+
+def public_base_url():
+    return settings.PUBLIC_BASE_URL.rstrip('/') + '/'
+
+
+def feed_cache_key(request):
+    '''
+    Key of an anonymous recipe response: the recipe generation,
+    the public base URL, the path and the parameters that change
+    the result, sorted so that equivalent queries share an entry.
+    '''
+    params = sorted(
+        (name, ' '.join(value.split()))
+        for name in FEED_PARAMS
+        for value in request.query_params.getlist(name)
+    )
+    raw = (
+        f'{get_version("recipes")}:{public_base_url()}:'
+        f'{request.path}?{urlencode(params)}'
+    )
+    return RESPONSE_KEY.format(hashlib.sha256(raw.encode()).hexdigest())
+
+
+def with_public_urls(data, base):
+    '''
+    Replaces the request base URL at the start of the strings
+    in the data with PUBLIC_BASE_URL.
+    '''
+    if isinstance(data, str):
+        if data.startswith(base):
+            return public_base_url() + data[len(base):]
+        return data
+    if isinstance(data, dict):
+        return {key: with_public_urls(value, base)
+                for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [with_public_urls(value, base) for value in data]
+    return data
+
+
+def build_once(response_cache, key, build):
+    '''
+    Builds and stores the value unless another process holds the lease
+    for the key; then waits up to FLIGHT_WAIT seconds for its result
+    and builds the value itself only if none arrives.
+    '''
+    lease = f'{key}:lease'
+    deadline = time.monotonic() + FLIGHT_WAIT
+    acquired = response_cache.add(lease, True, FLIGHT_WAIT)
+    while not acquired and time.monotonic() < deadline:
+        time.sleep(FLIGHT_POLL)
+        data = response_cache.get(key)
+        if data is not None:
+            return data
+        acquired = response_cache.add(lease, True, FLIGHT_WAIT)
+    try:
+        with read_from_primary():
+            data = build()
+        response_cache.set(key, data)
+    finally:
+        if acquired:
+            response_cache.delete(lease)
+    return data
+
+
+def cached_response_data(request, build):
+    '''
+    Returns the response data of an anonymous recipe request
+    from the "responses" cache, building it with "build" on a miss.
+    Concurrent misses on the same key run "build" only once.
+    The Host header is chosen by the client, so the absolute URLs
+    of the cached data are built from PUBLIC_BASE_URL instead.
+    '''
+    response_cache = caches[settings.RESPONSE_CACHE_ALIAS]
+    key = feed_cache_key(request)
+    data = response_cache.get(key)
+    if data is not None:
+        return data
+    base = request.build_absolute_uri('/')
+    return flights.do(key, lambda: build_once(
+        response_cache, key, lambda: with_public_urls(build(), base)
+    ))
@@ -0,0 +1,206 @@
+import base64
+import io
+from itertools import count
+
+from django.contrib.auth import get_user_model
+from PIL import Image
+from recipes.models import Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+SAMPLE_PASSWORD = 'sample-password-7'
+SAMPLE_RECIPE_NAME = 'Sample recipe'
+BATCH_SIZE = 5
+DUMMY_CACHE = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+NO_CACHES = {'default': DUMMY_CACHE, 'responses': DUMMY_CACHE}
+
+
+def sample_user():
+    '''
+    Returns the most prolific user that has favorites and a cart,
+    so every endpoint returns non-empty data for them.
+    '''
+    return User.objects.filter(
+        is_favorited__isnull=False, is_in_shopping_cart__isnull=False
+    ).order_by('-recipes_count', 'id').first()
+
+
+def sample_image():
+    '''Small PNG as a base64 data URL, like the frontend sends.'''
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), 'orange').save(buffer, 'PNG')
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+def recipe_payload():
+    '''Recipe create/update data made of existing tags and ingredients.'''
+    return {
+        'name': SAMPLE_RECIPE_NAME,
+        'text': 'Sample text',
+        'cooking_time': 10,
+        'image': sample_image(),
+        'tags': list(Tag.objects.order_by('id').values_list(
+            'id', flat=True
+        )[:2]),
+        'ingredients': [
+            {'id': pk, 'amount': 100}
+            for pk in Ingredient.objects.order_by('id').values_list(
+                'id', flat=True
+            )[:5]
+        ],
+    }
+
+
+def resolve(value):
+    '''
+    Part of a sample request; callables are called when the request
+    is sent, so paths and payloads can depend on earlier requests.
+    '''
+    return value() if callable(value) else value
+
+
+def send(client, method, path, data=None):
+    '''Sends a sample request, with its data as JSON.'''
+    path, data = resolve(path), resolve(data)
+    if data is None:
+        return getattr(client, method)(path)
+    return getattr(client, method)(path, data, format='json')
+
+
+def sample_requests(user):
+    '''
+    Returns (name, method, path, data) of a representative request
+    to every route of api/urls.py, made as "user"; path and data may
+    be callables (see resolve). Names do not depend on the ids in the
+    path, so results from different databases can be compared.
+    Writes come in POST/DELETE pairs on recipes and authors the user
+    has not marked yet, so every request succeeds and running the
+    list repeatedly keeps the data stable. The user's password is set
+    to SAMPLE_PASSWORD for the login request.
+    '''
+    user.set_password(SAMPLE_PASSWORD)
+    user.save(update_fields=['password'])
+    recipe = Recipe.objects.filter(author=user).first()
+    unmarked = Recipe.objects.exclude(
+        is_favorited__user=user
+    ).exclude(is_in_shopping_cart__user=user).order_by('id')
+    target = unmarked.first()
+    batch = list(unmarked.values_list('id', flat=True)[1:BATCH_SIZE + 1])
+    author = User.objects.exclude(pk=user.pk).exclude(
+        author__user=user
+    ).order_by('-followers_count', 'id').first()
+    tag = Tag.objects.order_by('id').first()
+    ingredient = Ingredient.objects.order_by('id').first()
+    word = recipe.name.split()[0] if recipe else 'a'
+    requests = [
+        ('GET /api/tags/', 'get', '/api/tags/', None),
+        ('GET /api/ingredients/', 'get', '/api/ingredients/', None),
+        ('GET /api/ingredients/?name=', 'get',
+         f'/api/ingredients/?name={word[:3]}', None),
+        ('GET /api/reference/', 'get', '/api/reference/', None),
+        ('GET /api/recipes/', 'get', '/api/recipes/', None),
+        ('GET /api/recipes/?page=2', 'get', '/api/recipes/?page=2', None),
+        ('GET /api/recipes/?cursor=', 'get', '/api/recipes/?cursor=', None),
+        ('GET /api/recipes/?author=', 'get',
+         f'/api/recipes/?author={user.pk}', None),
+        ('GET /api/recipes/?search=', 'get', f'/api/recipes/?search={word}',
+         None),
+        ('GET /api/recipes/?is_favorited=1', 'get',
+         '/api/recipes/?is_favorited=1', None),
+        ('GET /api/recipes/?is_in_shopping_cart=1', 'get',
+         '/api/recipes/?is_in_shopping_cart=1', None),
+        ('GET /api/recipes/download_shopping_cart/', 'get',
+         '/api/recipes/download_shopping_cart/', None),
+        ('GET /api/users/', 'get', '/api/users/', None),
+        ('GET /api/users/?cursor=', 'get', '/api/users/?cursor=', None),
+        ('GET /api/users/{id}/', 'get', f'/api/users/{user.pk}/', None),
+        ('GET /api/users/me/', 'get', '/api/users/me/', None),
+        ('GET /api/users/subscriptions/', 'get',
+         '/api/users/subscriptions/', None),
+    ]
+    if tag:
+        requests += [
+            ('GET /api/tags/{id}/', 'get', f'/api/tags/{tag.pk}/', None),
+            ('GET /api/recipes/?tags=', 'get',
+             f'/api/recipes/?tags={tag.slug}', None),
+        ]
+    if ingredient:
+        requests.append((
+            'GET /api/ingredients/{id}/', 'get',
+            f'/api/ingredients/{ingredient.pk}/', None
+        ))
+    if recipe:
+        requests.append((
+            'GET /api/recipes/{id}/', 'get', f'/api/recipes/{recipe.pk}/',
+            None
+        ))
+    if target:
+        for toggle in ('favorite', 'shopping_cart'):
+            path = f'/api/recipes/{target.pk}/{toggle}/'
+            requests += [
+                (f'POST /api/recipes/{{id}}/{toggle}/', 'post', path, None),
+                (f'DELETE /api/recipes/{{id}}/{toggle}/', 'delete', path,
+                 None),
+            ]
+    if batch:
+        for toggle in ('favorite', 'shopping_cart'):
+            path = f'/api/recipes/{toggle}/'
+            data = {'recipes': batch}
+            requests += [
+                (f'POST /api/recipes/{toggle}/', 'post', path, data),
+                (f'DELETE /api/recipes/{toggle}/', 'delete', path, data),
+            ]
+    if author:
+        path = f'/api/users/{author.pk}/subscribe/'
+        requests += [
+            ('POST /api/users/{id}/subscribe/', 'post', path, None),
+            ('DELETE /api/users/{id}/subscribe/', 'delete', path, None),
+        ]
+    if tag and ingredient:
+        requests += recipe_requests(user)
+    return requests + user_requests(user)
+
+
+def recipe_requests(user):
+    '''Creates, updates and deletes a recipe of the user.'''
+    def created_path():
+        pk = Recipe.objects.filter(
+            author=user, name=SAMPLE_RECIPE_NAME
+        ).order_by('-id').values_list('id', flat=True).first()
+        return f'/api/recipes/{pk}/'
+
+    return [
+        ('POST /api/recipes/', 'post', '/api/recipes/', recipe_payload),
+        ('PUT /api/recipes/{id}/', 'put', created_path, recipe_payload),
+        ('PATCH /api/recipes/{id}/', 'patch', created_path, recipe_payload),
+        ('DELETE /api/recipes/{id}/', 'delete', created_path, None),
+    ]
+
+
+def user_requests(user):
+    '''Registers a new user, changes the password, logs in and out.'''
+    numbers = count()
+
+    def registration():
+        number = next(numbers)
+        return {
+            'email': f'sample-{user.pk}-{number}@example.com',
+            'username': f'sample-{user.pk}-{number}',
+            'first_name': 'Sample',
+            'last_name': 'User',
+            'password': SAMPLE_PASSWORD,
+        }
+
+    password = {
+        'current_password': SAMPLE_PASSWORD, 'new_password': SAMPLE_PASSWORD
+    }
+    return [
+        ('POST /api/users/', 'post', '/api/users/', registration),
+        ('POST /api/users/set_password/', 'post',
+         '/api/users/set_password/', password),
+        ('POST /api/auth/token/login/', 'post', '/api/auth/token/login/',
+         {'email': user.email, 'password': SAMPLE_PASSWORD}),
+        ('POST /api/auth/token/logout/', 'post', '/api/auth/token/logout/',
+         None),
+    ]
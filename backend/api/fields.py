@@ -0,0 +1,126 @@
+import base64
+import binascii
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from drf_extra_fields.fields import Base64FieldMixin, Base64ImageField
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+
+from .metrics import timed
+
+BASE64_CHUNK_SIZE = 64 * 1024
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+
+def file_digest(file):
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    return digest.digest()
+
+
+def same_content(stored, upload):
+    '''
+    Tells whether a stored FieldFile holds the same bytes as an upload.
+    Sizes are compared first, so a changed image is rarely read back.
+    '''
+    if not stored:
+        return False
+    try:
+        if stored.size != upload.size:
+            return False
+        stored.open('rb')
+        try:
+            return file_digest(stored) == file_digest(upload)
+        finally:
+            stored.close()
+    except OSError:
+        return False
+
+
+class BoundedImageField(Base64ImageField):
+    '''
+    Image field that accepts either a base64 string or an uploaded file.
+    Base64 input is checked against the size limit before decoding and
+    decoded in chunks into a temporary file. The pixel limit is checked
+    from the image header, before Pillow decodes any pixel data.
+    '''
+
+    def to_internal_value(self, data):
+        if data in self.EMPTY_VALUES:
+            return None
+        with timed('decode'):
+            if isinstance(data, str):
+                data = self.decode(data)
+            elif not isinstance(data, UploadedFile):
+                raise ValidationError(self.INVALID_FILE_MESSAGE)
+            try:
+                self.check_size(data.size)
+                self.check_image(data)
+            except ValidationError:
+                data.close()
+                raise
+            return super(Base64FieldMixin, self).to_internal_value(data)
+
+    def check_size(self, size):
+        if size > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise ValidationError(
+                'The image must not exceed '
+                f'{settings.RECIPE_IMAGE_MAX_SIZE} bytes.'
+            )
+
+    def check_image(self, upload):
+        position = upload.tell()
+        try:
+            with Image.open(upload) as image:
+                width, height = image.size
+                image_format = image.format
+        except (OSError, Image.DecompressionBombError):
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        finally:
+            upload.seek(position)
+        if image_format not in EXTENSIONS:
+            raise ValidationError(self.INVALID_TYPE_MESSAGE)
+        if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            raise ValidationError(
+                'The image must not exceed '
+                f'{settings.RECIPE_IMAGE_MAX_PIXELS} pixels.'
+            )
+        upload.name = f'{uuid.uuid4()}.{EXTENSIONS[image_format]}'
+
+    def decode(self, data):
+        '''
+        Decodes base64 in chunks, skipping line breaks and other
+        whitespace. The string is never copied as a whole.
+        '''
+        offset = data.find(';base64,')
+        offset = 0 if offset < 0 else offset + len(';base64,')
+        tail = data[-4:].rstrip()
+        padding = len(tail) - len(tail.rstrip('='))
+        breaks = data.count('\n', offset) + data.count('\r', offset)
+        self.check_size((len(data) - offset - breaks) * 3 // 4 - padding)
+        upload = TemporaryUploadedFile(
+            name='image', content_type=None, size=0, charset=None
+        )
+        pending = ''
+        try:
+            for start in range(offset, len(data), BASE64_CHUNK_SIZE):
+                chunk = pending + ''.join(
+                    data[start:start + BASE64_CHUNK_SIZE].split()
+                )
+                complete = len(chunk) - len(chunk) % 4
+                upload.file.write(
+                    base64.b64decode(chunk[:complete], validate=True)
+                )
+                pending = chunk[complete:]
+            if pending:
+                raise ValueError('Incomplete base64 data.')
+        except (binascii.Error, ValueError):
+            upload.close()
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        upload.size = upload.file.tell()
+        upload.file.seek(0)
+        return upload
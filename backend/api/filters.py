@@ -1,36 +1,117 @@
+from django import forms
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
 from django_filters.rest_framework import FilterSet
-from django_filters.rest_framework.filters import (ModelMultipleChoiceFilter,
+from django_filters.rest_framework.filters import (CharFilter, Filter,
                                                    NumberFilter)
-from recipes.models import Recipe, Tag
+from recipes.fields import bitmask
+from recipes.models import Recipe, RecipeTag, Tag
+from recipes.search import search_recipes
 from rest_framework.filters import SearchFilter
 
+from .cache import get_version
+from .replicas import read_from_primary
+
+_tag_bits = (None, {})
+
+
+def tag_bits():
+    """
+    Returns {slug: bit} of all tags. The map is kept in the process
+    and reloaded when the shared version of the tags changes.
+    """
+    global _tag_bits
+    version, bits = _tag_bits
+    current = get_version('tags')
+    if current is None or current != version:
+        with read_from_primary():
+            bits = dict(Tag.objects.values_list('slug', 'bit'))
+        _tag_bits = (current, bits)
+    return bits
+
+
+class TagSlugsField(forms.Field):
+    """
+    Field with the values of a repeated query parameter,
+    each of which must be a tag slug.
+    """
+    widget = forms.MultipleHiddenInput
+    default_error_messages = {
+        'invalid_choice': _(
+            'Select a valid choice. %(value)s is not one of the'
+            ' available choices.'
+        ),
+    }
+
+    def to_python(self, value):
+        return [slug for slug in value or () if slug]
+
+    def validate(self, value):
+        super().validate(value)
+        bits = tag_bits()
+        for slug in value:
+            if slug not in bits:
+                raise forms.ValidationError(
+                    self.error_messages['invalid_choice'],
+                    code='invalid_choice', params={'value': slug}
+                )
+
+
+class TagSlugsFilter(Filter):
+    field_class = TagSlugsField
+
 
 class RecipeFilter(FilterSet):
     """
     Filter for Recipes.
+    Tags are matched with a bitwise test of Recipe.tags_mask
+    and the user flags with EXISTS subqueries, so no filter
+    joins rows that could repeat a recipe.
     """
     is_favorited = NumberFilter(method='filter_is_favorited')
     is_in_shopping_cart = NumberFilter(method='filter_is_in_shopping_cart')
-    tags = ModelMultipleChoiceFilter(
-        queryset=Tag.objects.all(),
-        field_name='tags__slug',
-        to_field_name='slug'
-    )
+    tags = TagSlugsFilter(method='filter_tags')
     author = NumberFilter()
+    search = CharFilter(method='filter_search')
+
+    def with_user_flags(self, queryset):
+        if 'favorited' in queryset.query.annotations:
+            return queryset
+        return queryset.with_user_flags(self.request.user)
 
     def filter_is_favorited(self, queryset, name, value):
         if value and not self.request.user.is_anonymous:
-            return queryset.filter(is_favorited__user=self.request.user)
+            return self.with_user_flags(queryset).filter(favorited=True)
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         if value and not self.request.user.is_anonymous:
-            return queryset.filter(is_in_shopping_cart__user=self.request.user)
+            return self.with_user_flags(queryset).filter(
+                in_shopping_cart=True
+            )
+        return queryset
+
+    def filter_tags(self, queryset, name, value):
+        bits = tag_bits()
+        mask = bitmask(bits[slug] for slug in value)
+        condition = Q(tags_mask__hasany=mask) if mask else Q()
+        without_bit = [slug for slug in value if bits[slug] is None]
+        if without_bit:
+            condition |= Q(pk__in=RecipeTag.objects.filter(
+                tag__slug__in=without_bit
+            ).values('recipe'))
+        return queryset.filter(condition)
+
+    def filter_search(self, queryset, name, value):
+        if value.strip():
+            return search_recipes(queryset, value)
         return queryset
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'author', 'tags', 'is_favorited', 'is_in_shopping_cart', 'search'
+        )
 
 
 class IngredientFilter(SearchFilter):
@@ -0,0 +1,15 @@
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+from .metrics import timed
+
+
+class TimedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    '''
+    The default hasher, with the time spent hashing counted in the
+    "hash" phase of the request. The algorithm name is unchanged,
+    so existing password hashes stay valid.
+    '''
+
+    def encode(self, password, salt, iterations=None):
+        with timed('hash'):
+            return super().encode(password, salt, iterations)
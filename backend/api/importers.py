@@ -0,0 +1,329 @@
+import base64
+import csv
+import io
+import json
+import os
+from itertools import islice
+from types import SimpleNamespace
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from recipes.models import Ingredient, Recipe, Tag
+
+from .fields import same_content
+from .serializers import RecipeCreateUpdateSerializer
+from .services import recipe_amounts
+
+User = get_user_model()
+
+INGREDIENT_FIELDS = ('name', 'measurement_unit')
+NAME_LENGTH = 200
+STAGING_TABLE = 'ingredient_import'
+
+
+class ImportReport:
+    '''Counts of the rows handled by an import.'''
+
+    def __init__(self):
+        self.inserted = self.updated = self.unchanged = self.skipped = 0
+        self.errors = []
+
+    def skip(self, error=None):
+        self.skipped += 1
+        if error is not None:
+            self.errors.append(error)
+
+    def __str__(self):
+        return (
+            f'Inserted: {self.inserted}, updated: {self.updated}, '
+            f'unchanged: {self.unchanged}, skipped: {self.skipped}.'
+        )
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    batch = list(islice(rows, size))
+    while batch:
+        yield batch
+        batch = list(islice(rows, size))
+
+
+def load_fixture(path, model):
+    '''
+    Returns the objects of a JSON fixture: either a list of plain
+    objects or a Django fixture, of which only the "fields"
+    of the given model are taken.
+    '''
+    with open(path, encoding='utf-8') as file:
+        items = json.load(file)
+    return [
+        item['fields'] if 'fields' in item else item
+        for item in items
+        if 'fields' not in item or item.get('model') == model
+    ]
+
+
+def read_ingredients(path):
+    '''
+    Yields (name, measurement_unit) pairs from a CSV file,
+    with or without a header, or from a JSON fixture.
+    The CSV file is read lazily, so its size is not limited.
+    '''
+    if path.endswith('.json'):
+        for item in load_fixture(path, 'recipes.ingredient'):
+            yield item.get('name'), item.get('measurement_unit')
+        return
+    with open(path, encoding='utf-8', newline='') as file:
+        for row in csv.reader(file):
+            if tuple(row) != INGREDIENT_FIELDS:
+                yield tuple(row[:2]) if len(row) >= 2 else (None, None)
+
+
+def clean_ingredients(rows, report):
+    '''Strips the values and skips the rows that do not fit the table.'''
+    for name, unit in rows:
+        name, unit = (name or '').strip(), (unit or '').strip()
+        if not name or not unit or max(len(name), len(unit)) > NAME_LENGTH:
+            report.skip()
+            continue
+        yield name, unit
+
+
+def insert_ingredients(keys):
+    '''
+    Inserts (name, measurement_unit) pairs with multi-row statements
+    that leave out the pairs already in the table, including
+    the ones added by a concurrent import.
+    Returns the number of inserted rows.
+    '''
+    ops = connection.ops
+    fields = [Ingredient._meta.get_field(name) for name in INGREDIENT_FIELDS]
+    insert = ' '.join((
+        ops.insert_statement(ignore_conflicts=True),
+        ops.quote_name(Ingredient._meta.db_table),
+        f'({", ".join(ops.quote_name(field.column) for field in fields)})',
+        'VALUES',
+    ))
+    suffix = ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)
+    inserted = 0
+    with connection.cursor() as cursor:
+        for chunk in batches(keys, ops.bulk_batch_size(fields, keys)):
+            values = ', '.join('(%s, %s)' for _ in chunk)
+            cursor.execute(
+                f'{insert} {values} {suffix}'.rstrip(),
+                [value for key in chunk for value in key]
+            )
+            inserted += cursor.rowcount
+    return inserted
+
+
+def upsert_ingredient_batch(batch, report):
+    '''
+    Inserts the ingredients of a batch that are not in the table.
+    Repeated rows of the batch are skipped.
+    '''
+    keys = list(dict.fromkeys(batch))
+    inserted = insert_ingredients(keys)
+    report.skipped += len(batch) - len(keys)
+    report.inserted += inserted
+    report.unchanged += len(keys) - inserted
+
+
+def copy_ingredients(rows, batch_size, report):
+    '''
+    Streams the ingredients into a temporary table with COPY
+    and merges them into the table with one INSERT ... ON CONFLICT.
+    Repeated rows of the file are skipped. PostgreSQL only.
+    '''
+    table = connection.ops.quote_name(Ingredient._meta.db_table)
+    staged = 0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TEMPORARY TABLE {STAGING_TABLE} '
+            f'(name varchar({NAME_LENGTH}), '
+            f'measurement_unit varchar({NAME_LENGTH})) ON COMMIT DROP'
+        )
+        for batch in batches(rows, batch_size):
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(batch)
+            buffer.seek(0)
+            cursor.copy_expert(
+                f'COPY {STAGING_TABLE} (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)', buffer
+            )
+            staged += len(batch)
+        cursor.execute(
+            f'INSERT INTO {table} (name, measurement_unit) '
+            f'SELECT DISTINCT name, measurement_unit FROM {STAGING_TABLE} '
+            'ON CONFLICT (name, measurement_unit) DO NOTHING'
+        )
+        inserted = cursor.rowcount
+        cursor.execute(
+            'SELECT count(*) FROM (SELECT DISTINCT name, measurement_unit '
+            f'FROM {STAGING_TABLE}) staged'
+        )
+        distinct, = cursor.fetchone()
+    report.skipped += staged - distinct
+    report.inserted += inserted
+    report.unchanged += distinct - inserted
+
+
+@transaction.atomic
+def import_ingredients(path, batch_size):
+    '''
+    Adds the ingredients of a file that are not in the table yet,
+    holding at most "batch_size" rows in memory.
+    '''
+    report = ImportReport()
+    rows = clean_ingredients(read_ingredients(path), report)
+    if connection.vendor == 'postgresql':
+        copy_ingredients(rows, batch_size, report)
+    else:
+        for batch in batches(rows, batch_size):
+            upsert_ingredient_batch(batch, report)
+    return report
+
+
+def upsert_tag(fields, report):
+    values = {name: fields.get(name) for name in ('name', 'color', 'slug')}
+    if not values['name'] or not values['slug']:
+        report.skip(f'{values}: name and slug are required.')
+        return
+    tag = Tag.objects.filter(slug=values['slug']).first()
+    if tag is None:
+        Tag.objects.create(**values)
+        report.inserted += 1
+    elif (tag.name, tag.color) != (values['name'], values['color']):
+        tag.name, tag.color = values['name'], values['color']
+        tag.save(update_fields=('name', 'color'))
+        report.updated += 1
+    else:
+        report.unchanged += 1
+
+
+def import_tags(path):
+    '''Creates or updates tags from a JSON fixture, matching by slug.'''
+    report = ImportReport()
+    for fields in load_fixture(path, 'recipes.tag'):
+        try:
+            with transaction.atomic():
+                upsert_tag(fields, report)
+        except IntegrityError as error:
+            report.skip(f'{fields.get("slug")}: {error}')
+    return report
+
+
+class RecipeImporter:
+    '''
+    Creates or updates recipes from a JSON fixture through
+    RecipeCreateUpdateSerializer, so that counters, shopping lists,
+    the search index and image variants are kept up to date.
+    A recipe is matched by its author and name. Its fixture object
+    references the author by email or username, tags by slug,
+    ingredients by name and measurement unit, and the image
+    by a path relative to the fixture or a base64 data URI.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.base_dir = os.path.dirname(os.path.abspath(path))
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.report = ImportReport()
+
+    def run(self):
+        for item in load_fixture(self.path, 'recipes.recipe'):
+            with transaction.atomic():
+                self.import_recipe(item)
+        return self.report
+
+    def import_recipe(self, item):
+        label = f'{item.get("author")}/{item.get("name")}'
+        author = User.objects.filter(
+            Q(email=item.get('author')) | Q(username=item.get('author'))
+        ).first()
+        if author is None:
+            self.report.skip(f'{label}: unknown author.')
+            return
+        try:
+            data = self.payload(item)
+        except ValueError as error:
+            self.report.skip(f'{label}: {error}')
+            return
+        except (KeyError, OSError, TypeError) as error:
+            self.report.skip(f'{label}: {error!r}')
+            return
+        recipe = Recipe.objects.filter(
+            author=author, name=item.get('name')
+        ).first()
+        serializer = RecipeCreateUpdateSerializer(
+            recipe, data=data, partial=recipe is not None,
+            context={'request': SimpleNamespace(user=author)}
+        )
+        if not serializer.is_valid():
+            self.report.skip(f'{label}: {serializer.errors}')
+        elif recipe is not None and not self.differs(
+            recipe, serializer.validated_data
+        ):
+            serializer.validated_data['image'].close()
+            self.report.unchanged += 1
+        else:
+            serializer.save()
+            if recipe is None:
+                self.report.inserted += 1
+            else:
+                self.report.updated += 1
+
+    def payload(self, item):
+        '''Converts a fixture object to the API request layout.'''
+        keys = [
+            (ingredient['name'], ingredient['measurement_unit'])
+            for ingredient in item['ingredients']
+        ]
+        names = {name for name, _ in keys}
+        ids = {
+            (name, unit): pk for pk, name, unit in Ingredient.objects.filter(
+                name__in=names
+            ).values_list('id', *INGREDIENT_FIELDS)
+        }
+        missing = [slug for slug in item['tags'] if slug not in self.tags]
+        missing += [f'{name} ({unit})' for name, unit in keys
+                    if (name, unit) not in ids]
+        if missing:
+            raise ValueError(f'unknown tags or ingredients: {missing}')
+        return {
+            'name': item.get('name'),
+            'text': item.get('text'),
+            'cooking_time': item.get('cooking_time'),
+            'image': self.image(item['image']),
+            'tags': [self.tags[slug] for slug in item['tags']],
+            'ingredients': [
+                {'id': ids[key], 'amount': ingredient['amount']}
+                for key, ingredient in zip(keys, item['ingredients'])
+            ],
+        }
+
+    def image(self, value):
+        if value.startswith('data:'):
+            return value
+        with open(os.path.join(self.base_dir, value), 'rb') as file:
+            return base64.b64encode(file.read()).decode()
+
+    @staticmethod
+    def differs(recipe, data):
+        '''Whether saving "data" would change the recipe.'''
+        if any(
+            getattr(recipe, field) != data[field]
+            for field in ('text', 'cooking_time')
+        ):
+            return True
+        tags = {tag.id for tag in data['tags']}
+        amounts = {
+            item['ingredient'].id: item['amount']
+            for item in data['ingredients']
+        }
+        return (
+            tags != set(recipe.tags.values_list('id', flat=True))
+            or amounts != recipe_amounts(recipe)
+            or not same_content(recipe.image, data['image'])
+        )
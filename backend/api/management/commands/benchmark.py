@@ -0,0 +1,182 @@
+import json
+import math
+import subprocess
+import time
+
+from api.endpoints import (NO_CACHES, resolve, sample_requests, sample_user,
+                           send)
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart
+from rest_framework.test import APIClient
+from users.models import Subscription
+
+User = get_user_model()
+
+COUNTED_MODELS = (
+    User, Recipe, Ingredient, Favorite, ShoppingCart, Subscription
+)
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, rank):
+    '''Nearest-rank percentile of a non-empty list.'''
+    values = sorted(values)
+    return values[max(math.ceil(rank / 100 * len(values)) - 1, 0)]
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'), cwd=settings.BASE_DIR,
+            capture_output=True, check=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    """
+    Command that requests every API endpoint through the test client
+    and reports p50/p95/p99 latency, query count and response size
+    per endpoint. Results are written as JSON, so runs made on
+    different commits can be compared with --compare.
+    Caches are disabled unless --cache is given, and all writes
+    are rolled back.
+    """
+    help = 'Benchmark the API endpoints.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=30,
+            help='Number of measured requests per endpoint.'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=2,
+            help='Number of unmeasured requests per endpoint.'
+        )
+        parser.add_argument(
+            '--output', default='benchmark.json',
+            help='File to write the results to.'
+        )
+        parser.add_argument(
+            '--compare', metavar='BASELINE',
+            help='Results file of an earlier run to compare with.'
+        )
+        parser.add_argument(
+            '--cache', action='store_true',
+            help='Keep the configured caches.'
+        )
+
+    def handle(self, *args, **options):
+        user = sample_user()
+        if user is None:
+            raise CommandError(
+                'No user has favorites and a shopping cart, run seed_data.'
+            )
+        caches = settings.CACHES if options['cache'] else NO_CACHES
+        with override_settings(CACHES=caches), transaction.atomic():
+            endpoints = self.measure(
+                user, options['warmup'], options['repeat']
+            )
+            transaction.set_rollback(True)
+        results = {
+            'commit': current_commit(),
+            'created': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'cache': options['cache'],
+            'repeat': options['repeat'],
+            'rows': {
+                model._meta.label: model.objects.count()
+                for model in COUNTED_MODELS
+            },
+            'endpoints': endpoints,
+        }
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+        for name, result in endpoints.items():
+            self.stdout.write(
+                f'{name}: {result["status"]}, '
+                f'p50 {result["p50_ms"]} ms, p95 {result["p95_ms"]} ms, '
+                f'p99 {result["p99_ms"]} ms, {result["queries"]} queries, '
+                f'{result["bytes"]} bytes'
+            )
+        if options['compare']:
+            self.compare(options['compare'], endpoints)
+
+    @staticmethod
+    def request(client, method, path, data):
+        '''Returns (status, seconds, queries, bytes) of one request.'''
+        path, data = resolve(path), resolve(data)
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            response = send(client, method, path, data)
+            if response.streaming:
+                body = b''.join(response.streaming_content)
+            else:
+                body = response.content
+            elapsed = time.perf_counter() - start
+        return (
+            response.status_code, elapsed,
+            len(context.captured_queries), len(body)
+        )
+
+    def measure(self, user, warmup, repeat):
+        '''
+        Runs the requests round-robin, so that paired writes
+        alternate, and aggregates the measured runs. Paths and
+        payloads are resolved outside the measured time.
+        '''
+        anonymous, client = APIClient(), APIClient()
+        client.force_authenticate(user)
+        requests = [
+            ('GET /api/recipes/ (anonymous)', anonymous, 'get',
+             '/api/recipes/', None)
+        ] + [
+            (name, client, method, path, data)
+            for name, method, path, data in sample_requests(user)
+        ]
+        samples = {name: [] for name, *_ in requests}
+        for run in range(warmup + repeat):
+            for name, requester, method, path, data in requests:
+                sample = self.request(requester, method, path, data)
+                if run >= warmup:
+                    samples[name].append(sample)
+        return {
+            name: self.summary(runs) for name, runs in samples.items() if runs
+        }
+
+    @staticmethod
+    def summary(runs):
+        latencies = [elapsed * 1000 for _, elapsed, _, _ in runs]
+        result = {
+            f'p{rank}_ms': round(percentile(latencies, rank), 2)
+            for rank in PERCENTILES
+        }
+        status, _, queries, size = runs[-1]
+        result.update(status=status, queries=queries, bytes=size)
+        return result
+
+    def compare(self, path, endpoints):
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)['endpoints']
+        self.stdout.write(f'Compared with {path}:')
+        for name, result in endpoints.items():
+            old = baseline.get(name)
+            if old is None:
+                self.stdout.write(f'{name}: new endpoint')
+                continue
+            change = (
+                (result['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100
+                if old['p95_ms'] else 0
+            )
+            self.stdout.write(
+                f'{name}: p95 {old["p95_ms"]} -> {result["p95_ms"]} ms '
+                f'({change:+.0f}%), queries {old["queries"]} -> '
+                f'{result["queries"]}, bytes {old["bytes"]} -> '
+                f'{result["bytes"]}'
+            )
@@ -0,0 +1,77 @@
+from api.endpoints import NO_CACHES, sample_requests, sample_user, send
+from api.seed import seed_database
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+
+class Command(BaseCommand):
+    """
+    Command that requests every API endpoint and fails if a query
+    repeats more than QUERY_REPEAT_LIMIT times in one request
+    (an N+1 pattern) or a view exceeds its query_budget.
+    Caches are disabled, so every request reaches the database,
+    reads stay on the primary, and all changes, including
+    the optional seeded data, are rolled back at the end.
+    """
+    help = 'Check the API endpoints for repeated queries and budgets.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed', type=int, default=0, metavar='RECIPES',
+            help='Seed this many synthetic recipes (and related rows) '
+                 'before the check.'
+        )
+        parser.add_argument(
+            '--repeat-limit', type=int,
+            help='Override the QUERY_REPEAT_LIMIT setting.'
+        )
+
+    def handle(self, *args, **options):
+        overrides = {
+            'CACHES': NO_CACHES, 'QUERY_INSPECTION': 'collect',
+            'REPLICA_DATABASES': [],
+        }
+        if options['repeat_limit'] is not None:
+            overrides['QUERY_REPEAT_LIMIT'] = options['repeat_limit']
+        with override_settings(**overrides), transaction.atomic():
+            if options['seed']:
+                seed_database(
+                    users=max(options['seed'] // 10, 10),
+                    recipes=options['seed'], seed=0
+                )
+            user = sample_user()
+            if user is None:
+                raise CommandError(
+                    'No user has favorites and a shopping cart, use --seed.'
+                )
+            problems = self.check_endpoints(user)
+            transaction.set_rollback(True)
+        if problems:
+            raise CommandError(f'{len(problems)} query problems.')
+        self.stdout.write('No repeated queries, all budgets are met.')
+
+    def check_endpoints(self, user):
+        anonymous, client = APIClient(), APIClient()
+        client.force_authenticate(user)
+        checks = [('GET /api/recipes/ (anonymous)', anonymous, 'get',
+                   '/api/recipes/', None)] + [
+            (name, client, method, path, data)
+            for name, method, path, data in sample_requests(user)
+        ]
+        problems = []
+        for name, requester, method, path, data in checks:
+            response = send(requester, method, path, data)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            inspection = response.wsgi_request.query_inspection
+            budget = inspection.budget
+            self.stdout.write(
+                f'{name}: {response.status_code}, {inspection.count} queries'
+                + (f' (budget {budget})' if budget is not None else '')
+            )
+            for problem in inspection.problems:
+                self.stdout.write(f'  {problem}')
+            problems += inspection.problems
+        return problems
@@ -0,0 +1,163 @@
+import json
+import re
+
+from api.endpoints import (NO_CACHES, resolve, sample_requests, sample_user,
+                           send)
+from api.seed import seed_database
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+TABLE_ALIAS = re.compile(r'(?:FROM|JOIN) "(\w+)"(?: (?:AS )?([A-Z]\d+)\b)?')
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?$')
+COUNT_QUERY = re.compile(r'^SELECT COUNT\(\*\)')
+
+
+class Command(BaseCommand):
+    """
+    Command that requests every API endpoint with representative
+    filters, runs EXPLAIN on each SELECT they issue and fails
+    if a plan reads a large table sequentially.
+    Page counts are skipped: an unfiltered count has to read
+    the whole table and the paginator caches it.
+    Caches and replicas are disabled and all changes, including
+    the optional seeded data, are rolled back at the end.
+    """
+    help = 'Check the query plans of the API endpoints.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed', type=int, default=0, metavar='RECIPES',
+            help='Seed this many synthetic recipes (and related rows) '
+                 'before the check.'
+        )
+        parser.add_argument(
+            '--max-rows', type=int, default=1000,
+            help='Tables and loop inputs up to this size are not reported.'
+        )
+
+    def handle(self, *args, **options):
+        self.max_rows = options['max_rows']
+        self.table_rows = {}
+        with override_settings(
+            CACHES=NO_CACHES, REPLICA_DATABASES=[]
+        ), transaction.atomic():
+            if options['seed']:
+                seed_database(
+                    users=max(options['seed'] // 10, 10),
+                    recipes=options['seed'], seed=0
+                )
+            problems = self.check_endpoints(self.get_user())
+            transaction.set_rollback(True)
+        if problems:
+            raise CommandError(f'Problematic query plans: {problems}.')
+        self.stdout.write('No problematic query plans.')
+
+    @staticmethod
+    def get_user():
+        user = sample_user()
+        if user is None:
+            raise CommandError(
+                'No user has favorites and a shopping cart, use --seed.'
+            )
+        return user
+
+    def check_endpoints(self, user):
+        anonymous, client = APIClient(), APIClient()
+        client.force_authenticate(user)
+        checks = [('GET /api/recipes/ (anonymous)', anonymous, 'get',
+                   '/api/recipes/', None)] + [
+            (name, client, method, path, data)
+            for name, method, path, data in sample_requests(user)
+        ]
+        problems = 0
+        for name, requester, method, path, data in checks:
+            path, data = resolve(path), resolve(data)
+            with CaptureQueriesContext(connection) as context:
+                response = send(requester, method, path, data)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            self.stdout.write(
+                f'{name}: {response.status_code}, '
+                f'{len(context.captured_queries)} queries'
+            )
+            for query in context.captured_queries:
+                problems += self.check_query(query['sql'])
+        return problems
+
+    def check_query(self, sql):
+        if not sql.startswith('SELECT') or COUNT_QUERY.match(sql):
+            return 0
+        if connection.vendor == 'postgresql':
+            found = self.postgresql_problems(sql)
+        elif connection.vendor == 'sqlite':
+            found = self.sqlite_problems(sql)
+        else:
+            return 0
+        for problem in found:
+            self.stdout.write(f'  {problem}\n    {sql}')
+        return len(found)
+
+    def count_rows(self, table):
+        if table not in self.table_rows:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}'
+                )
+                self.table_rows[table] = cursor.fetchone()[0]
+        return self.table_rows[table]
+
+    def postgresql_problems(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        problems = []
+        nodes = [plan[0]['Plan']]
+        while nodes:
+            node = nodes.pop()
+            children = node.get('Plans', [])
+            nodes.extend(children)
+            table = node.get('Relation Name')
+            if (
+                node['Node Type'] == 'Seq Scan'
+                and self.count_rows(table) > self.max_rows
+            ):
+                problems.append(
+                    f'Seq Scan on {table} ({self.table_rows[table]} rows)'
+                )
+            if (
+                node['Node Type'] == 'Nested Loop'
+                and children[0]['Plan Rows'] > self.max_rows
+            ):
+                problems.append(
+                    f'Nested Loop over {children[0]["Plan Rows"]} rows'
+                )
+        return problems
+
+    def sqlite_problems(self, sql):
+        '''
+        SQLite joins only with nested loops, so only full scans
+        of large tables are reported.
+        '''
+        tables = {}
+        for table, alias in TABLE_ALIAS.findall(sql):
+            tables[table] = table
+            if alias:
+                tables[alias] = table
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            details = [row[3] for row in cursor.fetchall()]
+        problems = []
+        for detail in details:
+            match = SQLITE_SCAN.match(detail)
+            if not match:
+                continue
+            table = tables.get(match.group(2) or match.group(1))
+            if table and self.count_rows(table) > self.max_rows:
+                problems.append(
+                    f'{detail} ({self.table_rows[table]} rows in {table})'
+                )
+        return problems
@@ -0,0 +1,29 @@
+import time
+
+from api.replicas import refresh_replica_health
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """
+    Command that keeps the health of the read replicas in the shared
+    cache, so requests choose a replica without checking it.
+    """
+    help = 'Check the read replicas every REPLICA_CHECK_INTERVAL seconds.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Check the replicas once and exit.'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            health = refresh_replica_health()
+            if options['once']:
+                for alias, healthy in health.items():
+                    state = 'healthy' if healthy else 'unhealthy'
+                    self.stdout.write(f'{alias}: {state}.')
+                return
+            time.sleep(settings.REPLICA_CHECK_INTERVAL)
@@ -1,36 +1,53 @@
-import csv
-
-from django.core.management.base import BaseCommand
+from api.cache import ingredients_changed
+from api.importers import import_ingredients
+from api.search import rebuild_ingredient_index
+from api.services import BATCH_SIZE
+from django.core.management.base import BaseCommand, CommandError
 from recipes.models import Ingredient
 
 
 class Command(BaseCommand):
     """
     Command that imports ingredients into db from a data file.
+    Rows already in the table are left as they are, so the command
+    can be rerun with an updated catalog. On PostgreSQL the file
+    is loaded with COPY through a temporary table.
     """
-    help = 'Import data from csv-file.'
+    help = 'Import ingredients from a csv-file or a JSON fixture.'
 
     def add_arguments(self, parser):
         parser.add_argument('file_path', type=str)
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Delete all ingredients (and their recipe rows) first.'
+        )
+        parser.add_argument(
+            '--noinput', '--no-input', action='store_false',
+            dest='interactive',
+            help='Do not ask to confirm --clear.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Number of rows read and written at a time.'
+        )
 
     def handle(self, *args, **options):
-        answer = input(
-            'Do you want to clean up the Ingredients database? [Y/N]: '
-        ).lower()
-        if answer == 'y':
-            Ingredient.objects.all().delete()
-        elif answer == 'n':
-            self.stdout.write('The operation is skipped.')
-        else:
-            return 'Invalid value.'
-        with open(
-            options['file_path'], 'r', encoding='utf-8'
-        ) as csv_file:
-            reader = csv.DictReader(csv_file)
-            Ingredient.objects.bulk_create(
-                Ingredient(**data) for data in reader
-            )
-            self.stdout.write(
-                'Выполнен импорт данных для таблицы Ingredient.'
-            )
-        return 'Выполнен импорт данных для таблицы Ingredient.'
+        if options['clear']:
+            self.clear(options['interactive'])
+        report = import_ingredients(
+            options['file_path'], options['batch_size']
+        )
+        rebuild_ingredient_index()
+        ingredients_changed()
+        self.stdout.write(
+            f'Выполнен импорт данных для таблицы Ingredient. {report}'
+        )
+
+    def clear(self, interactive):
+        if interactive:
+            answer = input(
+                'Do you want to clean up the Ingredients database? [Y/N]: '
+            ).lower()
+            if answer != 'y':
+                raise CommandError('The operation is skipped.')
+        Ingredient.objects.all().delete()
@@ -0,0 +1,21 @@
+from api.importers import RecipeImporter
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """
+    Command that creates or updates recipes from a JSON fixture.
+    Tags and ingredients have to be imported first.
+    """
+    help = 'Import recipes from a JSON fixture.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file_path', type=str)
+
+    def handle(self, *args, **options):
+        report = RecipeImporter(options['file_path']).run()
+        for error in report.errors:
+            self.stderr.write(error)
+        self.stdout.write(
+            f'Выполнен импорт данных для таблицы Recipe. {report}'
+        )
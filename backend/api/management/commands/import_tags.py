@@ -0,0 +1,18 @@
+from api.importers import import_tags
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """
+    Command that creates or updates tags from a JSON fixture.
+    """
+    help = 'Import tags from a JSON fixture.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file_path', type=str)
+
+    def handle(self, *args, **options):
+        report = import_tags(options['file_path'])
+        for error in report.errors:
+            self.stderr.write(error)
+        self.stdout.write(f'Выполнен импорт данных для таблицы Tag. {report}')
@@ -0,0 +1,25 @@
+from api.tasks import run_worker
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """
+    Command that runs the local worker rendering recipe image variants.
+    """
+    help = 'Process queued recipe image jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Exit when the queue is empty.'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='Seconds to wait before polling an empty queue again.'
+        )
+
+    def handle(self, *args, **options):
+        processed = run_worker(
+            interval=options['interval'], once=options['once']
+        )
+        self.stdout.write(f'Processed jobs: {processed}.')
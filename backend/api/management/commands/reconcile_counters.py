@@ -0,0 +1,45 @@
+from api.services import BATCH_SIZE, COUNTERS, counted
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+
+class Command(BaseCommand):
+    """
+    Command that compares the denormalized counter columns
+    of recipes and users with the rows they count.
+    Meant to be run periodically, e.g. from cron.
+    """
+    help = 'Check (and optionally repair) the recipe and user counters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='Recount the rows whose counters have drifted.'
+        )
+
+    def handle(self, *args, **options):
+        mismatches = 0
+        for model, field, source, relation in COUNTERS:
+            drifted = model.objects.annotate(
+                actual=counted(source, relation)
+            ).exclude(**{field: F('actual')}).values_list(
+                'pk', field, 'actual'
+            ).order_by('pk')
+            pks = []
+            for pk, stored, actual in drifted.iterator():
+                pks.append(pk)
+                self.stdout.write(
+                    f'{model._meta.model_name}={pk} {field}: '
+                    f'expected {actual}, stored {stored}'
+                )
+            if pks and options['fix']:
+                self.repair(model, field, source, relation, pks)
+            mismatches += len(pks)
+        self.stdout.write(f'Mismatched counters: {mismatches}.')
+
+    @staticmethod
+    def repair(model, field, source, relation, pks):
+        for start in range(0, len(pks), BATCH_SIZE):
+            model.objects.filter(
+                pk__in=pks[start:start + BATCH_SIZE]
+            ).update(**{field: counted(source, relation)})
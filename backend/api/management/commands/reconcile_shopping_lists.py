@@ -0,0 +1,81 @@
+from api.services import BATCH_SIZE, live_shopping_list
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    """
+    Command that checks the materialized shopping lists
+    against the live aggregate over users' carts.
+    Both are streamed in order and merged; with --fix the differences
+    are repaired in batches as they are found, so memory stays bounded.
+    """
+    help = 'Check (and optionally repair) the shopping list table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='Rewrite rows that differ from the live aggregate.'
+        )
+
+    def handle(self, *args, **options):
+        stored = ShoppingListItem.objects.filter(
+            amount__gt=0
+        ).values_list('user_id', 'ingredient_id', 'amount').order_by(
+            'user_id', 'ingredient_id'
+        )
+        mismatched, batch = 0, []
+        for key, expected, actual in self.compare(
+            live_shopping_list().iterator(), stored.iterator()
+        ):
+            mismatched += 1
+            self.stdout.write(
+                f'user={key[0]} ingredient={key[1]}: '
+                f'expected {expected}, stored {actual}'
+            )
+            if options['fix']:
+                batch.append((key, expected))
+                if len(batch) == BATCH_SIZE:
+                    self.repair(batch)
+                    batch = []
+        if batch:
+            self.repair(batch)
+        self.stdout.write(f'Mismatched rows: {mismatched}.')
+
+    @staticmethod
+    def compare(expected_rows, stored_rows):
+        '''
+        Merges two iterators of (user, ingredient, amount) sorted by
+        (user, ingredient) and yields ((user, ingredient), expected,
+        stored) for every difference.
+        '''
+        sentinel = (float('inf'), float('inf'), 0)
+        expected = next(expected_rows, sentinel)
+        stored = next(stored_rows, sentinel)
+        while expected is not sentinel or stored is not sentinel:
+            if expected[:2] == stored[:2]:
+                if expected[2] != stored[2]:
+                    yield expected[:2], expected[2], stored[2]
+                expected = next(expected_rows, sentinel)
+                stored = next(stored_rows, sentinel)
+            elif expected[:2] < stored[:2]:
+                yield expected[:2], expected[2], 0
+                expected = next(expected_rows, sentinel)
+            else:
+                yield stored[:2], 0, stored[2]
+                stored = next(stored_rows, sentinel)
+
+    @staticmethod
+    @transaction.atomic
+    def repair(mismatches):
+        for (user_id, ingredient_id), amount in mismatches:
+            if amount:
+                ShoppingListItem.objects.update_or_create(
+                    user_id=user_id, ingredient_id=ingredient_id,
+                    defaults={'amount': amount}
+                )
+            else:
+                ShoppingListItem.objects.filter(
+                    user_id=user_id, ingredient_id=ingredient_id
+                ).delete()
@@ -0,0 +1,67 @@
+import os
+
+from api.cache import ingredients_changed, recipes_changed, tags_changed
+from api.importers import import_ingredients
+from api.search import rebuild_ingredient_index
+from api.seed import seed_database
+from api.services import BATCH_SIZE
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    """
+    Command that fills the database with synthetic users, recipes,
+    favorites, carts and subscriptions for load testing.
+    Recipes are made of the ingredients of data/ingredients.csv,
+    which is imported first.
+    """
+    help = 'Seed the database with synthetic data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=7,
+            help='Average number of ingredients in a recipe.'
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Average number of favorites of a user.'
+        )
+        parser.add_argument(
+            '--carts', type=int, default=3,
+            help='Average number of recipes in a shopping cart.'
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=5,
+            help='Average number of subscriptions of a user.'
+        )
+        parser.add_argument(
+            '--ingredients-file',
+            default=os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv')
+        )
+        parser.add_argument(
+            '--seed', type=int, default=None,
+            help='Random seed, for a reproducible dataset.'
+        )
+
+    def handle(self, *args, **options):
+        report = import_ingredients(options['ingredients_file'], BATCH_SIZE)
+        rebuild_ingredient_index()
+        ingredients_changed()
+        self.stdout.write(f'Ingredients: {report}')
+        seed_database(
+            users=options['users'], recipes=options['recipes'],
+            ingredients=0, tags=options['tags'],
+            per_recipe=options['ingredients_per_recipe'],
+            favorites=options['favorites'], carts=options['carts'],
+            subscriptions=options['subscriptions'], seed=options['seed']
+        )
+        tags_changed()
+        recipes_changed()
+        self.stdout.write(
+            f'Added {options["users"]} users and '
+            f'{options["recipes"]} recipes.'
+        )
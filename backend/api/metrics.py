@@ -0,0 +1,379 @@
+import fcntl
+import hmac
+import ipaddress
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from backend.db.pool import GAUGES, pool_stats
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+PHASES = ('connect', 'db', 'serialize', 'decode', 'hash', 'view')
+LABEL_SEPARATOR = '\t'
+UNMATCHED_ROUTE = '<unmatched>'
+FILE_NAME = re.compile(r'^metrics-(\d+)(?:-[0-9a-f]+)?\.json$')
+ARCHIVE_NAME = 'archive.json'
+LOCK_NAME = 'archive.lock'
+
+_local = threading.local()
+
+
+class RequestTimings:
+    '''Time spent by a request in each phase, in seconds.'''
+
+    def __init__(self):
+        self.phases = defaultdict(float)
+        self.queries = 0
+        self.active = set()
+        self.view_started = None
+
+
+def current_timings():
+    return getattr(_local, 'timings', None)
+
+
+@contextmanager
+def request_timings():
+    '''Collects the timings of the request handled by this thread.'''
+    _local.timings = RequestTimings()
+    try:
+        yield _local.timings
+    finally:
+        _local.timings = None
+
+
+@contextmanager
+def timed(phase):
+    '''
+    Adds the time spent in the block to a phase of the current request.
+    A block nested in a block of the same phase is not counted twice.
+    Outside of a request the block runs untimed.
+    '''
+    timings = current_timings()
+    if timings is None or phase in timings.active:
+        yield
+        return
+    timings.active.add(phase)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.phases[phase] += time.perf_counter() - start
+        timings.active.discard(phase)
+
+
+def time_query(execute, sql, params, many, context):
+    '''Database execute wrapper counting and timing the queries.'''
+    timings = current_timings()
+    if timings is not None:
+        timings.queries += 1
+    with timed('db'):
+        return execute(sql, params, many, context)
+
+
+class TimedRepresentationMixin:
+    '''Counts the output of a serializer in the "serialize" phase.'''
+
+    def to_representation(self, instance):
+        with timed('serialize'):
+            return super().to_representation(instance)
+
+
+def server_timing(timings, total):
+    '''Value of the Server-Timing header, durations in milliseconds.'''
+    metrics = []
+    for phase in PHASES:
+        if phase not in timings.phases:
+            continue
+        metric = f'{phase};dur={timings.phases[phase] * 1000:.1f}'
+        if phase == 'db':
+            metric += f';desc="{timings.queries} queries"'
+        metrics.append(metric)
+    metrics.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(metrics)
+
+
+def metrics_allowed(request):
+    '''
+    The metrics are readable from the loopback interface, or with
+    "Authorization: Bearer <METRICS_TOKEN>" when the token is set.
+    '''
+    try:
+        if ipaddress.ip_address(request.META.get('REMOTE_ADDR')).is_loopback:
+            return True
+    except ValueError:
+        pass
+    token = settings.METRICS_TOKEN
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and hmac.compare_digest(
+        header.encode(), f'Bearer {token}'.encode()
+    )
+
+
+def empty_samples():
+    return {
+        'requests': {}, 'duration': {}, 'phases': {}, 'queries': {},
+        'pools': {},
+    }
+
+
+def pool_samples():
+    return {
+        LABEL_SEPARATOR.join((alias, name)): value
+        for alias, stats in pool_stats().items()
+        for name, value in stats.items()
+    }
+
+
+def without_gauges(pools):
+    return {
+        key: value for key, value in pools.items()
+        if key.split(LABEL_SEPARATOR)[1] not in GAUGES
+    }
+
+
+def process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def read_samples(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def write_atomically(path, data):
+    descriptor, temporary = tempfile.mkstemp(
+        dir=os.path.dirname(path), suffix='.tmp'
+    )
+    with os.fdopen(descriptor, 'w') as file:
+        file.write(data)
+    os.replace(temporary, path)
+
+
+def merge_samples(total, samples):
+    '''Adds "samples" to "total": sums counters and histogram buckets.'''
+    for name, values in samples.items():
+        merged = total.setdefault(name, {})
+        for key, value in values.items():
+            if isinstance(value, list):
+                previous = merged.get(key, [0] * len(value))
+                merged[key] = [a + b for a, b in zip(previous, value)]
+            else:
+                merged[key] = merged.get(key, 0) + value
+    return total
+
+
+class MetricsRegistry:
+    '''
+    Per-route request metrics of this process. Gunicorn workers do not
+    share memory, so every process writes its totals to its own file
+    in METRICS_DIR, at most once per METRICS_FLUSH_INTERVAL seconds,
+    and the /metrics endpoint sums the files of all processes.
+    Files are replaced atomically, so a reader never sees a partial one.
+    File names carry a random token next to the process id, so a new
+    process reusing the id of an exited one does not overwrite its file.
+    The files of exited processes are folded into the archive file
+    (without their connection pool gauges) and removed, so counters
+    never go down and the directory does not grow.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = empty_samples()
+        self.flushed = 0
+        self.pid = self.token = None
+
+    def observe(self, route, method, status, duration, timings):
+        key = LABEL_SEPARATOR.join((route, method))
+        bucket = len(DURATION_BUCKETS)
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if duration <= bound:
+                bucket = index
+                break
+        with self.lock:
+            requests = self.samples['requests']
+            status_key = LABEL_SEPARATOR.join((key, str(status)))
+            requests[status_key] = requests.get(status_key, 0) + 1
+            histogram = self.samples['duration'].setdefault(
+                key, [0] * (len(DURATION_BUCKETS) + 3)
+            )
+            histogram[bucket] += 1
+            histogram[-2] += duration
+            histogram[-1] += 1
+            phases = self.samples['phases']
+            for phase, seconds in timings.phases.items():
+                phase_key = LABEL_SEPARATOR.join((key, phase))
+                phases[phase_key] = phases.get(phase_key, 0) + seconds
+            queries = self.samples['queries']
+            queries[key] = queries.get(key, 0) + timings.queries
+        if time.monotonic() - self.flushed >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def file_name(self):
+        pid = os.getpid()
+        if self.pid != pid:
+            self.pid, self.token = pid, uuid.uuid4().hex[:8]
+        return f'metrics-{pid}-{self.token}.json'
+
+    def flush(self):
+        with self.lock:
+            data = json.dumps(dict(self.samples, pools=pool_samples()))
+            self.flushed = time.monotonic()
+            name = self.file_name()
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        write_atomically(os.path.join(settings.METRICS_DIR, name), data)
+
+    def collect(self):
+        '''Returns the samples of all processes.'''
+        self.flush()
+        self.archive_exited()
+        total = empty_samples()
+        names = [ARCHIVE_NAME] + [
+            name for name in sorted(os.listdir(settings.METRICS_DIR))
+            if FILE_NAME.match(name)
+        ]
+        for name in names:
+            samples = read_samples(os.path.join(settings.METRICS_DIR, name))
+            if samples is not None:
+                merge_samples(total, samples)
+        return total
+
+    def archive_exited(self):
+        '''
+        Adds the files of exited processes to the archive file and
+        removes them. Runs under a file lock, so concurrent collectors
+        do not archive a file twice.
+        '''
+        directory = settings.METRICS_DIR
+        with open(os.path.join(directory, LOCK_NAME), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            exited = [
+                name for name in sorted(os.listdir(directory))
+                if FILE_NAME.match(name)
+                and not process_exists(int(FILE_NAME.match(name).group(1)))
+            ]
+            if not exited:
+                return
+            archive_path = os.path.join(directory, ARCHIVE_NAME)
+            archive = read_samples(archive_path) or empty_samples()
+            for name in exited:
+                samples = read_samples(os.path.join(directory, name))
+                if samples is not None:
+                    samples['pools'] = without_gauges(
+                        samples.get('pools', {})
+                    )
+                    merge_samples(archive, samples)
+            write_atomically(archive_path, json.dumps(archive))
+            for name in exited:
+                os.remove(os.path.join(directory, name))
+
+
+registry = MetricsRegistry()
+
+
+def escape_label(value):
+    return (
+        value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    )
+
+
+def labels(names, key):
+    return ','.join(
+        f'{name}="{escape_label(value)}"'
+        for name, value in zip(names, key.split(LABEL_SEPARATOR))
+    )
+
+
+def render_histogram(name, histogram, label):
+    lines = []
+    count = 0
+    for bound, observed in zip(DURATION_BUCKETS, histogram):
+        count += observed
+        lines.append(f'{name}_bucket{{{label},le="{bound}"}} {count}')
+    lines += [
+        f'{name}_bucket{{{label},le="+Inf"}} {histogram[-1]}',
+        f'{name}_sum{{{label}}} {histogram[-2]}',
+        f'{name}_count{{{label}}} {histogram[-1]}',
+    ]
+    return lines
+
+
+def render_metrics(samples):
+    '''Formats the samples in the Prometheus text exposition format.'''
+    route = ('route', 'method')
+    lines = [
+        '# HELP http_requests_total Requests by route, method and status.',
+        '# TYPE http_requests_total counter',
+    ]
+    for key, value in sorted(samples['requests'].items()):
+        lines.append(
+            f'http_requests_total{{{labels(route + ("status",), key)}}} '
+            f'{value}'
+        )
+    lines += [
+        '# HELP http_request_duration_seconds Request duration by route.',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    for key, histogram in sorted(samples['duration'].items()):
+        lines += render_histogram(
+            'http_request_duration_seconds', histogram, labels(route, key)
+        )
+    lines += [
+        '# HELP http_request_phase_seconds_total Time spent in each phase '
+        'of the requests (connect, db, serialize, decode, hash, view).',
+        '# TYPE http_request_phase_seconds_total counter',
+    ]
+    for key, value in sorted(samples['phases'].items()):
+        lines.append(
+            'http_request_phase_seconds_total'
+            f'{{{labels(route + ("phase",), key)}}} {value}'
+        )
+    lines += [
+        '# HELP http_request_queries_total Database queries by route.',
+        '# TYPE http_request_queries_total counter',
+    ]
+    for key, value in sorted(samples['queries'].items()):
+        lines.append(
+            f'http_request_queries_total{{{labels(route, key)}}} {value}'
+        )
+    lines += render_pools(samples['pools'])
+    return '\n'.join(lines) + '\n'
+
+
+def render_pools(pools):
+    '''Connection pool gauges and counters, by database alias.'''
+    lines = []
+    by_name = {}
+    for key, value in pools.items():
+        alias, name = key.split(LABEL_SEPARATOR)
+        by_name.setdefault(name, []).append((alias, value))
+    for name, values in sorted(by_name.items()):
+        if name in GAUGES:
+            metric, kind = f'db_pool_{name}', 'gauge'
+        else:
+            metric, kind = f'db_pool_{name}_total', 'counter'
+        lines.append(f'# TYPE {metric} {kind}')
+        lines += [
+            f'{metric}{{database="{escape_label(alias)}"}} {value}'
+            for alias, value in sorted(values)
+        ]
+    return lines
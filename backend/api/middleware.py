@@ -0,0 +1,95 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .metrics import (UNMATCHED_ROUTE, current_timings, registry,
+                      request_timings, server_timing, time_query)
+from .queries import QueryInspection
+
+
+class ServerTimingMiddleware:
+    '''
+    Times the database queries, serialization, image decoding,
+    password hashing and the view of every request. The durations are
+    added to the per-route metrics served at /metrics and sent in the
+    Server-Timing header to staff users, or to everyone with the
+    SERVER_TIMING setting. Must come first in MIDDLEWARE,
+    so "total" covers the other middleware too.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with request_timings() as timings, ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(time_query))
+            response = self.get_response(request)
+        end = time.perf_counter()
+        if timings.view_started is not None:
+            timings.phases['view'] = end - timings.view_started
+        total = end - start
+        user = getattr(request, 'user', None)
+        if settings.SERVER_TIMING or getattr(user, 'is_staff', False):
+            response['Server-Timing'] = server_timing(timings, total)
+        match = request.resolver_match
+        registry.observe(
+            match.view_name if match else UNMATCHED_ROUTE,
+            request.method, response.status_code, total, timings
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        current_timings().view_started = time.perf_counter()
+
+
+def inspected_stream(content, inspection):
+    '''
+    Streams the content with the inspection active again, since
+    the queries of a streaming response run while it is consumed,
+    and checks the budget at the end.
+    '''
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(inspection))
+        yield from content
+    inspection.check_budget()
+
+
+class QueryInspectionMiddleware:
+    '''
+    Development and test aid, enabled by the QUERY_INSPECTION setting
+    ("collect", "log" or "raise"): detects repeated queries and checks
+    the query_budget of the view (see QueryInspection). The inspection
+    is kept as request.query_inspection; for a streaming response it
+    ends when the content is consumed.
+    '''
+
+    def __init__(self, get_response):
+        if not settings.QUERY_INSPECTION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        inspection = QueryInspection(
+            settings.QUERY_INSPECTION, f'{request.method} {request.path}'
+        )
+        request.query_inspection = inspection
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(inspection))
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = inspected_stream(
+                response.streaming_content, inspection
+            )
+        else:
+            inspection.check_budget()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_inspection.start_view(view_func, request.method)
@@ -1,5 +1,167 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.utils.urls import replace_query_param
+
+COUNT_KEY = 'page-count:{}'
+
+
+class CachedCountPaginator(Paginator):
+    '''
+    Paginator that keeps the total count of a filtered queryset
+    in the cache for PAGE_COUNT_CACHE_TIMEOUT seconds,
+    keyed by the SQL of the query.
+    '''
+
+    @cached_property
+    def count(self):
+        try:
+            sql = str(self.object_list.query)
+        except (AttributeError, EmptyResultSet):
+            return super().count
+        key = COUNT_KEY.format(hashlib.sha256(sql.encode()).hexdigest())
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, settings.PAGE_COUNT_CACHE_TIMEOUT)
+        return count
+
+
+class KeysetPagination(CursorPagination):
+    '''
+    Cursor pagination over a composite ordering.
+    The cursor holds the ordering values of the last (or first) row
+    of the page, so a page is read with a single range scan
+    of the matching index, without OFFSET or COUNT.
+    '''
+    page_size_query_param = 'limit'
+
+    def __init__(self, ordering):
+        self.ordering = ordering
+
+    @staticmethod
+    def reverse_field(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def after(ordering, values):
+        '''Rows that follow "values" in the given ordering.'''
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        values, reverse = self.decode_keyset(request)
+        ordering = self.ordering
+        if reverse:
+            ordering = [self.reverse_field(field) for field in ordering]
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self.after(ordering, values))
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = values is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, values is not None
+        return self.page
+
+    def decode_keyset(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            values, reverse = cursor['v'], bool(cursor['r'])
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def encode_keyset(self, row, reverse):
+        values = []
+        for field in self.ordering:
+            value = getattr(row, field.lstrip('-'))
+            values.append(
+                value.isoformat() if hasattr(value, 'isoformat') else value
+            )
+        cursor = json.dumps({'v': values, 'r': int(reverse)})
+        return replace_query_param(
+            self.base_url, self.cursor_query_param,
+            base64.urlsafe_b64encode(cursor.encode()).decode()
+        )
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_keyset(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_keyset(self.page[0], reverse=True)
 
 
 class PageLimitPagination(PageNumberPagination):
+    '''
+    Page number pagination with cached total counts.
+    Subclasses that set "keyset_ordering" switch to KeysetPagination
+    when the request has a "cursor" parameter (empty for the first page),
+    unless it has one of "page_ordered_params", which order
+    the results differently.
+    '''
     page_size_query_param = 'limit'
+    django_paginator_class = CachedCountPaginator
+    keyset_ordering = None
+    page_ordered_params = ()
+    keyset = None
+
+    def uses_keyset(self, request):
+        params = request.query_params
+        return (
+            self.keyset_ordering is not None
+            and KeysetPagination.cursor_query_param in params
+            and not any(params.get(name) for name in self.page_ordered_params)
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.uses_keyset(request):
+            self.keyset = KeysetPagination(self.keyset_ordering)
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class RecipePagination(PageLimitPagination):
+    keyset_ordering = ('-pub_date', '-id')
+    page_ordered_params = ('search',)
+
+
+class UserPagination(PageLimitPagination):
+    keyset_ordering = ('username', 'id')
@@ -0,0 +1,222 @@
+import hashlib
+import logging
+import zlib
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .truetype import load_font
+
+logger = logging.getLogger(__name__)
+
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+MARGIN = 50
+FONT_SIZE = 12
+LEADING = 16
+LINES_PER_PAGE = (PAGE_HEIGHT - 2 * MARGIN) // LEADING
+FONT_NAME = 'DejaVuSans'
+TO_UNICODE_HEADER = (
+    '/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n'
+    '/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> '
+    'def\n/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n'
+    '1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n'
+)
+TO_UNICODE_FOOTER = (
+    'endcmap\nCMapName currentdict /CMap defineresource pop\nend\nend'
+)
+
+
+class FontUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'PDF export is unavailable.'
+    default_code = 'font_unavailable'
+
+
+def pdf_font():
+    '''
+    Loads the font of settings.PDF_FONT_PATH. Called before the
+    response is created, so a missing or broken font is answered
+    with 503 instead of a truncated document.
+    '''
+    try:
+        return load_font(settings.PDF_FONT_PATH)
+    except (OSError, ValueError) as error:
+        logger.error('Cannot load the PDF font: %s', error)
+        raise FontUnavailable from error
+
+
+def utf16_hex(char):
+    return char.encode('utf-16-be').hex().upper()
+
+
+def cmap_entries(glyphs):
+    '''"bfchar" sections of a ToUnicode CMap, at most 100 entries each.'''
+    items = sorted(glyphs.items())
+    for start in range(0, len(items), 100):
+        block = items[start:start + 100]
+        yield f'{len(block)} beginbfchar\n'
+        for glyph, char in block:
+            yield f'<{glyph:04X}> <{utf16_hex(char)}>\n'
+        yield 'endbfchar\n'
+
+
+class PDFStream:
+    '''
+    Writes a text-only PDF document object by object,
+    so only the byte offsets of written objects and the ids of
+    the glyphs used are kept in memory. The text is set in
+    the given TrueType font; the subset of it with the glyphs
+    used is embedded, so any viewer shows Cyrillic.
+    The page tree and the font are written last and reserved as
+    objects 2 and 3.
+    '''
+
+    def __init__(self, font):
+        self.offsets = {}
+        self.position = 0
+        self.pages = []
+        self.next_id = 4
+        self.font = font
+        self.glyphs = {}
+        self.missing = self.font.glyph('?')
+
+    def chunk(self, data):
+        self.position += len(data)
+        return data
+
+    def write_object(self, object_id, body):
+        self.offsets[object_id] = self.position
+        return self.chunk(
+            f'{object_id} 0 obj\n'.encode('ascii') + body + b'\nendobj\n'
+        )
+
+    def allocate(self):
+        self.next_id += 1
+        return self.next_id - 1
+
+    def header(self):
+        yield self.chunk(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        yield self.write_object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+
+    def encode_text(self, text):
+        '''
+        Encodes text as a PDF hex string of glyph ids.
+        Characters the font cannot show are replaced with "?".
+        '''
+        encoded = []
+        for char in text:
+            glyph = self.font.glyph(char)
+            if glyph:
+                self.glyphs.setdefault(glyph, char)
+            else:
+                glyph = self.missing
+                self.glyphs.setdefault(glyph, '?')
+            encoded.append(f'{glyph:04X}')
+        return f'<{"".join(encoded)}>'.encode('ascii')
+
+    def page(self, lines):
+        content = [
+            b'BT',
+            f'/F1 {FONT_SIZE} Tf {LEADING} TL'.encode('ascii'),
+            f'{MARGIN} {PAGE_HEIGHT - MARGIN} Td'.encode('ascii'),
+        ]
+        for line in lines:
+            content.append(self.encode_text(line) + b' Tj T*')
+        content.append(b'ET')
+        content = b'\n'.join(content)
+        content_id, page_id = self.allocate(), self.allocate()
+        self.pages.append(page_id)
+        yield self.write_object(
+            content_id,
+            f'<< /Length {len(content)} >>\nstream\n'.encode('ascii')
+            + content + b'\nendstream'
+        )
+        yield self.write_object(page_id, (
+            '<< /Type /Page /Parent 2 0 R '
+            f'/MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] '
+            f'/Contents {content_id} 0 R '
+            '/Resources << /Font << /F1 3 0 R >> >> >>'
+        ).encode('ascii'))
+
+    def stream_object(self, object_id, data, extra=''):
+        data = zlib.compress(data)
+        return self.write_object(object_id, (
+            f'<< /Length {len(data)} /Filter /FlateDecode{extra} >>\n'
+            'stream\n'
+        ).encode('ascii') + data + b'\nendstream')
+
+    def font_objects(self):
+        font = self.font
+        tag = ''.join(
+            chr(ord('A') + byte % 26) for byte in hashlib.sha256(
+                repr(sorted(self.glyphs)).encode('ascii')
+            ).digest()[:6]
+        )
+        name = f'/{tag}+{FONT_NAME}'
+        cid_font, descriptor, file_id, to_unicode = (
+            self.allocate() for _ in range(4)
+        )
+        widths = ' '.join(
+            f'{glyph} [{font.width(glyph)}]' for glyph in sorted(self.glyphs)
+        )
+        yield self.write_object(3, (
+            f'<< /Type /Font /Subtype /Type0 /BaseFont {name} '
+            f'/Encoding /Identity-H /DescendantFonts [{cid_font} 0 R] '
+            f'/ToUnicode {to_unicode} 0 R >>'
+        ).encode('ascii'))
+        yield self.write_object(cid_font, (
+            f'<< /Type /Font /Subtype /CIDFontType2 /BaseFont {name} '
+            '/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) '
+            f'/Supplement 0 >> /FontDescriptor {descriptor} 0 R '
+            f'/CIDToGIDMap /Identity /W [{widths}] >>'
+        ).encode('ascii'))
+        bbox = ' '.join(str(font.scale(value)) for value in font.bbox)
+        yield self.write_object(descriptor, (
+            f'<< /Type /FontDescriptor /FontName {name} /Flags 32 '
+            f'/FontBBox [{bbox}] /ItalicAngle 0 '
+            f'/Ascent {font.scale(font.ascent)} '
+            f'/Descent {font.scale(font.descent)} '
+            f'/CapHeight {font.scale(font.ascent)} /StemV 80 '
+            f'/FontFile2 {file_id} 0 R >>'
+        ).encode('ascii'))
+        subset = font.subset(self.glyphs)
+        yield self.stream_object(
+            file_id, subset, f' /Length1 {len(subset)}'
+        )
+        yield self.stream_object(to_unicode, ''.join((
+            TO_UNICODE_HEADER, *cmap_entries(self.glyphs), TO_UNICODE_FOOTER
+        )).encode('ascii'))
+
+    def trailer(self):
+        yield from self.font_objects()
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self.pages)
+        yield self.write_object(2, (
+            f'<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>'
+        ).encode('ascii'))
+        xref_position = self.position
+        size = self.next_id
+        xref = [f'xref\n0 {size}\n0000000000 65535 f \n']
+        for object_id in range(1, size):
+            xref.append(f'{self.offsets[object_id]:010d} 00000 n \n')
+        xref.append(
+            f'trailer\n<< /Size {size} /Root 1 0 R >>\n'
+            f'startxref\n{xref_position}\n%%EOF\n'
+        )
+        yield self.chunk(''.join(xref).encode('ascii'))
+
+
+def stream_pdf(lines, font):
+    '''Yields a PDF document with the given lines of text, page by page.'''
+    document = PDFStream(font)
+    yield from document.header()
+    page = []
+    for line in lines:
+        page.append(line)
+        if len(page) == LINES_PER_PAGE:
+            yield from document.page(page)
+            page = []
+    if page or not document.pages:
+        yield from document.page(page)
+    yield from document.trailer()
@@ -0,0 +1,142 @@
+import logging
+import os
+import re
+import sys
+from collections import Counter
+
+from django.conf import settings
+from rest_framework.fields import Field
+
+logger = logging.getLogger(__name__)
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+WHITESPACE = re.compile(r'\s+')
+INTERNAL_FILES = tuple(
+    os.path.join(os.path.dirname(__file__), name)
+    for name in ('queries.py', 'metrics.py', 'middleware.py')
+)
+
+
+class RepeatedQueryError(Exception):
+    '''The same query ran more than QUERY_REPEAT_LIMIT times.'''
+
+
+class QueryBudgetError(Exception):
+    '''A view ran more queries than its query_budget allows.'''
+
+
+def fingerprint(sql):
+    '''
+    Normalizes a query, so that the queries differing only in
+    their parameters, literals or IN list lengths compare equal.
+    '''
+    sql = STRING_LITERAL.sub('?', sql)
+    sql = NUMBER_LITERAL.sub('?', sql.replace('%s', '?'))
+    sql = PLACEHOLDER_LIST.sub('(...)', sql)
+    return WHITESPACE.sub(' ', sql).strip()
+
+
+def serializer_field(frame):
+    '''"Serializer.field" rendered by a Serializer.to_representation frame.'''
+    local = frame.f_locals
+    if (
+        frame.f_code.co_name != 'to_representation'
+        or not isinstance(local.get('field'), Field)
+    ):
+        return None
+    return f'{type(local["self"]).__name__}.{local["field"].field_name}'
+
+
+def project_location(frame):
+    '''"path:line in function" of a frame running the project code.'''
+    filename = frame.f_code.co_filename
+    if (
+        not filename.startswith(settings.BASE_DIR)
+        or filename in INTERNAL_FILES
+    ):
+        return None
+    path = os.path.relpath(filename, settings.BASE_DIR)
+    return f'{path}:{frame.f_lineno} in {frame.f_code.co_name}'
+
+
+def query_origin():
+    '''
+    Describes the code running the current query: the innermost
+    serializer field being rendered, if any, and the innermost
+    line of the project code.
+    '''
+    field = location = None
+    frame = sys._getframe(1)
+    while frame is not None and (field is None or location is None):
+        field = field or serializer_field(frame)
+        location = location or project_location(frame)
+        frame = frame.f_back
+    parts = [f'field {field}'] if field else []
+    if location:
+        parts.append(location)
+    return ', '.join(parts) or 'unknown code'
+
+
+def query_budget(view_func, method):
+    '''
+    Returns the query_budget declared by the view class, either
+    a number or a dict by viewset action, or None.
+    '''
+    view_class = getattr(view_func, 'cls', None)
+    budget = getattr(view_class, 'query_budget', None)
+    if not isinstance(budget, dict):
+        return budget
+    actions = getattr(view_func, 'actions', None) or {}
+    return budget.get(actions.get(method.lower()))
+
+
+class QueryInspection:
+    '''
+    Queries of one request. In the "raise" mode of QUERY_INSPECTION
+    a SELECT repeated more than QUERY_REPEAT_LIMIT times raises
+    RepeatedQueryError from the code running it, in the "log" mode
+    it is logged once per request; "collect" only records the problems.
+    '''
+
+    def __init__(self, mode, path):
+        self.mode = mode
+        self.path = path
+        self.count = 0
+        self.repeats = Counter()
+        self.problems = []
+        self.budget = None
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        if sql.lstrip()[:6].upper() == 'SELECT':
+            key = fingerprint(sql)
+            self.repeats[key] += 1
+            if self.repeats[key] == settings.QUERY_REPEAT_LIMIT + 1:
+                self.report(
+                    RepeatedQueryError,
+                    f'{self.path}: query repeated more than '
+                    f'{settings.QUERY_REPEAT_LIMIT} times, from '
+                    f'{query_origin()}: {key}'
+                )
+        return execute(sql, params, many, context)
+
+    def start_view(self, view_func, method):
+        self.budget = query_budget(view_func, method)
+
+    def check_budget(self):
+        if self.budget is not None and self.count > self.budget:
+            self.report(
+                QueryBudgetError,
+                f'{self.path}: {self.count} queries, '
+                f'the budget is {self.budget}.'
+            )
+
+    def report(self, error, message):
+        '''Only the first problem raises, so it is not masked by others.'''
+        self.problems.append(message)
+        if self.mode == 'raise' and len(self.problems) == 1:
+            raise error(message)
+        if self.mode == 'log':
+            logger.warning(message)
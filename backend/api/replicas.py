@@ -0,0 +1,162 @@
+import logging
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+PIN_KEY = 'replica:pinned:{}'
+HEALTH_KEY = 'replica:healthy:{}'
+POSTGRESQL_LAG = '''
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (
+            SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming'
+        ) THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+'''
+
+_state = threading.local()
+
+
+def read_alias():
+    return getattr(_state, 'read_alias', None)
+
+
+@contextmanager
+def read_from_primary():
+    '''
+    Sends the reads of the block to the primary. Used where the result
+    outlives the request, such as cached payloads: a lagging replica
+    must not put stale data under a fresh cache version.
+    '''
+    previous = read_alias()
+    _state.read_alias = None
+    try:
+        yield
+    finally:
+        _state.read_alias = previous
+
+
+def replica_lag(alias):
+    '''
+    Seconds the replica is behind the primary; infinite if it does not
+    stream WAL from the primary, since replaying all it has received
+    says nothing about what it missed. 0 if not measurable.
+    '''
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(POSTGRESQL_LAG)
+            lag = cursor.fetchone()[0]
+            return float('inf') if lag is None else float(lag)
+        cursor.execute('SELECT 1 FROM django_migrations LIMIT 1')
+    return 0
+
+
+def check_replica(alias):
+    '''
+    Whether the replica answers and lags at most REPLICA_MAX_LAG seconds.
+    '''
+    try:
+        lag = replica_lag(alias)
+    except DatabaseError as error:
+        logger.warning('Replica %s is unavailable: %s', alias, error)
+        return False
+    if lag > settings.REPLICA_MAX_LAG:
+        logger.warning('Replica %s lags by %.1f seconds.', alias, lag)
+        return False
+    return True
+
+
+def refresh_replica_health():
+    '''
+    Checks every replica and stores the result in the default cache,
+    shared by all processes, for REPLICA_HEALTH_TTL seconds. Runs
+    outside the requests, in the check_replicas command.
+    '''
+    health = {}
+    for alias in settings.REPLICA_DATABASES:
+        health[alias] = check_replica(alias)
+    cache.set_many(
+        {HEALTH_KEY.format(alias): healthy
+         for alias, healthy in health.items()},
+        settings.REPLICA_HEALTH_TTL
+    )
+    return health
+
+
+def choose_replica(user):
+    '''
+    Picks a healthy replica for the reads of the user, or None
+    for the primary while the user is pinned to it after a write.
+    Only the results stored by refresh_replica_health are read:
+    a replica nobody checked lately is not used.
+    '''
+    if not settings.REPLICA_DATABASES:
+        return None
+    if user.is_authenticated and cache.get(PIN_KEY.format(user.pk)):
+        return None
+    health = cache.get_many(
+        [HEALTH_KEY.format(alias) for alias in settings.REPLICA_DATABASES]
+    )
+    replicas = [
+        alias for alias in settings.REPLICA_DATABASES
+        if health.get(HEALTH_KEY.format(alias))
+    ]
+    return random.choice(replicas) if replicas else None
+
+
+class ReplicaReadMixin:
+    '''
+    Serves the reads of safe requests from a replica. After a request
+    that wrote to the database the user's reads stay on the primary
+    for REPLICA_PIN_SECONDS, so they see their own changes.
+    Authentication runs before the switch, on the primary.
+    '''
+
+    def dispatch(self, request, *args, **kwargs):
+        _state.read_alias = None
+        _state.wrote = False
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            if _state.wrote and self.request.user.is_authenticated:
+                cache.set(
+                    PIN_KEY.format(self.request.user.pk), True,
+                    settings.REPLICA_PIN_SECONDS
+                )
+            _state.read_alias = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            _state.read_alias = choose_replica(request.user)
+
+
+class ReplicaRouter:
+    '''
+    Routes reads to the replica chosen by ReplicaReadMixin for the
+    current request, all other queries to the primary. Replicas hold
+    copies of the primary, so they are never migrated.
+    '''
+
+    def db_for_read(self, model, **hints):
+        return read_alias() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,291 @@
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from recipes.models import Ingredient
+
+from .replicas import read_from_primary
+
+MAGIC = b'FGII'
+VERSION = 1
+HEADER = struct.Struct('<4sIIII')
+SIMILARITY_THRESHOLD = 0.3
+SEPARATOR = '\x00'
+
+_lock = threading.Lock()
+_mapped = {}
+
+
+def normalize(value):
+    return ' '.join(value.casefold().split())
+
+
+def trigrams(value, padded=True):
+    '''
+    Returns the set of trigrams of a normalized string.
+    Padded trigrams follow pg_trgm: two spaces in front, one behind.
+    '''
+    if padded:
+        value = f'  {value} '
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+def trigram_key(trigram):
+    '''Packs three code points (21 bits each) into one integer.'''
+    trigram = trigram.ljust(3)
+    return (
+        ord(trigram[0]) << 42 | ord(trigram[1]) << 21 | ord(trigram[2])
+    )
+
+
+def _pad(buffer):
+    buffer.extend(b'\x00' * (-len(buffer) % 8))
+
+
+def build_index(rows, path):
+    '''
+    Writes the index for (id, name, measurement_unit) rows to "path".
+
+    Layout after the header, every section aligned to 8 bytes:
+    ids, record offsets, record trigram counts, string blob,
+    sorted trigram keys, posting offsets and postings.
+    Entries are sorted by normalized name, so prefix lookups
+    are a binary search over the records.
+    '''
+    rows = sorted(rows, key=lambda row: (normalize(row[1]), row[0]))
+    ids = array('Q')
+    offsets = array('I', [0])
+    counts = array('I')
+    blob = bytearray()
+    postings = {}
+    for position, (pk, name, unit) in enumerate(rows):
+        ids.append(pk)
+        blob.extend(f'{name}{SEPARATOR}{unit}'.encode('utf-8'))
+        offsets.append(len(blob))
+        grams = trigrams(normalize(name))
+        counts.append(len(grams))
+        for gram in grams:
+            postings.setdefault(trigram_key(gram), array('I')).append(
+                position
+            )
+    keys = array('Q', sorted(postings))
+    starts = array('I', [0])
+    flat = array('I')
+    for key in keys:
+        flat.extend(postings[key])
+        starts.append(len(flat))
+
+    body = bytearray()
+    for section in (ids, offsets, counts):
+        body.extend(section.tobytes())
+        _pad(body)
+    body.extend(blob)
+    _pad(body)
+    for section in (keys, starts, flat):
+        body.extend(section.tobytes())
+        _pad(body)
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temp_path = tempfile.mkstemp(dir=directory)
+    with os.fdopen(descriptor, 'wb') as index_file:
+        index_file.write(HEADER.pack(
+            MAGIC, VERSION, len(ids), len(keys), len(blob)
+        ))
+        index_file.write(b'\x00' * (-HEADER.size % 8))
+        index_file.write(body)
+    os.replace(temp_path, path)
+
+
+class IngredientIndex:
+    '''
+    Read-only view over a memory-mapped index file.
+    The pages are shared by every process that maps the same file.
+    '''
+
+    def __init__(self, path):
+        with open(path, 'rb') as index_file:
+            self.stat = os.fstat(index_file.fileno())
+            self.mmap = mmap.mmap(
+                index_file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        magic, version, count, keys, blob_size = HEADER.unpack_from(
+            self.mmap
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not an ingredient index.')
+        self.count = count
+        view = memoryview(self.mmap)
+        position = HEADER.size + (-HEADER.size % 8)
+
+        def section(size, fmt=None):
+            nonlocal position
+            chunk = view[position:position + size]
+            position += size + (-size % 8)
+            return chunk.cast(fmt) if fmt else chunk
+
+        self.ids = section(count * 8, 'Q')
+        self.offsets = section((count + 1) * 4, 'I')
+        self.counts = section(count * 4, 'I')
+        self.blob = section(blob_size)
+        self.keys = section(keys * 8, 'Q')
+        self.starts = section((keys + 1) * 4, 'I')
+        self.postings = section(self.starts[keys] * 4 if keys else 0, 'I')
+
+    def is_stale(self, path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return True
+        return (stat.st_ino, stat.st_mtime_ns) != (
+            self.stat.st_ino, self.stat.st_mtime_ns
+        )
+
+    def record(self, position):
+        raw = bytes(
+            self.blob[self.offsets[position]:self.offsets[position + 1]]
+        )
+        name, unit = raw.decode('utf-8').split(SEPARATOR, 1)
+        return {
+            'id': self.ids[position],
+            'name': name,
+            'measurement_unit': unit
+        }
+
+    def key(self, position):
+        return self.record(position)['name']
+
+    def lower_bound(self, query):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if normalize(self.key(middle)) < query:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def posting(self, gram):
+        key = trigram_key(gram)
+        index = bisect_left(self.keys, key)
+        if index == len(self.keys) or self.keys[index] != key:
+            return ()
+        return self.postings[self.starts[index]:self.starts[index + 1]]
+
+    def prefix_matches(self, query):
+        exact, prefix = [], []
+        position = self.lower_bound(query)
+        while position < self.count:
+            name = normalize(self.key(position))
+            if not name.startswith(query):
+                break
+            (exact if name == query else prefix).append(position)
+            position += 1
+        return exact + prefix
+
+    def substring_matches(self, query, seen):
+        if len(query) < 3:
+            return []
+        candidates = None
+        for gram in trigrams(query, padded=False):
+            positions = set(self.posting(gram))
+            candidates = (
+                positions if candidates is None else candidates & positions
+            )
+            if not candidates:
+                return []
+        matches = []
+        for position in candidates - seen:
+            offset = normalize(self.key(position)).find(query)
+            if offset != -1:
+                matches.append((offset, position))
+        return [position for _, position in sorted(matches)]
+
+    def fuzzy_matches(self, query, seen):
+        grams = trigrams(query)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.posting(gram))
+        matches = []
+        for position, common in shared.items():
+            similarity = common / (len(grams) + self.counts[position] - common)
+            if position not in seen and similarity >= SIMILARITY_THRESHOLD:
+                matches.append((-similarity, position))
+        return [position for _, position in sorted(matches)]
+
+    def search(self, query, limit=None):
+        '''
+        Returns ingredients matching "query" ranked as
+        exact, prefix, substring and fuzzy (trigram) matches.
+        '''
+        query = normalize(query)
+        if not query:
+            ranked = range(self.count)
+        else:
+            ranked = self.prefix_matches(query)
+            for matcher in (self.substring_matches, self.fuzzy_matches):
+                if limit is not None and len(ranked) >= limit:
+                    break
+                ranked.extend(matcher(query, set(ranked)))
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [self.record(position) for position in ranked]
+
+
+def index_path():
+    return settings.INGREDIENT_INDEX_PATH
+
+
+def rebuild_ingredient_index():
+    '''Rebuilds the index file from the Ingredient table.'''
+    build_index(
+        Ingredient.objects.values_list('id', 'name', 'measurement_unit'),
+        index_path()
+    )
+
+
+def transaction_index():
+    '''
+    Returns an index of the ingredients seen by the current
+    transaction. It may be rolled back, so the index is built
+    in a private file that is removed once mapped.
+    '''
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'ingredients.idx')
+    try:
+        build_index(
+            Ingredient.objects.values_list('id', 'name', 'measurement_unit'),
+            path
+        )
+        return IngredientIndex(path)
+    finally:
+        os.remove(path)
+        os.rmdir(directory)
+
+
+def get_ingredient_index():
+    '''
+    Returns the index mapped by this process,
+    remapping it when another process has rebuilt the file.
+    A missing file is only written from committed data: inside
+    a transaction the index is built for the transaction alone.
+    '''
+    path = index_path()
+    if path in _mapped and not _mapped[path].is_stale(path):
+        return _mapped[path]
+    with _lock:
+        if path not in _mapped or _mapped[path].is_stale(path):
+            if not os.path.exists(path):
+                with read_from_primary():
+                    if not transaction.get_autocommit():
+                        return transaction_index()
+                    rebuild_ingredient_index()
+            _mapped[path] = IngredientIndex(path)
+        return _mapped[path]
@@ -0,0 +1,272 @@
+import random
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            RecipeTag, ShoppingCart, ShoppingListItem, Tag)
+from recipes.search import update_search_index
+from users.models import Subscription
+
+from .services import BATCH_SIZE, COUNTERS, counted
+
+User = get_user_model()
+
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.', 'по вкусу')
+WORDS = (
+    'борщ', 'суп', 'салат', 'пирог', 'каша', 'омлет', 'рагу', 'соус',
+    'курица', 'говядина', 'рыба', 'грибы', 'сыр', 'томаты', 'картофель',
+    'морковь', 'лук', 'чеснок', 'яблоки', 'творог', 'рис', 'гречка',
+)
+FIRST_NAMES = ('Иван', 'Анна', 'Пётр', 'Мария', 'Олег', 'Елена', 'Игорь')
+LAST_NAMES = ('Петров', 'Иванова', 'Смирнов', 'Кузнецова', 'Попов')
+IMAGE = 'recipes/seed.png'
+ZIPF_EXPONENT = 1.1
+HISTORY_DAYS = 365
+
+
+def words(rng, count):
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+def insert(model, objs):
+    objs = list(objs)
+    batch_size = connection.ops.bulk_batch_size(
+        model._meta.concrete_fields, objs
+    )
+    model.objects.bulk_create(objs, batch_size=min(batch_size, BATCH_SIZE))
+
+
+def free_colors(rng, count):
+    '''Returns "count" HEX colors not used by existing tags.'''
+    taken = set(Tag.objects.values_list('color', flat=True))
+    colors = []
+    while len(colors) < count:
+        color = f'#{rng.randrange(0x1000000):06x}'
+        if color not in taken:
+            taken.add(color)
+            colors.append(color)
+    return colors
+
+
+def zipf_weights(count):
+    '''Cumulative weights of a Zipf distribution over "count" ranks.'''
+    total, weights = 0, []
+    for rank in range(1, count + 1):
+        total += rank ** -ZIPF_EXPONENT
+        weights.append(total)
+    return weights
+
+
+class Seeder:
+    '''
+    Adds synthetic users, tags, ingredients, recipes and the rows
+    linking them, using bulk inserts only. Activity follows
+    long-tailed distributions: a few authors write most recipes,
+    a few recipes collect most favorites and cart entries,
+    and prolific authors have the most followers.
+    Names carry a random prefix, so the data can be added next to
+    existing rows.
+    '''
+
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+        self.prefix = uuid.UUID(int=self.rng.getrandbits(128)).hex[:8]
+
+    def users(self):
+        return User.objects.filter(username__startswith=f'{self.prefix}-')
+
+    def recipes(self):
+        return Recipe.objects.filter(name__contains=f' {self.prefix}-')
+
+    def long_tail(self, mean, limit):
+        '''Exponentially distributed count with the given mean.'''
+        if mean <= 0 or limit <= 0:
+            return 0
+        return min(int(self.rng.expovariate(1 / mean)), limit)
+
+    def popular(self, ranked, weights, count):
+        '''"count" distinct items of "ranked", the first ones more likely.'''
+        count = min(count, len(ranked))
+        chosen = set()
+        for _ in range(5):
+            if len(chosen) >= count:
+                break
+            chosen.update(self.rng.choices(
+                ranked, cum_weights=weights, k=count - len(chosen)
+            ))
+        while len(chosen) < count:
+            chosen.add(self.rng.choice(ranked))
+        return chosen
+
+    def create_users(self, count):
+        password = make_password(self.prefix)
+        insert(User, (
+            User(
+                email=f'{self.prefix}-{number}@example.com',
+                username=f'{self.prefix}-{number}',
+                first_name=self.rng.choice(FIRST_NAMES),
+                last_name=self.rng.choice(LAST_NAMES),
+                password=password
+            ) for number in range(count)
+        ))
+        return list(self.users().values_list('id', flat=True))
+
+    def create_tags(self, count):
+        bits = Tag.free_bits()
+        insert(Tag, (
+            Tag(
+                name=f'{self.prefix}-{number}',
+                slug=f'{self.prefix}-{number}', color=color,
+                bit=bits[number] if number < len(bits) else None
+            ) for number, color in enumerate(free_colors(self.rng, count))
+        ))
+        return list(Tag.objects.filter(
+            slug__startswith=f'{self.prefix}-'
+        ).values_list('id', flat=True))
+
+    def create_ingredients(self, count):
+        '''Creates "count" ingredients, or takes the existing ones if 0.'''
+        if not count:
+            return list(Ingredient.objects.values_list('id', flat=True))
+        insert(Ingredient, (
+            Ingredient(
+                name=f'{words(self.rng, 1)} {self.prefix}-{number}',
+                measurement_unit=self.rng.choice(UNITS)
+            ) for number in range(count)
+        ))
+        return list(Ingredient.objects.filter(
+            name__contains=f' {self.prefix}-'
+        ).values_list('id', flat=True))
+
+    def create_recipes(self, count, authors):
+        author_weights = zipf_weights(len(authors))
+        insert(Recipe, (
+            Recipe(
+                author_id=author,
+                name=f'{words(self.rng, 2)} {self.prefix}-{number}'
+                .capitalize(),
+                text=words(self.rng, self.rng.randint(10, 80)),
+                image=IMAGE,
+                cooking_time=max(1, int(self.rng.lognormvariate(3.4, 0.6)))
+            )
+            for number, author in enumerate(self.rng.choices(
+                authors, cum_weights=author_weights, k=count
+            ))
+        ))
+        recipe_ids = sorted(self.recipes().values_list('id', flat=True))
+        self.spread_pub_dates(recipe_ids)
+        return recipe_ids
+
+    def spread_pub_dates(self, recipe_ids):
+        '''Spreads publication over HISTORY_DAYS, in the order of ids.'''
+        now = timezone.now()
+        offsets = sorted(
+            (self.rng.random() * HISTORY_DAYS for _ in recipe_ids),
+            reverse=True
+        )
+        Recipe.objects.bulk_update(
+            [
+                Recipe(pk=pk, pub_date=now - timedelta(days=offset))
+                for pk, offset in zip(recipe_ids, offsets)
+            ],
+            ['pub_date'], batch_size=BATCH_SIZE
+        )
+
+    def link_recipes(self, recipe_ids, tag_ids, ingredient_ids, per_recipe):
+        insert(RecipeTag, (
+            RecipeTag(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in self.rng.sample(
+                tag_ids, min(self.rng.randint(1, 3), len(tag_ids))
+            )
+        ))
+        insert(RecipeIngredient, (
+            RecipeIngredient(
+                recipe_id=recipe_id, ingredients_id=ingredient_id,
+                amount=self.rng.randint(1, 500)
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in self.rng.sample(
+                ingredient_ids,
+                min(1 + self.long_tail(per_recipe, 30), len(ingredient_ids))
+            )
+        ))
+
+    def link_users(self, user_ids, authors, recipe_ids, means):
+        '''
+        Adds favorites, cart entries and subscriptions; "means" holds
+        their average numbers per user.
+        '''
+        favorites, carts, subscriptions = means
+        ranked = self.rng.sample(recipe_ids, len(recipe_ids))
+        recipe_weights = zipf_weights(len(ranked))
+        author_weights = zipf_weights(len(authors))
+        for model, mean in ((Favorite, favorites), (ShoppingCart, carts)):
+            insert(model, (
+                model(user_id=user_id, recipe_id=recipe_id)
+                for user_id in user_ids
+                for recipe_id in self.popular(
+                    ranked, recipe_weights,
+                    self.long_tail(mean, len(ranked))
+                )
+            ))
+        insert(Subscription, (
+            Subscription(user_id=user_id, author_id=author_id)
+            for user_id in user_ids
+            for author_id in self.popular(
+                authors, author_weights,
+                self.long_tail(subscriptions, len(authors) - 1) + 1
+            ) - {user_id}
+        ))
+
+
+@transaction.atomic
+def seed_database(users=100, recipes=1000, ingredients=500, tags=10,
+                  per_recipe=5, favorites=10, carts=3, subscriptions=5,
+                  seed=None):
+    '''
+    Fills the database with synthetic data (see Seeder).
+    With ingredients=0 the recipes use the existing ingredients.
+    Counter columns, tag masks, shopping lists and the search index
+    are brought up to date. Returns the ids of the new users.
+    '''
+    seeder = Seeder(seed)
+    user_ids = seeder.create_users(users)
+    authors = seeder.rng.sample(user_ids, len(user_ids))
+    tag_ids = seeder.create_tags(tags)
+    ingredient_ids = seeder.create_ingredients(ingredients)
+    recipe_ids = seeder.create_recipes(recipes, authors)
+    seeder.link_recipes(recipe_ids, tag_ids, ingredient_ids, per_recipe)
+    seeder.link_users(
+        user_ids, authors, recipe_ids, (favorites, carts, subscriptions)
+    )
+    update_seeded(seeder, user_ids, recipe_ids)
+    return user_ids
+
+
+def update_seeded(seeder, user_ids, recipe_ids):
+    '''Fills the derived data of the seeded rows.'''
+    seeder.recipes().update_tags_mask()
+    insert(ShoppingListItem, (
+        ShoppingListItem(
+            user_id=user_id, ingredient_id=ingredient_id, amount=amount
+        )
+        for user_id, ingredient_id, amount in RecipeIngredient.objects.filter(
+            recipe__is_in_shopping_cart__user__in=seeder.users()
+        ).values_list(
+            'recipe__is_in_shopping_cart__user', 'ingredients'
+        ).annotate(total=Sum('amount')).order_by().iterator()
+    ))
+    for model, field, source, relation in COUNTERS:
+        pks = recipe_ids if model is Recipe else user_ids
+        for start in range(0, len(pks), BATCH_SIZE):
+            model.objects.filter(
+                pk__in=pks[start:start + BATCH_SIZE]
+            ).update(**{field: counted(source, relation)})
+    for start in range(0, len(recipe_ids), BATCH_SIZE):
+        update_search_index(recipe_ids[start:start + BATCH_SIZE])
@@ -1,16 +1,31 @@
+import json
+from collections import Counter
+
 from django.contrib.auth import get_user_model
-from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.http import QueryDict
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
+from recipes.fields import bitmask
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                             RecipeTag, ShoppingCart, Tag)
+from recipes.search import schedule_search_update
 from rest_framework import serializers
 from users.models import Subscription
 
+from .cache import recipes_changed
+from .fields import BoundedImageField, same_content
+from .metrics import TimedRepresentationMixin
+from .services import change_counter, recipe_amounts, recipe_amounts_changed
+from .signals import schedule
+from .tasks import delete_replaced_image, enqueue_image_variants
+
 User = get_user_model()
 
+BATCH_MAX_RECIPES = 100
+
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(TimedRepresentationMixin, UserSerializer):
     '''
     Serializer to handle User instances with
     list and retrieve ViewSet methods.
@@ -33,6 +48,8 @@ class CustomUserSerializer(UserSerializer):
         user = self.context.get('request').user
         if user.is_anonymous or (user == obj):
             return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         return Subscription.objects.filter(
             user=user, author=obj
         ).exists()
@@ -70,7 +87,8 @@ class CustomUserCreateSerializer(UserCreateSerializer):
         return value
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedRepresentationMixin,
+                           serializers.ModelSerializer):
     '''
     The serializer handles Ingredient model instances.
     It's used in IngredientViewSet.
@@ -104,7 +122,7 @@ class IngredientToRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedRepresentationMixin, serializers.ModelSerializer):
     '''
     The serializer handles Tag model instances.
     It's used in TagViewSet and RecipeGetSerializer.
@@ -116,7 +134,8 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = '__all__',
 
 
-class RecipeGetSerializer(serializers.ModelSerializer):
+class RecipeGetSerializer(TimedRepresentationMixin,
+                          serializers.ModelSerializer):
     '''
     Serializer to handle Recipe instances
     if the request method is one of the 'safe' methods:
@@ -124,26 +143,36 @@ class RecipeGetSerializer(serializers.ModelSerializer):
     '''
     id = serializers.IntegerField()
     image = Base64ImageField()
+    image_thumbnail = serializers.ImageField(read_only=True)
+    image_webp = serializers.ImageField(read_only=True)
     ingredients = RecipeIngredientGetSerializer(
         source='recipe_amount', many=True
     )
     tags = TagSerializer(many=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
-    author = CustomUserSerializer(read_only=True)
+    author = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
         fields = (
-            'id', 'author', 'name', 'image', 'text', 'tags',
-            'ingredients', 'cooking_time', 'is_favorited',
-            'is_in_shopping_cart'
+            'id', 'author', 'name', 'image', 'image_thumbnail',
+            'image_webp', 'text', 'tags', 'ingredients', 'cooking_time',
+            'is_favorited', 'is_in_shopping_cart'
         )
 
+    def get_author(self, obj):
+        author = obj.author
+        if hasattr(obj, 'author_subscribed'):
+            author.is_subscribed = obj.author_subscribed
+        return CustomUserSerializer(author, context=self.context).data
+
     def get_is_favorited(self, obj):
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
+        if hasattr(obj, 'favorited'):
+            return obj.favorited
         return Favorite.objects.filter(
             user=user, recipe__id=obj.id
         ).exists()
@@ -152,36 +181,58 @@ class RecipeGetSerializer(serializers.ModelSerializer):
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
+        if hasattr(obj, 'in_shopping_cart'):
+            return obj.in_shopping_cart
         return ShoppingCart.objects.filter(
             user=user, recipe__id=obj.id
         ).exists()
 
 
-class RecipeShortSerializer(serializers.ModelSerializer):
+class RecipeShortSerializer(TimedRepresentationMixin,
+                            serializers.ModelSerializer):
     '''
     Serializer to handle Recipe instances
     within SubscriptionSerializer.
     '''
     image = Base64ImageField()
+    image_thumbnail = serializers.ImageField(read_only=True)
+    image_webp = serializers.ImageField(read_only=True)
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = (
+            'id', 'name', 'image', 'image_thumbnail', 'image_webp',
+            'cooking_time'
+        )
         read_only_fields = '__all__',
 
 
+class RecipeIdsSerializer(serializers.Serializer):
+    '''
+    Validates the list of recipe ids sent
+    to the batch favorite and shopping cart endpoints.
+    '''
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+        max_length=BATCH_MAX_RECIPES
+    )
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
+
+
 class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
     '''
     Serializer to handle Recipe instances
     if the request method is not one of the 'safe' methods.
+    Accepts JSON with a base64 image or multipart form data
+    with the image as a file and ingredients as a JSON string.
     '''
-    image = Base64ImageField()
+    image = BoundedImageField()
     ingredients = IngredientToRecipeSerializer(many=True)
     tags = serializers.ListField(
-        child=serializers.SlugRelatedField(
-            slug_field='id',
-            queryset=Tag.objects.all()
-        ),
+        child=serializers.IntegerField(),
         allow_empty=False
     )
 
@@ -192,90 +243,225 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
             'tags', 'ingredients', 'cooking_time'
         )
 
+    def to_internal_value(self, data):
+        if isinstance(data, QueryDict):
+            data = self.form_to_dict(data)
+        return super().to_internal_value(data)
+
+    @staticmethod
+    def form_to_dict(data):
+        '''Converts multipart form data to the JSON request layout.'''
+        result = data.dict()
+        if 'tags' in data:
+            result['tags'] = data.getlist('tags')
+        if 'ingredients' in data:
+            try:
+                result['ingredients'] = json.loads(data['ingredients'])
+            except ValueError:
+                raise serializers.ValidationError(
+                    {'ingredients': 'Must be a JSON encoded list.'}
+                )
+        return result
+
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            image = self.validated_data.get('image')
+            if image is not None:
+                image.close()
+
     def validate(self, data):
-        if data['name'] == data['text']:
+        if 'name' in data and data['name'] == data.get('text'):
             raise serializers.ValidationError(
                 'The value of "name" field could '
                 'not be the same as the value of "text" field.'
             )
-        if not data['tags']:
+        return data
+
+    @staticmethod
+    def repeated(values):
+        return sorted(
+            value for value, count in Counter(values).items() if count > 1
+        )
+
+    def validate_tags(self, value):
+        '''Resolves tag ids with a single query.'''
+        repeated = self.repeated(value)
+        if repeated:
             raise serializers.ValidationError(
-                '"Tag" field must be filled out.'
+                f'You have repeated tags: {repeated}'
             )
-        tags_in_recipe = []
-        for tag in data['tags']:
-            if tag in tags_in_recipe:
-                raise serializers.ValidationError(
-                    f'You have repeated tags: {tag}'
-                )
-            tags_in_recipe.append(tag)
-        if not data['ingredients']:
+        tags = Tag.objects.in_bulk(value)
+        missing = sorted(set(value) - tags.keys())
+        if missing:
+            raise serializers.ValidationError(
+                f'Tags do not exist: {missing}'
+            )
+        return [tags[tag_id] for tag_id in value]
+
+    def validate_ingredients(self, value):
+        '''
+        Resolves ingredient ids with a single query and
+        replaces every id with the Ingredient instance.
+        '''
+        if not value:
             raise serializers.ValidationError(
                 '"Ingredients" field must be filled out.'
             )
-        ing_in_recipe = []
-        for ing in data['ingredients']:
-            if int(ing['amount']) <= 0:
-                raise serializers.ValidationError(
-                    'Amount must be greater than 0'
-                )
-            ingredient = get_object_or_404(Ingredient, id=ing['id'])
-            if ingredient in ing_in_recipe:
-                raise serializers.ValidationError(
-                    f'You have repeated ingredients: {ingredient}'
-                )
-            ing_in_recipe.append(ingredient)
-        return data
+        ids = [item['id'] for item in value]
+        repeated = self.repeated(ids)
+        if repeated:
+            raise serializers.ValidationError(
+                f'You have repeated ingredients: {repeated}'
+            )
+        if any(item['amount'] <= 0 for item in value):
+            raise serializers.ValidationError(
+                'Amount must be greater than 0'
+            )
+        ingredients = Ingredient.objects.in_bulk(ids)
+        missing = sorted(set(ids) - ingredients.keys())
+        if missing:
+            raise serializers.ValidationError(
+                f'Ingredients do not exist: {missing}'
+            )
+        return [
+            {'ingredient': ingredients[item['id']], 'amount': item['amount']}
+            for item in value
+        ]
 
     @classmethod
     def recipe_ingredient_create(cls, recipe, ingredients):
-        recipe_list = [RecipeIngredient(
-            recipe=recipe,
-            ingredients=get_object_or_404(Ingredient, id=ingredient['id']),
-            amount=ingredient['amount']
-        ) for ingredient in ingredients]
-        RecipeIngredient.objects.bulk_create(recipe_list)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredients=item['ingredient'],
+                amount=item['amount']
+            ) for item in ingredients
+        )
 
     def to_representation(self, value):
+        value = Recipe.objects.with_related().with_user_flags(
+            self.context.get('request').user
+        ).get(pk=value.pk)
         return RecipeGetSerializer(value, context=self.context).data
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
+        author = self.context.get('request').user
         recipe = Recipe.objects.create(
-            author=self.context.get('request').user,
+            author=author, tags_mask=bitmask(tag.bit for tag in tags),
             **validated_data
         )
+        change_counter(
+            User.objects.filter(id=author.id), 'recipes_count', 1
+        )
         self.recipe_ingredient_create(
             recipe=recipe,
             ingredients=ingredients
         )
-        recipe.tags.set(tags)
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe=recipe, tag=tag) for tag in tags
+        )
+        enqueue_image_variants(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = self.context['request'].data['ingredients']
-        tags = self.context['request'].data['tags']
-        instance.name = validated_data.get('name', instance.name)
-        instance.image = validated_data.get('image', instance.image)
-        instance.text = validated_data.get('text', instance.text)
-        instance.cooking_time = validated_data.get(
-            'cooking_time', instance.cooking_time
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        image = validated_data.pop('image', None)
+        old_amounts = recipe_amounts(instance)
+        fields = [
+            field for field, value in validated_data.items()
+            if getattr(instance, field) != value
+        ]
+        for field in fields:
+            setattr(instance, field, validated_data[field])
+        image_changed = (
+            image is not None and not same_content(instance.image, image)
         )
-        instance.save()
-        if tags:
-            RecipeTag.objects.filter(recipe=instance).delete()
-            instance.tags.clear()
-            instance.tags.set(tags)
-        if ingredients:
-            RecipeIngredient.objects.filter(recipe=instance).delete()
-            instance.ingredients.clear()
-            self.recipe_ingredient_create(
-                recipe=instance,
-                ingredients=ingredients
+        if image_changed:
+            delete_replaced_image(instance)
+            instance.image = image
+            instance.image_thumbnail = instance.image_webp = ''
+            fields += ['image', 'image_thumbnail', 'image_webp']
+        if tags is not None:
+            tags_mask = bitmask(tag.bit for tag in tags)
+            if tags_mask != instance.tags_mask:
+                instance.tags_mask = tags_mask
+                fields.append('tags_mask')
+        if fields:
+            instance.save(update_fields=fields)
+        if image_changed:
+            enqueue_image_variants(instance)
+        if tags is not None:
+            self.recipe_tag_update(instance, tags)
+        if ingredients is not None:
+            new_amounts = self.recipe_ingredient_update(
+                instance, ingredients, old_amounts
             )
+            recipe_amounts_changed(instance, old_amounts, new_amounts)
+        if ingredients is not None:
+            schedule_search_update((instance.id,))
+        schedule(recipes_changed)
         return instance
 
+    @staticmethod
+    def recipe_tag_update(recipe, tags):
+        '''Adds and removes only the tags that changed.'''
+        current = set(
+            RecipeTag.objects.filter(
+                recipe=recipe
+            ).values_list('tag_id', flat=True)
+        )
+        new = {tag.id for tag in tags}
+        if current - new:
+            RecipeTag.objects.filter(
+                recipe=recipe, tag_id__in=current - new
+            ).delete()
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe=recipe, tag=tag)
+            for tag in tags if tag.id not in current
+        )
+
+    @staticmethod
+    def recipe_ingredient_update(recipe, ingredients, old_amounts):
+        '''
+        Creates, updates and deletes only the ingredient rows
+        that differ from "old_amounts". Returns the new amounts.
+        '''
+        new_amounts = {
+            item['ingredient'].id: item['amount'] for item in ingredients
+        }
+        removed = old_amounts.keys() - new_amounts.keys()
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredients_id__in=removed
+            ).delete()
+        changed = [
+            ingredient for ingredient, amount in new_amounts.items()
+            if ingredient in old_amounts and old_amounts[ingredient] != amount
+        ]
+        if changed:
+            rows = RecipeIngredient.objects.filter(
+                recipe=recipe, ingredients_id__in=changed
+            )
+            for row in rows:
+                row.amount = new_amounts[row.ingredients_id]
+            RecipeIngredient.objects.bulk_update(rows, ['amount'])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredients=item['ingredient'],
+                amount=item['amount']
+            ) for item in ingredients
+            if item['ingredient'].id not in old_amounts
+        )
+        return new_amounts
+
 
 class SubscriptionSerializer(CustomUserSerializer):
     '''
@@ -284,7 +470,6 @@ class SubscriptionSerializer(CustomUserSerializer):
     within CustomUserViewSet.
     '''
     recipes = RecipeShortSerializer(many=True, read_only=True)
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -298,6 +483,3 @@ class SubscriptionSerializer(CustomUserSerializer):
             'recipes',
             'recipes_count',
         )
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
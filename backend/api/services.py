@@ -1,35 +1,269 @@
-import logging
+import csv
 
-from django.db.models import Sum
-from django.http import HttpResponse
-from recipes.models import RecipeIngredient
+from django.contrib.auth import get_user_model
+from django.db import connections, router, transaction
+from django.db.models import (Case, Count, F, IntegerField, OuterRef, Subquery,
+                              Sum, Value, When)
+from django.db.models.functions import Coalesce, Greatest
+from django.http import StreamingHttpResponse
+from recipes.models import (Favorite, Recipe, RecipeIngredient, ShoppingCart,
+                            ShoppingListItem)
 from rest_framework import status
 from rest_framework.response import Response
+from users.models import Subscription
 
+from .pdf import pdf_font, stream_pdf
 
-def download_cart(user):
+User = get_user_model()
+
+TITLE = 'Shopping List'
+BATCH_SIZE = 1000
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscription, 'author'),
+)
+
+
+def change_counter(queryset, field, delta):
+    '''
+    Adds "delta" to a counter column of every row of the queryset
+    in the database, so concurrent changes are not lost.
+    '''
+    queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def lock_user(user):
+    '''
+    Locks the user's row until the end of the transaction, so the
+    concurrent changes of the user's favorites and shopping cart
+    run one after another and see each other's rows.
+    '''
+    User.objects.select_for_update().filter(pk=user.pk).values('pk').get()
+
+
+def counted(source, field):
+    '''
+    Subquery expression with the number of "source" rows
+    referencing the outer row through "field".
+    '''
+    return Coalesce(Subquery(
+        source.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            total=Count('pk')
+        ).values('total'),
+        output_field=IntegerField()
+    ), 0)
+
+
+def insert_ignore(model, **values):
+    '''
+    Inserts a row with a single statement. Nothing is inserted
+    if the row conflicts with a unique constraint or if a row
+    referenced by a foreign key does not exist.
+    Returns the number of inserted rows.
+    '''
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    columns, params, conditions, condition_params = [], [], [], []
+    for name, value in values.items():
+        field = model._meta.get_field(name)
+        value = field.get_db_prep_save(getattr(value, 'pk', value), connection)
+        columns.append(quote(field.column))
+        params.append(value)
+        if field.is_relation:
+            target = field.target_field
+            conditions.append(
+                f'EXISTS (SELECT 1 FROM {quote(target.model._meta.db_table)} '
+                f'WHERE {quote(target.column)} = %s)'
+            )
+            condition_params.append(value)
+    sql = ' '.join(part for part in (
+        connection.ops.insert_statement(ignore_conflicts=True),
+        quote(model._meta.db_table),
+        f'({", ".join(columns)})',
+        f'SELECT {", ".join("%s" for _ in columns)}',
+        f'WHERE {" AND ".join(conditions)}' if conditions else '',
+        connection.ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)
+    ) if part)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + condition_params)
+        return cursor.rowcount
+
+
+class Echo:
+    '''File-like object that returns what is written to it.'''
+
+    def write(self, value):
+        return value
+
+
+def shopping_list(user):
+    '''
+    Yields (name, amount, measurement_unit) of every ingredient
+    in the user's shopping cart without caching the result set.
+    '''
+    items = ShoppingListItem.objects.filter(
+        user=user, amount__gt=0
+    ).values_list(
+        'ingredient__name', 'amount', 'ingredient__measurement_unit'
+    ).order_by('ingredient__name')
+    yield from items.iterator()
+
+
+def live_shopping_list():
+    '''
+    Aggregates the shopping lists of all users from their carts.
+    Rows are ordered by (user, ingredient).
+    '''
+    return RecipeIngredient.objects.filter(
+        recipe__is_in_shopping_cart__isnull=False
+    ).values_list(
+        'recipe__is_in_shopping_cart__user', 'ingredients'
+    ).annotate(total=Sum('amount')).order_by(
+        'recipe__is_in_shopping_cart__user__id', 'ingredients__id'
+    )
+
+
+def recipe_amounts(recipe):
+    '''Returns {ingredient id: amount} of a recipe.'''
+    return dict(
+        RecipeIngredient.objects.filter(
+            recipe=recipe
+        ).values_list('ingredients_id', 'amount')
+    )
+
+
+def amounts_delta(old, new):
+    '''Returns per-ingredient changes between two amount mappings.'''
+    delta = {
+        ingredient: new.get(ingredient, 0) - amount
+        for ingredient, amount in old.items()
+    }
+    for ingredient, amount in new.items():
+        delta.setdefault(ingredient, amount)
+    return {
+        ingredient: amount
+        for ingredient, amount in delta.items() if amount
+    }
+
+
+def apply_shopping_list_delta(user_ids, delta):
+    '''
+    Adds per-ingredient amounts (negative to subtract) to the
+    shopping lists of the given users. Missing rows are inserted
+    first and the change is applied as one atomic increment,
+    so concurrent updates of the same row do not lose amounts.
+    '''
+    user_ids = list(user_ids)
+    if not user_ids or not delta:
+        return
+    with transaction.atomic():
+        ShoppingListItem.objects.bulk_create(
+            (
+                ShoppingListItem(user_id=user_id, ingredient_id=ingredient)
+                for user_id in user_ids
+                for ingredient, amount in delta.items() if amount > 0
+            ),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True
+        )
+        items = ShoppingListItem.objects.filter(
+            user_id__in=user_ids, ingredient_id__in=delta
+        )
+        items.update(amount=F('amount') + Case(
+            *(
+                When(ingredient_id=ingredient, then=Value(amount))
+                for ingredient, amount in delta.items()
+            ),
+            default=Value(0),
+            output_field=IntegerField()
+        ))
+        items.filter(amount__lte=0).delete()
+
+
+def recipes_amounts(recipe_ids):
+    '''Returns {ingredient id: total amount} of several recipes.'''
+    return dict(
+        RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('ingredients_id').annotate(
+            total=Sum('amount')
+        ).order_by()
+    )
+
+
+def add_recipes_to_shopping_list(user, recipe_ids):
+    apply_shopping_list_delta((user.id,), recipes_amounts(recipe_ids))
+
+
+def remove_recipes_from_shopping_list(user, recipe_ids):
+    apply_shopping_list_delta((user.id,), amounts_delta(
+        recipes_amounts(recipe_ids), {}
+    ))
+
+
+def recipe_amounts_changed(recipe, old_amounts, new_amounts=None):
+    '''
+    Propagates a change of recipe ingredients to the shopping lists
+    of every user who has the recipe in the cart.
+    The new amounts are read from the database if not given.
+    '''
+    if new_amounts is None:
+        new_amounts = recipe_amounts(recipe)
+    apply_shopping_list_delta(
+        ShoppingCart.objects.filter(
+            recipe=recipe
+        ).values_list('user_id', flat=True),
+        amounts_delta(old_amounts, new_amounts)
+    )
+
+
+def shopping_list_lines(user):
+    for name, amount, measurement_unit in shopping_list(user):
+        yield f'{name}: {amount} {measurement_unit}'
+
+
+def stream_txt(user):
+    yield f'{TITLE}\n\n'
+    for line in shopping_list_lines(user):
+        yield f'{line}\n'
+
+
+def stream_csv(user):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'amount', 'measurement_unit'))
+    for row in shopping_list(user):
+        yield writer.writerow(row)
+
+
+def stream_shopping_list_pdf(user):
+    font = pdf_font()
+
+    def lines():
+        yield TITLE
+        yield ''
+        yield from shopping_list_lines(user)
+    return stream_pdf(lines(), font)
+
+
+EXPORTERS = {
+    'txt': (stream_txt, 'text/plain; charset=utf-8'),
+    'csv': (stream_csv, 'text/csv; charset=utf-8'),
+    'pdf': (stream_shopping_list_pdf, 'application/pdf'),
+}
+
+
+def download_cart(user, file_format='txt'):
     if not user.is_in_shopping_cart.exists():
         return Response(status=status.HTTP_400_BAD_REQUEST)
-    ingredients = RecipeIngredient.objects.filter(
-        recipe__is_in_shopping_cart__user=user
-    ).values(
-        'ingredients__name',
-        'ingredients__measurement_unit'
-    ).annotate(amount=Sum('amount'))
-    logging.error(ingredients)
-    filename = f'{user.username}_shopping_list.txt'
-    shopping_list = 'Shopping List\n\n'
-    for ingredient in ingredients:
-        name = ingredient['ingredients__name']
-        amount = ingredient['amount']
-        measurement_unit = ingredient['ingredients__measurement_unit']
-        shopping_list += (
-            f'{name}: {amount} {measurement_unit}\n'
-        )
-    response = HttpResponse(
-        content=shopping_list,
-        content_type='text.txt',
-        charset='utf-8'
+    exporter, content_type = EXPORTERS[file_format]
+    filename = f'{user.username}_shopping_list.{file_format}'
+    response = StreamingHttpResponse(
+        exporter(user),
+        content_type=content_type
     )
     response['Content-Disposition'] = f'attachment; filename={filename}'
     return response
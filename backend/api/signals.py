@@ -0,0 +1,155 @@
+import threading
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.search import remove_from_search_index, schedule_search_update
+
+from .cache import ingredients_changed, recipes_changed, tags_changed
+from .search import rebuild_ingredient_index
+
+User = get_user_model()
+
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+SEARCH_FIELDS = ('name', 'text')
+
+
+class PendingCallbacks(threading.local):
+    '''Callbacks scheduled in the thread and not run yet.'''
+
+    def __init__(self):
+        self.callbacks = set()
+
+
+pending_callbacks = PendingCallbacks()
+
+
+def schedule(callback):
+    '''
+    Runs the callback once the current transaction is committed.
+    A callback already pending in the transaction runs only once,
+    so bulk deletes trigger a single run. A runner is queued on every
+    call, so a callback left pending by a rolled back transaction
+    still runs after the next commit that schedules it.
+    '''
+    pending_callbacks.callbacks.add(callback)
+
+    def run():
+        if callback in pending_callbacks.callbacks:
+            pending_callbacks.callbacks.discard(callback)
+            callback()
+
+    transaction.on_commit(run)
+
+
+@receiver(pre_save, sender=Ingredient)
+def ingredient_saving(sender, instance, raw=False, **kwargs):
+    '''Notes whether the save renames the ingredient.'''
+    instance.renamed = not raw and instance.pk is not None and (
+        Ingredient.objects.filter(pk=instance.pk).exclude(
+            name=instance.name
+        ).exists()
+    )
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(sender, instance, using, **kwargs):
+    if getattr(instance, 'renamed', False):
+        schedule_search_update(
+            RecipeIngredient.objects.using(using).filter(
+                ingredients=instance
+            ).values_list('recipe_id', flat=True),
+            using=using
+        )
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    schedule(rebuild_ingredient_index)
+    schedule(ingredients_changed)
+    schedule(recipes_changed)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, **kwargs):
+    schedule(tags_changed)
+    schedule(recipes_changed)
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, using, **kwargs):
+    '''Frees the bit of a deleted tag in the recipe masks.'''
+    if instance.bit is None:
+        return
+    mask = 1 << instance.bit
+    Recipe.objects.using(using).filter(tags_mask__hasany=mask).update(
+        tags_mask=F('tags_mask').bitand(~mask)
+    )
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    '''Keeps Recipe.tags_mask in sync with tags.set(), add() and remove().'''
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        recipes = Recipe.objects.filter(pk=instance.pk)
+    elif action == 'post_clear':
+        if instance.bit is None:
+            return
+        recipes = Recipe.objects.filter(tags_mask__hasany=1 << instance.bit)
+    else:
+        recipes = Recipe.objects.filter(pk__in=pk_set)
+    recipes.update_tags_mask()
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, using, update_fields=None, **kwargs):
+    if update_fields is None or set(SEARCH_FIELDS) & set(update_fields):
+        schedule_search_update((instance.id,), using=using)
+    schedule(recipes_changed)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, using, **kwargs):
+    '''Covers ingredient rows edited one by one, as in the admin.'''
+    schedule_search_update((instance.recipe_id,), using=using)
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, update_fields=None, raw=False, **kwargs):
+    '''
+    Notes whether the save changes how the user is shown as a recipe
+    author. Users without recipes, such as new ones, are not shown.
+    '''
+    instance.author_changed = False
+    if raw or instance.pk is None or not instance.recipes_count:
+        return
+    fields = AUTHOR_FIELDS
+    if update_fields is not None:
+        fields = tuple(set(fields) & set(update_fields))
+        if not fields:
+            return
+    stored = User.objects.filter(pk=instance.pk).values(*fields).first()
+    instance.author_changed = stored is not None and any(
+        stored[field] != getattr(instance, field) for field in fields
+    )
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    if getattr(instance, 'author_changed', False):
+        schedule(recipes_changed)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, using, **kwargs):
+    remove_from_search_index(instance.id, using=using)
+    schedule(recipes_changed)
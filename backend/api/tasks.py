@@ -0,0 +1,147 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from recipes.models import ImageVariantJob, Recipe
+from sorl.thumbnail import delete as delete_thumbnails
+from sorl.thumbnail import get_thumbnail
+
+from .cache import recipes_changed
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+STALE_AFTER = timedelta(minutes=10)
+
+
+def enqueue_image_variants(recipe):
+    '''
+    Queues a job to render the variants of the recipe image.
+    The outdated variants are cleared by the caller in the same
+    save as the new image.
+    '''
+    ImageVariantJob.objects.get_or_create(
+        recipe=recipe, status=ImageVariantJob.PENDING
+    )
+
+
+def delete_replaced_image(recipe):
+    '''
+    Deletes the current image of the recipe, with its variants and the
+    other thumbnails sorl.thumbnail rendered from it, once the
+    transaction replacing it is committed. Nothing is deleted if the
+    transaction is rolled back or another recipe uses the same file.
+    '''
+    image = recipe.image.name
+    variants = [
+        getattr(recipe, field).name
+        for field in settings.RECIPE_IMAGE_VARIANTS
+    ]
+    if not image:
+        return
+
+    def delete():
+        if Recipe.objects.filter(image=image).exists():
+            return
+        try:
+            delete_thumbnails(image)
+            for name in filter(None, variants):
+                default_storage.delete(name)
+        except OSError:
+            logger.exception('Could not delete the replaced image %s.', image)
+
+    transaction.on_commit(delete)
+
+
+def render_image_variants(recipe):
+    '''
+    Renders every variant from settings.RECIPE_IMAGE_VARIANTS.
+    The result is stored only if the image was not replaced meanwhile.
+    '''
+    if not recipe.image:
+        return
+    variants = {
+        field: get_thumbnail(recipe.image, geometry, **options).name
+        for field, (geometry, options)
+        in settings.RECIPE_IMAGE_VARIANTS.items()
+    }
+    if Recipe.objects.filter(
+        pk=recipe.pk, image=recipe.image.name
+    ).update(**variants):
+        recipes_changed()
+
+
+def claim_job():
+    '''
+    Marks the oldest pending job (or a job whose worker died)
+    as running and returns it. Rows locked by other workers
+    are skipped where the database supports it. A job whose worker
+    died MAX_ATTEMPTS times fails instead, so an image that crashes
+    the worker is not retried forever.
+    '''
+    stale = timezone.now() - STALE_AFTER
+    with transaction.atomic():
+        ImageVariantJob.objects.filter(
+            status=ImageVariantJob.RUNNING, updated__lt=stale,
+            attempts__gte=MAX_ATTEMPTS
+        ).update(
+            status=ImageVariantJob.FAILED, updated=timezone.now(),
+            error='The worker stopped while processing the job.'
+        )
+        job = ImageVariantJob.objects.select_for_update(
+            skip_locked=True
+        ).filter(
+            Q(status=ImageVariantJob.PENDING)
+            | Q(
+                status=ImageVariantJob.RUNNING, updated__lt=stale,
+                attempts__lt=MAX_ATTEMPTS
+            )
+        ).order_by('id').first()
+        if job is None:
+            return None
+        job.status = ImageVariantJob.RUNNING
+        job.attempts += 1
+        job.save(update_fields=('status', 'attempts', 'updated'))
+    return job
+
+
+def process_job(job):
+    try:
+        render_image_variants(
+            Recipe.objects.only('id', 'image').get(pk=job.recipe_id)
+        )
+    except Recipe.DoesNotExist:
+        job.delete()
+    except Exception as error:
+        logger.exception('Image job %s failed.', job.pk)
+        job.error = str(error)
+        job.status = (
+            ImageVariantJob.FAILED if job.attempts >= MAX_ATTEMPTS
+            else ImageVariantJob.PENDING
+        )
+        job.save(update_fields=('status', 'error', 'updated'))
+    else:
+        job.delete()
+
+
+def run_worker(interval=1.0, once=False):
+    '''
+    Processes queued jobs, sleeping "interval" seconds
+    when the queue is empty. With "once" it exits instead.
+    Returns the number of processed jobs.
+    '''
+    processed = 0
+    while True:
+        job = claim_job()
+        if job is None:
+            if once:
+                return processed
+            time.sleep(interval)
+            continue
+        process_job(job)
+        processed += 1
@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test.utils import override_settings
+from recipes.models import Recipe, RecipeIngredient, RecipeTag
+
+from ..services import change_counter
+
+User = get_user_model()
+
+
+def create_user(username, **fields):
+    return User.objects.create_user(
+        email=f'{username}@example.com', username=username,
+        password='secret-42', first_name='Иван', last_name='Петров',
+        **fields
+    )
+
+
+def create_recipe(author, name, amounts=(), tags=(), **fields):
+    '''
+    Creates a recipe with {ingredient: amount} and tags the way the API
+    does: the author's recipes_count and the tag mask are updated.
+    '''
+    recipe = Recipe.objects.create(
+        author=author, name=name, text=fields.pop('text', 'Варить'),
+        cooking_time=fields.pop('cooking_time', 30),
+        image=fields.pop('image', ContentFile(b'image', name='recipe.png')),
+        **fields
+    )
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe, ingredients=ingredient, amount=amount)
+        for ingredient, amount in dict(amounts).items()
+    )
+    RecipeTag.objects.bulk_create(
+        RecipeTag(recipe=recipe, tag=tag) for tag in tags
+    )
+    Recipe.objects.filter(pk=recipe.pk).update_tags_mask()
+    change_counter(User.objects.filter(pk=author.pk), 'recipes_count', 1)
+    author.refresh_from_db(fields=['recipes_count'])
+    recipe.refresh_from_db()
+    return recipe
+
+
+class TemporaryFilesMixin:
+    '''
+    Points MEDIA_ROOT, INGREDIENT_INDEX_PATH and METRICS_DIR
+    at a temporary directory removed after the test case,
+    so tests never write into the repository.
+    '''
+
+    @classmethod
+    def setUpClass(cls):
+        cls.files_dir = tempfile.mkdtemp(prefix='foodgram-tests-')
+        cls.files_settings = override_settings(
+            MEDIA_ROOT=os.path.join(cls.files_dir, 'media'),
+            INGREDIENT_INDEX_PATH=os.path.join(
+                cls.files_dir, 'ingredients.idx'
+            ),
+            METRICS_DIR=os.path.join(cls.files_dir, 'metrics'),
+        )
+        cls.files_settings.enable()
+        try:
+            super().setUpClass()
+        except Exception:
+            cls.remove_files()
+            raise
+
+    @classmethod
+    def tearDownClass(cls):
+        try:
+            super().tearDownClass()
+        finally:
+            cls.remove_files()
+
+    @classmethod
+    def remove_files(cls):
+        cls.files_settings.disable()
+        shutil.rmtree(cls.files_dir, ignore_errors=True)
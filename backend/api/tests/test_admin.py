@@ -0,0 +1,203 @@
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.db.models.fields.files import FieldFile
+from django.test import TestCase
+from django.test.utils import override_settings
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingListItem, Tag)
+from users.models import Subscription
+
+from ..endpoints import NO_CACHES
+from .base import TemporaryFilesMixin
+
+User = get_user_model()
+
+
+@override_settings(CACHES=NO_CACHES, REPLICA_DATABASES=[])
+class AdminCountersTests(TemporaryFilesMixin, TestCase):
+    '''
+    Changes made in the admin keep the counter columns and the
+    shopping lists in sync, as the API does.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            email='admin@example.com', username='admin', password='secret-42'
+        )
+        cls.cook = User.objects.create_user(
+            email='cook@example.com', username='cook', password='secret-42',
+            recipes_count=2
+        )
+        cls.buyer = User.objects.create_user(
+            email='buyer@example.com', username='buyer', password='secret-42'
+        )
+        cls.beet = Ingredient.objects.create(
+            name='Свёкла', measurement_unit='г'
+        )
+        cls.water = Ingredient.objects.create(
+            name='Вода', measurement_unit='мл'
+        )
+        cls.borsch = cls.create_recipe('Борщ', beet=300, water=2)
+        cls.soup = cls.create_recipe('Суп', water=1)
+
+    @classmethod
+    def create_recipe(cls, name, **amounts):
+        recipe = Recipe.objects.create(
+            author=cls.cook, name=name, text='Варить', cooking_time=30,
+            image=ContentFile(b'image', name='recipe.png')
+        )
+        for ingredient, amount in amounts.items():
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredients=getattr(cls, ingredient),
+                amount=amount
+            )
+        return recipe
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def shopping_list(self):
+        return dict(ShoppingListItem.objects.filter(
+            user=self.buyer
+        ).values_list('ingredient__name', 'amount'))
+
+    def counter(self, instance, field):
+        instance.refresh_from_db()
+        return getattr(instance, field)
+
+    def add(self, model, **data):
+        response = self.client.post(
+            f'/admin/recipes/{model}/add/', {'user': self.buyer.pk, **data}
+        )
+        self.assertEqual(response.status_code, 302)
+
+    def delete_selected(self, url, objects):
+        response = self.client.post(url, {
+            'action': 'delete_selected', 'post': 'yes',
+            '_selected_action': [obj.pk for obj in objects],
+        })
+        self.assertEqual(response.status_code, 302)
+
+    def test_shopping_cart(self):
+        self.add('shoppingcart', recipe=self.borsch.pk)
+        self.add('shoppingcart', recipe=self.soup.pk)
+        self.assertEqual(self.counter(self.borsch, 'in_carts_count'), 1)
+        self.assertEqual(self.shopping_list(), {'Свёкла': 300, 'Вода': 3})
+        cart = ShoppingCart.objects.get(recipe=self.soup)
+        response = self.client.post(
+            f'/admin/recipes/shoppingcart/{cart.pk}/change/',
+            {'user': self.admin.pk, 'recipe': self.soup.pk}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.shopping_list(), {'Свёкла': 300, 'Вода': 2})
+        self.assertEqual(self.counter(self.soup, 'in_carts_count'), 1)
+        self.delete_selected(
+            '/admin/recipes/shoppingcart/', ShoppingCart.objects.all()
+        )
+        self.assertEqual(self.shopping_list(), {})
+        self.assertEqual(self.counter(self.borsch, 'in_carts_count'), 0)
+        self.assertEqual(self.counter(self.soup, 'in_carts_count'), 0)
+
+    def test_favorite(self):
+        self.add('favorite', recipe=self.borsch.pk)
+        self.assertEqual(self.counter(self.borsch, 'favorites_count'), 1)
+        favorite = Favorite.objects.get()
+        response = self.client.post(
+            f'/admin/recipes/favorite/{favorite.pk}/change/',
+            {'user': self.buyer.pk, 'recipe': self.soup.pk}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.counter(self.borsch, 'favorites_count'), 0)
+        self.assertEqual(self.counter(self.soup, 'favorites_count'), 1)
+        response = self.client.post(
+            f'/admin/recipes/favorite/{favorite.pk}/delete/', {'post': 'yes'}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.counter(self.soup, 'favorites_count'), 0)
+
+    def test_recipe_ingredients(self):
+        ShoppingCart.objects.create(user=self.buyer, recipe=self.borsch)
+        self.add_to_list(self.borsch)
+        beet = RecipeIngredient.objects.get(ingredients=self.beet)
+        response = self.client.post(
+            f'/admin/recipes/recipeingredient/{beet.pk}/change/',
+            {'recipe': self.borsch.pk, 'ingredients': self.beet.pk,
+             'amount': 500}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.shopping_list(), {'Свёкла': 500, 'Вода': 2})
+        response = self.client.post(
+            f'/admin/recipes/recipeingredient/{beet.pk}/change/',
+            {'recipe': self.soup.pk, 'ingredients': self.beet.pk,
+             'amount': 500}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.shopping_list(), {'Вода': 2})
+        self.delete_selected(
+            '/admin/recipes/recipeingredient/',
+            RecipeIngredient.objects.filter(recipe=self.borsch)
+        )
+        self.assertEqual(self.shopping_list(), {})
+
+    def add_to_list(self, recipe):
+        for ingredient in recipe.recipe_amount.all():
+            ShoppingListItem.objects.create(
+                user=self.buyer, ingredient=ingredient.ingredients,
+                amount=ingredient.amount
+            )
+
+    def change_form_data(self, url):
+        '''POST data of the admin change form with its current values.'''
+        context = self.client.get(url).context
+        forms = [context['adminform'].form]
+        for inline in context['inline_admin_formsets']:
+            forms += [inline.formset.management_form, *inline.formset]
+        data = {}
+        for form in forms:
+            for name in form.fields:
+                value = form[name].value()
+                if value is not None and not isinstance(value, FieldFile):
+                    data[form.add_prefix(name)] = value
+        return data
+
+    def test_recipe_change(self):
+        self.borsch.tags.add(Tag.objects.create(
+            name='Обед', color='#E26C2D', slug='lunch'
+        ))
+        ShoppingCart.objects.create(user=self.buyer, recipe=self.borsch)
+        self.add_to_list(self.borsch)
+        url = f'/admin/recipes/recipe/{self.borsch.pk}/change/'
+        data = self.change_form_data(url)
+        for prefix in ('recipe_amount-0', 'recipe_amount-1'):
+            if data[f'{prefix}-ingredients'] == self.beet.pk:
+                data[f'{prefix}-amount'] = 100
+        data['author'] = self.buyer.pk
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.shopping_list(), {'Свёкла': 100, 'Вода': 2})
+        self.assertEqual(self.counter(self.cook, 'recipes_count'), 1)
+        self.assertEqual(self.counter(self.buyer, 'recipes_count'), 1)
+
+    def test_recipe_delete(self):
+        ShoppingCart.objects.create(user=self.buyer, recipe=self.borsch)
+        self.add_to_list(self.borsch)
+        response = self.client.post(
+            f'/admin/recipes/recipe/{self.borsch.pk}/delete/', {'post': 'yes'}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.shopping_list(), {})
+        self.assertEqual(self.counter(self.cook, 'recipes_count'), 1)
+        self.delete_selected('/admin/recipes/recipe/', [self.soup])
+        self.assertEqual(self.counter(self.cook, 'recipes_count'), 0)
+
+    def test_subscription(self):
+        response = self.client.post('/admin/users/subscription/add/', {
+            'user': self.buyer.pk, 'author': self.cook.pk
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.counter(self.cook, 'followers_count'), 1)
+        self.delete_selected(
+            '/admin/users/subscription/', Subscription.objects.all()
+        )
+        self.assertEqual(self.counter(self.cook, 'followers_count'), 0)
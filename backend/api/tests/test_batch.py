@@ -0,0 +1,107 @@
+from django.test.utils import override_settings
+from recipes.models import Favorite, Ingredient, ShoppingListItem
+from rest_framework.test import APITestCase
+
+from ..endpoints import NO_CACHES
+from ..serializers import BATCH_MAX_RECIPES
+from .base import TemporaryFilesMixin, create_recipe, create_user
+
+
+@override_settings(CACHES=NO_CACHES, REPLICA_DATABASES=[])
+class BatchEndpointTests(TemporaryFilesMixin, APITestCase):
+    '''
+    POST and DELETE on /api/recipes/favorite/ and
+    /api/recipes/shopping_cart/ report a status for every recipe id.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('buyer')
+        author = create_user('cook')
+        beet = Ingredient.objects.create(name='Свёкла', measurement_unit='г')
+        water = Ingredient.objects.create(name='Вода', measurement_unit='мл')
+        cls.borsch = create_recipe(author, 'Борщ', {beet: 300, water: 2})
+        cls.soup = create_recipe(author, 'Суп', {water: 1})
+        cls.salad = create_recipe(author, 'Салат', {beet: 100})
+        cls.missing = cls.salad.id + 100
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def send(self, method, path, recipe_ids):
+        response = getattr(self.client, method)(
+            path, {'recipes': recipe_ids}, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        return [
+            (result['id'], result['status'])
+            for result in response.data['results']
+        ]
+
+    def counts(self, field):
+        counts = []
+        for recipe in (self.borsch, self.soup, self.salad):
+            recipe.refresh_from_db()
+            counts.append(getattr(recipe, field))
+        return counts
+
+    def test_favorite(self):
+        path = '/api/recipes/favorite/'
+        borsch, soup, salad = self.borsch.id, self.soup.id, self.salad.id
+        self.assertEqual(
+            self.send('post', path, [borsch, soup, self.missing, borsch]),
+            [(borsch, 'added'), (soup, 'added'),
+             (self.missing, 'not found')]
+        )
+        self.assertEqual(
+            self.send('post', path, [soup, salad]),
+            [(soup, 'already added'), (salad, 'added')]
+        )
+        self.assertEqual(self.counts('favorites_count'), [1, 1, 1])
+        self.assertEqual(
+            self.send('delete', path, [borsch, self.missing, salad]),
+            [(borsch, 'removed'), (self.missing, 'not found'),
+             (salad, 'removed')]
+        )
+        self.assertEqual(
+            self.send('delete', path, [borsch]), [(borsch, 'not added')]
+        )
+        self.assertEqual(self.counts('favorites_count'), [0, 1, 0])
+        self.assertEqual(
+            list(Favorite.objects.values_list('user', 'recipe')),
+            [(self.user.id, soup)]
+        )
+
+    def test_shopping_cart(self):
+        path = '/api/recipes/shopping_cart/'
+        self.send('post', path, [self.borsch.id, self.soup.id])
+        self.assertEqual(self.shopping_list(), {'Свёкла': 300, 'Вода': 3})
+        self.assertEqual(
+            self.send('post', path, [self.soup.id, self.salad.id]),
+            [(self.soup.id, 'already added'), (self.salad.id, 'added')]
+        )
+        self.assertEqual(self.shopping_list(), {'Свёкла': 400, 'Вода': 3})
+        self.assertEqual(self.counts('in_carts_count'), [1, 1, 1])
+        self.send('delete', path, [self.borsch.id, self.soup.id])
+        self.assertEqual(self.shopping_list(), {'Свёкла': 100})
+        self.assertEqual(self.counts('in_carts_count'), [0, 0, 1])
+
+    def shopping_list(self):
+        return dict(ShoppingListItem.objects.filter(
+            user=self.user
+        ).values_list('ingredient__name', 'amount'))
+
+    def test_validation(self):
+        path = '/api/recipes/favorite/'
+        for data in (
+            {'recipes': []}, {'recipes': ['борщ']}, {},
+            {'recipes': list(range(1, BATCH_MAX_RECIPES + 2))},
+        ):
+            with self.subTest(data=data):
+                response = self.client.post(path, data, format='json')
+                self.assertEqual(response.status_code, 400)
+        self.client.force_authenticate(None)
+        response = self.client.post(
+            path, {'recipes': [self.borsch.id]}, format='json'
+        )
+        self.assertEqual(response.status_code, 401)
@@ -0,0 +1,76 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test.utils import override_settings
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from rest_framework.test import APITestCase
+from users.models import Subscription
+
+from ..endpoints import NO_CACHES, recipe_payload
+from .base import TemporaryFilesMixin, create_recipe, create_user
+
+
+@override_settings(CACHES=NO_CACHES, REPLICA_DATABASES=[])
+class CounterTests(TemporaryFilesMixin, APITestCase):
+    '''
+    The API keeps the counter columns of recipes and users in step with
+    the rows they count; reconcile_counters finds and repairs drift.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('buyer')
+        cls.author = create_user('cook')
+        Tag.objects.create(name='Обед', color='#E26C2D', slug='lunch')
+        cls.beet = Ingredient.objects.create(
+            name='Свёкла', measurement_unit='г'
+        )
+
+    def counter(self, instance, field):
+        instance.refresh_from_db()
+        return getattr(instance, field)
+
+    def reconcile(self, *args):
+        output = StringIO()
+        call_command('reconcile_counters', *args, stdout=output)
+        return output.getvalue().splitlines()
+
+    def test_recipe_create_and_delete(self):
+        self.client.force_authenticate(self.author)
+        response = self.client.post(
+            '/api/recipes/', recipe_payload(), format='json'
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(self.counter(self.author, 'recipes_count'), 1)
+        response = self.client.delete(f'/api/recipes/{response.data["id"]}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.counter(self.author, 'recipes_count'), 0)
+
+    def test_subscriptions_read_the_columns(self):
+        create_recipe(self.author, 'Борщ', {self.beet: 300})
+        self.client.force_authenticate(self.user)
+        self.client.post(f'/api/users/{self.author.pk}/subscribe/')
+        self.assertEqual(self.counter(self.author, 'followers_count'), 1)
+        response = self.client.get('/api/users/subscriptions/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['recipes_count'], 1)
+
+    def test_reconcile(self):
+        recipe = create_recipe(self.author, 'Борщ', {self.beet: 300})
+        Favorite.objects.create(user=self.user, recipe=recipe)
+        ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        Subscription.objects.create(user=self.user, author=self.author)
+        Recipe.objects.filter(pk=recipe.pk).update(in_carts_count=5)
+        self.assertEqual(self.reconcile(), [
+            f'recipe={recipe.pk} favorites_count: expected 1, stored 0',
+            f'recipe={recipe.pk} in_carts_count: expected 1, stored 5',
+            f'customuser={self.author.pk} followers_count: '
+            f'expected 1, stored 0',
+            'Mismatched counters: 3.',
+        ])
+        self.assertEqual(self.counter(recipe, 'in_carts_count'), 5)
+        self.reconcile('--fix')
+        self.assertEqual(self.reconcile(), ['Mismatched counters: 0.'])
+        self.assertEqual(self.counter(recipe, 'favorites_count'), 1)
+        self.assertEqual(self.counter(recipe, 'in_carts_count'), 1)
+        self.assertEqual(self.counter(self.author, 'followers_count'), 1)
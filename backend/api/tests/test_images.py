@@ -0,0 +1,105 @@
+import base64
+import io
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.test.utils import override_settings
+from PIL import Image
+from recipes.models import ImageVariantJob, Ingredient, Recipe, Tag
+from rest_framework.test import APITransactionTestCase
+
+from ..endpoints import NO_CACHES, recipe_payload
+from ..serializers import RecipeCreateUpdateSerializer
+from ..tasks import run_worker
+from .base import TemporaryFilesMixin, create_recipe, create_user
+
+
+def image_data(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), color).save(buffer, 'PNG')
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+@override_settings(CACHES=NO_CACHES, REPLICA_DATABASES=[])
+class ImageVariantTests(TemporaryFilesMixin, APITransactionTestCase):
+    '''
+    A new or replaced image queues a variant job; a replaced image
+    and its variants are deleted once the change is committed.
+    '''
+
+    def setUp(self):
+        self.user = create_user('cook')
+        Tag.objects.create(name='Обед', color='#E26C2D', slug='lunch')
+        Ingredient.objects.create(name='Свёкла', measurement_unit='г')
+        self.client.force_authenticate(self.user)
+        response = self.client.post(
+            '/api/recipes/', recipe_payload(), format='json'
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.recipe = Recipe.objects.get(pk=response.data['id'])
+
+    def files(self, recipe):
+        return [recipe.image.name] + [
+            getattr(recipe, field).name
+            for field in settings.RECIPE_IMAGE_VARIANTS
+        ]
+
+    def exists(self, names):
+        return [default_storage.exists(name) for name in names]
+
+    def render(self):
+        self.assertEqual(run_worker(once=True), 1)
+        self.recipe.refresh_from_db()
+        return self.files(self.recipe)
+
+    def replace_image(self, color):
+        response = self.client.patch(
+            f'/api/recipes/{self.recipe.pk}/',
+            {**recipe_payload(), 'image': image_data(color)}, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.recipe.refresh_from_db()
+
+    def test_create_queues_a_job(self):
+        self.assertEqual(self.recipe.image_thumbnail.name, '')
+        self.assertTrue(ImageVariantJob.objects.filter(
+            recipe=self.recipe, status=ImageVariantJob.PENDING
+        ).exists())
+        self.assertEqual(self.exists(self.render()), [True] * 3)
+
+    def test_replaced_image_is_deleted(self):
+        old_files = self.render()
+        self.replace_image('navy')
+        self.assertEqual(self.exists(old_files), [False] * 3)
+        self.assertEqual(self.recipe.image_thumbnail.name, '')
+        self.assertEqual(self.recipe.image_webp.name, '')
+        self.assertTrue(default_storage.exists(self.recipe.image.name))
+        new_files = self.render()
+        self.assertEqual(self.exists(new_files), [True] * 3)
+        self.assertNotEqual(new_files[0], old_files[0])
+
+    def test_same_image_is_kept(self):
+        old_files = self.render()
+        self.replace_image('orange')
+        self.assertEqual(self.files(self.recipe), old_files)
+        self.assertEqual(self.exists(old_files), [True] * 3)
+        self.assertFalse(ImageVariantJob.objects.exists())
+
+    def test_shared_image_is_kept(self):
+        old_files = self.render()
+        create_recipe(self.user, 'Копия', image=self.recipe.image.name)
+        self.replace_image('navy')
+        self.assertEqual(self.exists(old_files), [True] * 3)
+
+    def test_rolled_back_replacement_keeps_the_image(self):
+        old_files = self.render()
+        serializer = RecipeCreateUpdateSerializer(
+            self.recipe, data={'image': image_data('navy')}, partial=True
+        )
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            serializer.save()
+            raise RuntimeError
+        self.assertEqual(self.exists(old_files), [True] * 3)
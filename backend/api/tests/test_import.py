@@ -0,0 +1,115 @@
+import json
+import os
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.test.utils import override_settings
+from recipes.models import Ingredient, Recipe, Tag
+
+from ..endpoints import NO_CACHES, sample_image
+from .base import TemporaryFilesMixin, create_user
+
+
+@override_settings(CACHES=NO_CACHES, REPLICA_DATABASES=[])
+class ImportTests(TemporaryFilesMixin, TestCase):
+    '''
+    The import commands report how many rows they inserted, updated,
+    left unchanged and skipped, and can be rerun with the same file.
+    '''
+
+    def write(self, name, content):
+        path = os.path.join(self.files_dir, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def write_json(self, name, items):
+        return self.write(name, json.dumps(items, ensure_ascii=False))
+
+    def call(self, command, *args):
+        output, errors = StringIO(), StringIO()
+        call_command(command, *args, stdout=output, stderr=errors)
+        report = output.getvalue().strip().split('. ', 1)[1]
+        return report, errors.getvalue().splitlines()
+
+    def test_ingredients(self):
+        Ingredient.objects.create(name='Свёкла', measurement_unit='г')
+        path = self.write('ingredients.csv', '\n'.join((
+            'name,measurement_unit',
+            'Свёкла,г', 'Вода,мл', 'Вода,мл',
+            ',г', f'{"я" * 201},г',
+            'Соль,г', 'Вода,мл',
+        )))
+        for report in (
+            'Inserted: 2, updated: 0, unchanged: 2, skipped: 3.',
+            'Inserted: 0, updated: 0, unchanged: 4, skipped: 3.',
+        ):
+            self.assertEqual(
+                self.call('import_ingredients', path, '--batch-size', '3'),
+                (report, [])
+            )
+        self.assertEqual(
+            sorted(Ingredient.objects.values_list('name', flat=True)),
+            ['Вода', 'Свёкла', 'Соль']
+        )
+
+    def test_ingredients_fixture(self):
+        path = self.write_json('ingredients.json', [
+            {'model': 'recipes.ingredient',
+             'fields': {'name': 'Вода', 'measurement_unit': 'мл'}},
+            {'model': 'recipes.tag', 'fields': {'name': 'Обед'}},
+            {'name': 'Соль', 'measurement_unit': 'г'},
+        ])
+        self.assertEqual(self.call('import_ingredients', path), (
+            'Inserted: 2, updated: 0, unchanged: 0, skipped: 0.', []
+        ))
+
+    def test_tags(self):
+        Tag.objects.create(name='Ужин', color='#8775D2', slug='dinner')
+        Tag.objects.create(name='Обед', color='#E26C2D', slug='lunch')
+        path = self.write_json('tags.json', [
+            {'name': 'Завтрак', 'color': '#49B64E', 'slug': 'breakfast'},
+            {'name': 'Обед', 'color': '#E26C2D', 'slug': 'lunch'},
+            {'name': 'Ужин', 'color': '#000000', 'slug': 'dinner'},
+            {'name': 'Десерт', 'color': '#FFFFFF'},
+        ])
+        report, errors = self.call('import_tags', path)
+        self.assertEqual(
+            report, 'Inserted: 1, updated: 1, unchanged: 1, skipped: 1.'
+        )
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(Tag.objects.get(slug='dinner').color, '#000000')
+
+    def test_recipes(self):
+        create_user('cook')
+        Tag.objects.create(name='Обед', color='#E26C2D', slug='lunch')
+        Ingredient.objects.create(name='Свёкла', measurement_unit='г')
+        recipe = {
+            'author': 'cook@example.com', 'name': 'Борщ', 'text': 'Варить',
+            'cooking_time': 90, 'image': sample_image(), 'tags': ['lunch'],
+            'ingredients': [
+                {'name': 'Свёкла', 'measurement_unit': 'г', 'amount': 300},
+            ],
+        }
+        path = self.write_json('recipes.json', [
+            recipe,
+            {**recipe, 'author': 'nobody'},
+            {**recipe, 'name': 'Суп', 'ingredients': [
+                {'name': 'Вода', 'measurement_unit': 'мл', 'amount': 1},
+            ]},
+        ])
+        report, errors = self.call('import_recipes', path)
+        self.assertEqual(
+            report, 'Inserted: 1, updated: 0, unchanged: 0, skipped: 2.'
+        )
+        self.assertEqual(len(errors), 2)
+        report, _ = self.call('import_recipes', path)
+        self.assertEqual(
+            report, 'Inserted: 0, updated: 0, unchanged: 1, skipped: 2.'
+        )
+        path = self.write_json('recipes.json', [{**recipe, 'text': 'Тушить'}])
+        self.assertEqual(self.call('import_recipes', path), (
+            'Inserted: 0, updated: 1, unchanged: 0, skipped: 0.', []
+        ))
+        self.assertEqual(Recipe.objects.get().text, 'Тушить')
@@ -0,0 +1,31 @@
+import os
+
+from django.conf import settings
+from django.test import TestCase
+from recipes.models import Ingredient
+
+from ..search import IngredientIndex, build_index, get_ingredient_index
+from .base import TemporaryFilesMixin
+
+
+class IngredientIndexTests(TemporaryFilesMixin, TestCase):
+
+    def test_search_ranking(self):
+        path = os.path.join(self.files_dir, 'ranking.idx')
+        build_index([
+            (1, 'Сахарная пудра', 'г'), (2, 'Сахар', 'г'),
+            (3, 'Тростниковый сахар', 'г'), (4, 'Сахр', 'кг'),
+            (5, 'Соль', 'г'),
+        ], path)
+        names = [row['name'] for row in IngredientIndex(path).search('сахар')]
+        self.assertEqual(
+            names, ['Сахар', 'Сахарная пудра', 'Тростниковый сахар', 'Сахр']
+        )
+
+    def test_uncommitted_ingredients_are_not_written(self):
+        Ingredient.objects.create(name='Свёкла', measurement_unit='г')
+        index = get_ingredient_index()
+        self.assertEqual(
+            [row['name'] for row in index.search('свёк')], ['Свёкла']
+        )
+        self.assertFalse(os.path.exists(settings.INGREDIENT_INDEX_PATH))
@@ -0,0 +1,81 @@
+from datetime import timedelta
+
+from django.test.utils import override_settings
+from django.utils import timezone
+from recipes.models import Recipe
+from rest_framework.test import APITestCase
+
+from ..endpoints import NO_CACHES
+from .base import TemporaryFilesMixin, create_recipe, create_user
+
+
+@override_settings(CACHES=NO_CACHES, REPLICA_DATABASES=[])
+class KeysetPaginationTests(TemporaryFilesMixin, APITestCase):
+    '''
+    With ?cursor= the recipe and user lists are paginated by keyset:
+    next and previous links walk the ordering without gaps or repeats,
+    rows sharing the first ordering value included.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('cook')
+        now = timezone.now()
+        cls.recipes = []
+        for number, hours in enumerate((5, 4, 4, 4, 2, 1)):
+            recipe = create_recipe(cls.user, f'Рецепт {number}')
+            Recipe.objects.filter(pk=recipe.pk).update(
+                pub_date=now - timedelta(hours=hours)
+            )
+            cls.recipes.append(recipe.pk)
+        cls.ordered = cls.recipes[::-1]
+        cls.ordered[2:5] = sorted(cls.recipes[1:4], reverse=True)
+        for name in ('anna', 'boris', 'vera', 'gleb'):
+            create_user(name)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def walk(self, url, key):
+        pages = []
+        data = self.get(url)
+        self.assertIsNone(data['previous'])
+        self.assertNotIn('count', data)
+        while True:
+            pages.append([row[key] for row in data['results']])
+            if data['next'] is None:
+                break
+            data = self.get(data['next'])
+        backwards = []
+        while data['previous'] is not None:
+            data = self.get(data['previous'])
+            backwards.append([row[key] for row in data['results']])
+        self.assertEqual(backwards, pages[-2::-1])
+        return pages
+
+    def test_recipes(self):
+        pages = self.walk('/api/recipes/?cursor=&limit=2', 'id')
+        self.assertEqual(pages, [
+            self.ordered[0:2], self.ordered[2:4], self.ordered[4:6]
+        ])
+
+    def test_users(self):
+        pages = self.walk('/api/users/?cursor=&limit=3', 'username')
+        self.assertEqual(pages, [['anna', 'boris', 'cook'], ['gleb', 'vera']])
+
+    def test_page_pagination_is_kept(self):
+        data = self.get('/api/recipes/?limit=2')
+        self.assertEqual(data['count'], 6)
+        data = self.get('/api/recipes/?cursor=&limit=2&search=рецепт')
+        self.assertIn('count', data)
+
+    def test_invalid_cursor(self):
+        for cursor in ('nonsense', 'eyJ2IjogWzFdLCAiciI6IDB9'):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(f'/api/recipes/?cursor={cursor}')
+                self.assertEqual(response.status_code, 404)
@@ -0,0 +1,61 @@
+from django.contrib.auth import get_user_model
+from django.test.utils import override_settings
+from rest_framework.test import APITestCase
+
+from ..endpoints import NO_CACHES
+from .base import TemporaryFilesMixin
+
+User = get_user_model()
+
+
+@override_settings(CACHES=NO_CACHES, REPLICA_DATABASES=[])
+class ServerTimingTests(TemporaryFilesMixin, APITestCase):
+
+    def test_hidden_from_users(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/tags/'))
+        self.client.force_authenticate(User.objects.create_user(
+            email='cook@example.com', username='cook', password='secret-42'
+        ))
+        self.assertNotIn('Server-Timing', self.client.get('/api/tags/'))
+
+    def test_sent_to_staff(self):
+        self.client.force_authenticate(User.objects.create_user(
+            email='admin@example.com', username='admin',
+            password='secret-42', is_staff=True
+        ))
+        timing = self.client.get('/api/tags/')['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn('total;dur=', timing)
+
+    @override_settings(SERVER_TIMING=True)
+    def test_setting(self):
+        response = self.client.get('/api/tags/')
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+
+@override_settings(CACHES=NO_CACHES, REPLICA_DATABASES=[],
+                   METRICS_TOKEN='scrape-42')
+class MetricsViewTests(TemporaryFilesMixin, APITestCase):
+
+    def test_loopback(self):
+        self.client.get('/api/tags/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'http_requests_total{route="', response.content)
+
+    def test_remote_address_needs_token(self):
+        remote = {'REMOTE_ADDR': '172.18.0.5'}
+        self.assertEqual(self.client.get('/metrics', **remote).status_code,
+                         403)
+        self.assertEqual(self.client.get(
+            '/metrics', HTTP_AUTHORIZATION='Bearer wrong', **remote
+        ).status_code, 403)
+        self.assertEqual(self.client.get(
+            '/metrics', HTTP_AUTHORIZATION='Bearer scrape-42', **remote
+        ).status_code, 200)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_empty_token_is_refused(self):
+        self.assertEqual(self.client.get(
+            '/metrics', HTTP_AUTHORIZATION='Bearer ', REMOTE_ADDR='10.0.0.2'
+        ).status_code, 403)
@@ -0,0 +1,171 @@
+import os
+import re
+import zlib
+from unittest import skipIf
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test.utils import override_settings
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+from rest_framework.test import APITestCase
+
+from ..endpoints import NO_CACHES
+from ..pdf import LINES_PER_PAGE, stream_pdf
+from ..services import TITLE
+from ..truetype import TrueTypeFont, load_font
+from .base import TemporaryFilesMixin
+
+User = get_user_model()
+skip_without_font = skipIf(
+    not os.path.exists(settings.PDF_FONT_PATH), 'The PDF font is missing.'
+)
+
+
+def parse_pdf(data):
+    '''
+    Returns {object id: (dictionary, stream)} of a PDF document,
+    reading every object at the offset given by its xref entry.
+    '''
+    xref = int(data.rsplit(b'startxref\n', 1)[1].split()[0])
+    assert data[xref:].startswith(b'xref\n0 ')
+    size = int(data[xref:].split(b'\n')[1].split()[1])
+    entries = data[xref:].split(b'\n')[3:2 + size]
+    objects = {}
+    for object_id, entry in enumerate(entries, 1):
+        offset = int(entry.split()[0])
+        header = f'{object_id} 0 obj\n'.encode('ascii')
+        assert data[offset:].startswith(header), object_id
+        start = offset + len(header)
+        end = data.index(b'>>', start) + 2
+        while data.count(b'<<', start, end) > data.count(b'>>', start, end):
+            end = data.index(b'>>', end) + 2
+        dictionary = data[start:end].decode('ascii')
+        stream = None
+        if data[end:].startswith(b'\nstream\n'):
+            length = int(re.search(r'/Length (\d+)', dictionary).group(1))
+            stream = data[end + 8:end + 8 + length]
+            if '/FlateDecode' in dictionary:
+                stream = zlib.decompress(stream)
+        objects[object_id] = (dictionary, stream)
+    return objects
+
+
+def reference(dictionary, key):
+    return int(re.search(rf'/{key} \[?(\d+) 0 R', dictionary).group(1))
+
+
+def extract_lines(objects):
+    '''Decodes the text of every page through the ToUnicode CMap.'''
+    cmap = objects[reference(objects[3][0], 'ToUnicode')][1].decode('ascii')
+    chars = {
+        int(glyph, 16): bytes.fromhex(text).decode('utf-16-be')
+        for glyph, text in re.findall(
+            r'<([0-9A-F]{4})> <([0-9A-F]+)>', cmap
+        )
+    }
+    kids = re.findall(r'(\d+) 0 R', objects[2][0])
+    lines = []
+    for page_id in kids:
+        content = objects[reference(objects[int(page_id)][0], 'Contents')]
+        for encoded in re.findall(rb'<([0-9A-F]*)> Tj', content[1]):
+            lines.append(''.join(
+                chars[int(encoded[i:i + 4], 16)]
+                for i in range(0, len(encoded), 4)
+            ))
+    return len(kids), lines
+
+
+@override_settings(CACHES=NO_CACHES, REPLICA_DATABASES=[])
+class PDFTests(TemporaryFilesMixin, APITestCase):
+
+    def render(self, lines):
+        return b''.join(
+            stream_pdf(iter(lines), load_font(settings.PDF_FONT_PATH))
+        )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='cook@example.com', username='cook', password='secret-42',
+            first_name='Иван', last_name='Петров'
+        )
+        recipe = Recipe.objects.create(
+            author=cls.user, name='Борщ', text='Варить', cooking_time=90,
+            image=ContentFile(b'image', name='borsch.png')
+        )
+        for name, unit, amount in (('Свёкла', 'г', 300), ('Вода', 'мл', 2)):
+            RecipeIngredient.objects.create(
+                recipe=recipe, amount=amount,
+                ingredients=Ingredient.objects.create(
+                    name=name, measurement_unit=unit
+                )
+            )
+        cls.recipe = recipe
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    @override_settings(PDF_FONT_PATH='/nonexistent/font.ttf')
+    def test_missing_font(self):
+        self.client.post(f'/api/recipes/{self.recipe.pk}/shopping_cart/')
+        with self.assertLogs('api.pdf', 'ERROR'):
+            response = self.client.get(
+                '/api/recipes/download_shopping_cart/?format=pdf'
+            )
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.streaming)
+
+    @override_settings(PDF_FONT_PATH=__file__)
+    def test_invalid_font(self):
+        self.client.post(f'/api/recipes/{self.recipe.pk}/shopping_cart/')
+        with self.assertLogs('api.pdf', 'ERROR'):
+            response = self.client.get(
+                '/api/recipes/download_shopping_cart/?format=pdf'
+            )
+        self.assertEqual(response.status_code, 503)
+
+    @skip_without_font
+    def test_shopping_list_round_trip(self):
+        self.client.post(f'/api/recipes/{self.recipe.pk}/shopping_cart/')
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/?format=pdf'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        objects = parse_pdf(b''.join(response.streaming_content))
+        self.assertEqual(
+            extract_lines(objects),
+            (1, [TITLE, '', 'Вода: 2 мл', 'Свёкла: 300 г'])
+        )
+
+    @skip_without_font
+    def test_pages(self):
+        lines = [f'Строка {number}' for number in range(LINES_PER_PAGE + 1)]
+        objects = parse_pdf(self.render(lines))
+        self.assertIn('/Count 2', objects[2][0])
+        self.assertEqual(extract_lines(objects), (2, lines))
+        self.assertEqual(extract_lines(parse_pdf(self.render([]))), (1, []))
+
+    @skip_without_font
+    def test_unknown_characters(self):
+        objects = parse_pdf(self.render(['Суп \U0001F372']))
+        self.assertEqual(extract_lines(objects)[1], ['Суп ?'])
+
+    @skip_without_font
+    def test_embedded_subset(self):
+        font = load_font(settings.PDF_FONT_PATH)
+        objects = parse_pdf(self.render(['Щи']))
+        descriptor = objects[reference(
+            objects[reference(objects[3][0], 'DescendantFonts')][0],
+            'FontDescriptor'
+        )][0]
+        subset = TrueTypeFont(objects[reference(descriptor, 'FontFile2')][1])
+        used = {font.glyph(char) for char in 'Щи'}
+        self.assertEqual(subset.glyph_count, font.glyph_count)
+        for glyph in used:
+            self.assertEqual(subset.glyph_data(glyph), font.glyph_data(glyph))
+        unused = font.glyph('Ж')
+        self.assertTrue(font.glyph_data(unused))
+        self.assertFalse(subset.glyph_data(unused))
+        self.assertNotIn(b'cmap', subset.tables)
@@ -0,0 +1,253 @@
+import threading
+from unittest import mock
+
+import psycopg2
+from django.test import SimpleTestCase
+from psycopg2.extensions import (TRANSACTION_STATUS_IDLE,
+                                 TRANSACTION_STATUS_INERROR,
+                                 TRANSACTION_STATUS_INTRANS)
+
+from backend.db.base import DatabaseWrapper
+from backend.db.pool import ConnectionPool, close_pools, pool_stats, pools
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class FakeCursor:
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql):
+        self.connection.queries.append(sql)
+        if self.connection.broken:
+            raise psycopg2.OperationalError('server closed the connection')
+
+
+class FakeConnection:
+    '''Stands for a psycopg2 connection without a server.'''
+
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.status = TRANSACTION_STATUS_IDLE
+        self.queries = []
+        self.rollbacks = 0
+        self.isolation_level = None
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        if self.broken:
+            raise psycopg2.InterfaceError('connection already closed')
+        self.rollbacks += 1
+        self.status = TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('backend.db.pool.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.opened = []
+
+    def connect(self):
+        connection = FakeConnection()
+        self.opened.append(connection)
+        return connection
+
+    def make_pool(self, **options):
+        return ConnectionPool(self.connect, **{
+            'max_size': 2, 'timeout': 0, 'max_lifetime': 100,
+            'max_idle': 50, 'check_after': 1, **options,
+        })
+
+    def test_checkout_reuses_returned_connection(self):
+        pool = self.make_pool()
+        first = pool.getconn()
+        self.assertEqual(pool.stats()['in_use'], 1)
+        pool.putconn(first)
+        self.assertEqual(pool.stats()['idle'], 1)
+        self.assertIs(pool.getconn(), first)
+        stats = pool.stats()
+        self.assertEqual((stats['created'], stats['checkouts']), (1, 2))
+        self.assertEqual((stats['size'], stats['in_use']), (1, 1))
+        self.assertEqual(first.queries, [])
+
+    def test_last_in_first_out(self):
+        pool = self.make_pool()
+        first, second = pool.getconn(), pool.getconn()
+        pool.putconn(first)
+        pool.putconn(second)
+        self.assertIs(pool.getconn(), second)
+
+    def test_open_transaction_is_rolled_back(self):
+        pool = self.make_pool()
+        connection = pool.getconn()
+        connection.status = TRANSACTION_STATUS_INTRANS
+        pool.putconn(connection)
+        self.assertEqual(connection.rollbacks, 1)
+        self.assertIs(pool.getconn(), connection)
+
+    def test_broken_connection_is_discarded_on_return(self):
+        pool = self.make_pool()
+        connection = pool.getconn()
+        connection.status = TRANSACTION_STATUS_INERROR
+        connection.broken = True
+        pool.putconn(connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['size'], 0)
+        self.assertIsNot(pool.getconn(), connection)
+
+    def test_closed_connection_is_discarded_on_return(self):
+        pool = self.make_pool()
+        connection = pool.getconn()
+        connection.closed = 2
+        pool.putconn(connection)
+        self.assertEqual(pool.stats()['size'], 0)
+        self.assertEqual(pool.stats()['closed'], 1)
+
+    def test_failed_health_check_opens_new_connection(self):
+        pool = self.make_pool()
+        connection = pool.getconn()
+        pool.putconn(connection)
+        connection.broken = True
+        self.clock.now += 1
+        replacement = pool.getconn()
+        self.assertIsNot(replacement, connection)
+        self.assertEqual(connection.queries, ['SELECT 1'])
+        self.assertTrue(connection.closed)
+        stats = pool.stats()
+        self.assertEqual(stats['failed_health_checks'], 1)
+        self.assertEqual((stats['size'], stats['created']), (1, 2))
+
+    def test_expired_connections_are_closed(self):
+        pool = self.make_pool()
+        connection = pool.getconn()
+        self.clock.now += 100
+        pool.putconn(connection)
+        self.assertTrue(connection.closed)
+        idle, busy = pool.getconn(), pool.getconn()
+        pool.putconn(idle)
+        pool.putconn(busy)
+        self.clock.now += 50
+        self.assertIs(pool.getconn(), busy)
+        pool.putconn(busy)
+        self.assertTrue(idle.closed)
+        self.assertFalse(busy.closed)
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_timeout_when_all_connections_are_busy(self):
+        pool = self.make_pool(max_size=1)
+        pool.getconn()
+        with self.assertRaises(psycopg2.OperationalError):
+            pool.getconn()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_waiting_request_gets_returned_connection(self):
+        pool = ConnectionPool(self.connect, max_size=1, timeout=10,
+                              max_lifetime=100, max_idle=50, check_after=1)
+        connection = pool.getconn()
+        taken = []
+        waiter = threading.Thread(target=lambda: taken.append(pool.getconn()))
+        waiter.start()
+        while not pool.stats()['waiting']:
+            waiter.join(0.01)
+        pool.putconn(connection)
+        waiter.join(5)
+        self.assertEqual(taken, [connection])
+        self.assertEqual(len(self.opened), 1)
+
+    def test_failed_connect_frees_the_slot(self):
+        pool = ConnectionPool(mock.Mock(side_effect=psycopg2.OperationalError),
+                              max_size=1, timeout=0, max_lifetime=100,
+                              max_idle=50, check_after=1)
+        for _ in range(2):
+            with self.assertRaises(psycopg2.OperationalError):
+                pool.getconn()
+        self.assertEqual(pool.stats()['size'], 0)
+
+    def test_close(self):
+        pool = self.make_pool()
+        idle, in_use = pool.getconn(), pool.getconn()
+        pool.putconn(idle)
+        pool.close()
+        self.assertTrue(idle.closed)
+        self.assertFalse(in_use.closed)
+        pool.putconn(in_use)
+        self.assertTrue(in_use.closed)
+        self.assertEqual(pool.stats()['size'], 0)
+
+
+@mock.patch('backend.db.base.connect', lambda **params: FakeConnection())
+class DatabaseWrapperPoolTests(SimpleTestCase):
+    '''Pools are per process, so a forked worker never shares sockets.'''
+
+    def setUp(self):
+        self.wrapper = DatabaseWrapper(
+            {
+                'ENGINE': 'backend.db', 'NAME': 'foodgram', 'USER': '',
+                'PASSWORD': '', 'HOST': '', 'PORT': '', 'OPTIONS': {},
+                'AUTOCOMMIT': True, 'ATOMIC_REQUESTS': False,
+                'CONN_MAX_AGE': 0, 'TIME_ZONE': None, 'TEST': {},
+                'POOL': {'MAX_SIZE': 3},
+            },
+            'pool-tests',
+        )
+        self.addCleanup(close_pools, 'pool-tests')
+        self.addCleanup(self.forget_pools)
+
+    def forget_pools(self):
+        for key in [key for key in pools if key[1] == 'pool-tests']:
+            pools.pop(key).close()
+
+    def test_pool_is_shared_within_a_process(self):
+        params = {'database': 'foodgram'}
+        pool = self.wrapper.get_pool(params)
+        self.assertIs(self.wrapper.get_pool(dict(params)), pool)
+        self.assertEqual(pool.max_size, 3)
+        self.assertEqual(pool.timeout, 10)
+
+    def test_forked_process_gets_its_own_pool(self):
+        params = {'database': 'foodgram'}
+        parent = self.wrapper.get_pool(params)
+        inherited = parent.getconn()
+        parent.putconn(inherited)
+        with mock.patch('os.getpid', return_value=-1):
+            child = self.wrapper.get_pool(params)
+            self.assertIsNot(child, parent)
+            self.assertIsNot(child.getconn(), inherited)
+            self.assertEqual(pool_stats()['pool-tests']['in_use'], 1)
+        self.assertEqual(pool_stats()['pool-tests']['idle'], 1)
+        self.assertFalse(inherited.closed)
+
+    def test_close_returns_connection_to_pool(self):
+        self.wrapper.connection = self.wrapper.get_new_connection(
+            {'database': 'foodgram'}
+        )
+        connection = self.wrapper.connection
+        self.wrapper._close()
+        self.assertFalse(connection.closed)
+        self.assertIs(self.wrapper.pool.getconn(), connection)
@@ -0,0 +1,48 @@
+from django.test.utils import override_settings
+from rest_framework.test import APIClient, APITestCase
+
+from ..endpoints import NO_CACHES, sample_requests, sample_user, send
+from ..seed import seed_database
+from ..views import CustomUserViewSet, RecipeViewSet
+from .base import TemporaryFilesMixin
+
+
+@override_settings(
+    CACHES=NO_CACHES, QUERY_INSPECTION='collect', REPLICA_DATABASES=[]
+)
+class QueryBudgetTests(TemporaryFilesMixin, APITestCase):
+    '''
+    Requests every endpoint with real data, writes before the requests
+    undoing them, and fails on repeated queries or exceeded budgets
+    (see QueryInspectionMiddleware).
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_database(users=20, recipes=60, ingredients=50, seed=0)
+
+    def test_endpoints(self):
+        user = sample_user()
+        anonymous, client = APIClient(), APIClient()
+        client.force_authenticate(user)
+        checks = [('GET /api/recipes/ (anonymous)', anonymous, 'get',
+                   '/api/recipes/', None)] + [
+            (name, client, method, path, data)
+            for name, method, path, data in sample_requests(user)
+        ]
+        actions = set()
+        for name, requester, method, path, data in checks:
+            with self.subTest(name):
+                response = send(requester, method, path, data)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                self.assertLess(response.status_code, 400)
+                self.assertEqual(
+                    response.wsgi_request.query_inspection.problems, []
+                )
+            match = response.wsgi_request.resolver_match
+            view_actions = getattr(match.func, 'actions', {})
+            actions.add((match.func.cls, view_actions.get(method)))
+        for view_class in (RecipeViewSet, CustomUserViewSet):
+            for action in view_class.query_budget:
+                self.assertIn((view_class, action), actions)
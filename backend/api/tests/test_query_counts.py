@@ -0,0 +1,66 @@
+from django.contrib.auth import get_user_model
+from django.test.utils import override_settings
+from recipes.models import Recipe
+from rest_framework.test import APITestCase
+
+from ..endpoints import NO_CACHES, sample_user
+from ..seed import seed_database
+from .base import TemporaryFilesMixin
+
+User = get_user_model()
+
+
+@override_settings(CACHES=NO_CACHES, REPLICA_DATABASES=[])
+class QueryCountTests(TemporaryFilesMixin, APITestCase):
+    '''
+    The recipe and user endpoints prefetch their related rows
+    (with_related, with_user_flags, with_recipes), so the number of
+    queries does not grow with the number of rows on a page.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_database(users=20, recipes=60, ingredients=50, seed=0)
+        cls.user = sample_user()
+        cls.recipe = Recipe.objects.filter(author=cls.user).first()
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def assert_queries(self, count, path):
+        with self.assertNumQueries(count):
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200, path)
+        return response
+
+    def test_recipe_list(self):
+        self.assert_queries(5, '/api/recipes/?limit=1')
+        response = self.assert_queries(5, '/api/recipes/?limit=20')
+        self.assertEqual(len(response.data['results']), 20)
+
+    def test_recipe_list_anonymous(self):
+        self.client.force_authenticate(None)
+        self.assert_queries(5, '/api/recipes/?limit=20')
+
+    def test_recipe_list_filtered(self):
+        self.assert_queries(5, '/api/recipes/?is_favorited=1')
+        self.assert_queries(5, '/api/recipes/?is_in_shopping_cart=1')
+
+    def test_recipe_retrieve(self):
+        self.assert_queries(4, f'/api/recipes/{self.recipe.pk}/')
+
+    def test_users_list(self):
+        self.assert_queries(2, '/api/users/?limit=1')
+        response = self.assert_queries(2, '/api/users/?limit=20')
+        self.assertEqual(len(response.data['results']), 20)
+
+    def test_user_retrieve(self):
+        self.assert_queries(1, f'/api/users/{self.user.pk}/')
+
+    def test_subscriptions(self):
+        response = self.assert_queries(
+            3, '/api/users/subscriptions/?recipes_limit=2'
+        )
+        self.assertTrue(response.data['results'])
+        for author in response.data['results']:
+            self.assertLessEqual(len(author['recipes']), 2)
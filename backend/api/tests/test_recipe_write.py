@@ -0,0 +1,156 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from recipes.models import (Ingredient, Recipe, RecipeIngredient, RecipeTag,
+                            ShoppingCart, ShoppingListItem, Tag)
+from rest_framework.test import APITestCase
+
+from ..endpoints import NO_CACHES, sample_image
+from .base import TemporaryFilesMixin, create_user
+
+
+@override_settings(CACHES=NO_CACHES, REPLICA_DATABASES=[])
+class RecipeWriteTests(TemporaryFilesMixin, APITestCase):
+    '''
+    Creating and updating a recipe resolves its tags and ingredients
+    in bulk and reports the ids that do not exist or repeat. An update
+    writes only the tag and ingredient rows that changed.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('cook')
+        cls.lunch = Tag.objects.create(
+            name='Обед', color='#E26C2D', slug='lunch'
+        )
+        cls.dinner = Tag.objects.create(
+            name='Ужин', color='#8775D2', slug='dinner'
+        )
+        cls.beet, cls.water, cls.salt = (
+            Ingredient.objects.create(name=name, measurement_unit=unit)
+            for name, unit in (('Свёкла', 'г'), ('Вода', 'мл'), ('Соль', 'г'))
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def payload(self, tags, amounts):
+        return {
+            'name': 'Борщ', 'text': 'Варить', 'cooking_time': 30,
+            'image': sample_image(),
+            'tags': [tag.pk for tag in tags],
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': amount}
+                for ingredient, amount in amounts.items()
+            ],
+        }
+
+    def amounts(self, recipe):
+        return dict(RecipeIngredient.objects.filter(
+            recipe=recipe
+        ).values_list('ingredients', 'amount'))
+
+    def create(self, tags, amounts):
+        response = self.client.post(
+            '/api/recipes/', self.payload(tags, amounts), format='json'
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        return Recipe.objects.get(pk=response.data['id'])
+
+    def test_create(self):
+        recipe = self.create(
+            [self.lunch, self.dinner], {self.beet: 300, self.water: 2}
+        )
+        self.assertEqual(
+            self.amounts(recipe), {self.beet.pk: 300, self.water.pk: 2}
+        )
+        self.assertEqual(
+            set(recipe.tags.all()), {self.lunch, self.dinner}
+        )
+        self.assertEqual(
+            recipe.tags_mask, 1 << self.lunch.bit | 1 << self.dinner.bit
+        )
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.recipes_count, 1)
+
+    def test_create_validation(self):
+        missing = self.salt.pk + 100
+        for field, payload, error in (
+            ('tags', {'tags': [self.lunch.pk, self.lunch.pk]},
+             f'You have repeated tags: [{self.lunch.pk}]'),
+            ('tags', {'tags': [self.lunch.pk, missing]},
+             f'Tags do not exist: [{missing}]'),
+            ('ingredients', {'ingredients': []},
+             '"Ingredients" field must be filled out.'),
+            ('ingredients', {'ingredients': [
+                {'id': self.beet.pk, 'amount': 1},
+                {'id': self.beet.pk, 'amount': 2},
+            ]}, f'You have repeated ingredients: [{self.beet.pk}]'),
+            ('ingredients', {'ingredients': [
+                {'id': self.beet.pk, 'amount': 1},
+                {'id': missing, 'amount': 1},
+            ]}, f'Ingredients do not exist: [{missing}]'),
+        ):
+            with self.subTest(payload=payload):
+                response = self.client.post('/api/recipes/', {
+                    **self.payload([self.lunch], {self.beet: 1}), **payload
+                }, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data[field], [error])
+        self.assertFalse(Recipe.objects.exists())
+
+    def rows(self, model, recipe):
+        return set(model.objects.filter(recipe=recipe).values_list(
+            'pk', flat=True
+        ))
+
+    def update(self, recipe, payload):
+        response = self.client.patch(
+            f'/api/recipes/{recipe.pk}/', payload, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        recipe.refresh_from_db()
+
+    def test_update_by_diff(self):
+        recipe = self.create(
+            [self.lunch], {self.beet: 300, self.water: 2}
+        )
+        ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        ShoppingListItem.objects.bulk_create([
+            ShoppingListItem(user=self.user, ingredient=self.beet, amount=300),
+            ShoppingListItem(user=self.user, ingredient=self.water, amount=2),
+        ])
+        tags = self.rows(RecipeTag, recipe)
+        water = RecipeIngredient.objects.get(
+            recipe=recipe, ingredients=self.water
+        )
+        self.update(recipe, self.payload(
+            [self.lunch, self.dinner],
+            {self.water: 2, self.beet: 100, self.salt: 5}
+        ))
+        self.assertEqual(self.amounts(recipe), {
+            self.beet.pk: 100, self.water.pk: 2, self.salt.pk: 5
+        })
+        self.assertIn(water.pk, self.rows(RecipeIngredient, recipe))
+        self.assertLess(tags, self.rows(RecipeTag, recipe))
+        self.assertEqual(
+            recipe.tags_mask, 1 << self.lunch.bit | 1 << self.dinner.bit
+        )
+        self.assertEqual(dict(ShoppingListItem.objects.filter(
+            user=self.user
+        ).values_list('ingredient', 'amount')), {
+            self.beet.pk: 100, self.water.pk: 2, self.salt.pk: 5
+        })
+        self.update(recipe, self.payload([self.dinner], {self.salt: 5}))
+        self.assertEqual(self.amounts(recipe), {self.salt.pk: 5})
+        self.assertEqual(list(recipe.tags.all()), [self.dinner])
+        self.assertEqual(recipe.tags_mask, 1 << self.dinner.bit)
+
+    def test_unchanged_update_writes_nothing(self):
+        recipe = self.create([self.lunch], {self.beet: 300})
+        with CaptureQueriesContext(connection) as queries:
+            self.update(recipe, self.payload([self.lunch], {self.beet: 300}))
+        writes = [
+            query['sql'] for query in queries
+            if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+        ]
+        self.assertEqual(writes, [])
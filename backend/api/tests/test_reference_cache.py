@@ -0,0 +1,66 @@
+from django.core.cache import caches
+from django.test.utils import override_settings
+from recipes.models import Ingredient, Tag
+from rest_framework.test import APITransactionTestCase
+
+from .base import TemporaryFilesMixin
+
+LOCAL_CACHES = {
+    alias: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': f'tests-{alias}',
+    } for alias in ('default', 'responses')
+}
+
+
+@override_settings(CACHES=LOCAL_CACHES, REPLICA_DATABASES=[])
+class ReferenceCacheTests(TemporaryFilesMixin, APITransactionTestCase):
+    '''
+    Tags, ingredients and /api/reference/ carry an ETag that changes
+    with the data; If-None-Match is compared weakly and * matches.
+    '''
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        Tag.objects.create(name='Обед', color='#E26C2D', slug='lunch')
+        Ingredient.objects.create(name='Свёкла', measurement_unit='г')
+
+    def get(self, path, if_none_match=None):
+        headers = {}
+        if if_none_match is not None:
+            headers['HTTP_IF_NONE_MATCH'] = if_none_match
+        return self.client.get(path, **headers)
+
+    def test_if_none_match(self):
+        for path in ('/api/tags/', '/api/ingredients/', '/api/reference/'):
+            response = self.get(path)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+            self.assertTrue(etag.startswith('"'))
+            for header, status in (
+                (etag, 304), (f'W/{etag}', 304), ('*', 304),
+                (f'"other", W/{etag}', 304), ('"other"', 200), ('', 200),
+            ):
+                with self.subTest(path=path, header=header):
+                    response = self.get(path, header)
+                    self.assertEqual(response.status_code, status)
+                    self.assertEqual(response['ETag'], etag)
+                    if status == 304:
+                        self.assertEqual(response.content, b'')
+
+    def test_change_replaces_etag(self):
+        tags = self.get('/api/tags/')['ETag']
+        reference = self.get('/api/reference/')['ETag']
+        ingredients = self.get('/api/ingredients/')['ETag']
+        Tag.objects.create(name='Ужин', color='#8775D2', slug='dinner')
+        response = self.get('/api/tags/', tags)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], tags)
+        self.assertEqual(len(response.json()), 2)
+        self.assertEqual(
+            self.get('/api/reference/', reference).status_code, 200
+        )
+        self.assertEqual(
+            self.get('/api/ingredients/', ingredients).status_code, 304
+        )
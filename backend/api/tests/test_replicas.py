@@ -0,0 +1,87 @@
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.test.utils import override_settings
+from rest_framework.test import APITestCase
+
+from .. import replicas
+from ..endpoints import DUMMY_CACHE
+from .base import TemporaryFilesMixin, create_recipe, create_user
+
+LOCAL_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'responses': DUMMY_CACHE,
+}
+
+
+@override_settings(CACHES=LOCAL_CACHES, REPLICA_DATABASES=['default'])
+class ReplicaRoutingTests(TemporaryFilesMixin, APITestCase):
+    '''
+    Safe requests read from a replica the check_replicas command found
+    healthy; after a write the user's reads stay on the primary.
+    The test database stands in for the replica.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('cook')
+        cls.recipe = create_recipe(cls.user, 'Борщ')
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.chosen = []
+        choose_replica = replicas.choose_replica
+
+        def record(user):
+            self.chosen.append(choose_replica(user))
+            return self.chosen[-1]
+
+        patcher = mock.patch.object(replicas, 'choose_replica', record)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_recipes(self):
+        response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        return self.chosen.pop()
+
+    def test_unchecked_replica_is_not_used(self):
+        self.assertIsNone(self.get_recipes())
+
+    def test_refresh_stores_health(self):
+        self.assertEqual(replicas.refresh_replica_health(), {'default': True})
+        self.assertEqual(self.get_recipes(), 'default')
+        with override_settings(REPLICA_MAX_LAG=-1), self.assertLogs(
+            'api.replicas', 'WARNING'
+        ):
+            self.assertEqual(
+                replicas.refresh_replica_health(), {'default': False}
+            )
+        self.assertIsNone(self.get_recipes())
+
+    def test_requests_do_not_check_replicas(self):
+        replicas.refresh_replica_health()
+        with mock.patch.object(replicas, 'replica_lag') as replica_lag:
+            self.get_recipes()
+        replica_lag.assert_not_called()
+
+    def test_health_expires(self):
+        with override_settings(REPLICA_HEALTH_TTL=-1):
+            replicas.refresh_replica_health()
+        self.assertIsNone(self.get_recipes())
+
+    def test_write_pins_reads_to_primary(self):
+        replicas.refresh_replica_health()
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.get_recipes(), 'default')
+        self.assertIsNone(cache.get(replicas.PIN_KEY.format(self.user.pk)))
+        response = self.client.post(
+            f'/api/recipes/{self.recipe.pk}/favorite/'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(cache.get(replicas.PIN_KEY.format(self.user.pk)))
+        self.assertIsNone(self.get_recipes())
+        self.assertEqual(replicas.choose_replica(AnonymousUser()), 'default')
+        self.assertEqual(self.chosen, ['default'])
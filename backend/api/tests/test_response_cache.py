@@ -0,0 +1,78 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.test.utils import override_settings
+from recipes.models import Recipe
+from rest_framework.test import APITransactionTestCase
+
+from .base import TemporaryFilesMixin
+
+User = get_user_model()
+LOCAL_CACHES = {
+    alias: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': f'tests-{alias}',
+    } for alias in ('default', 'responses')
+}
+
+
+@override_settings(
+    CACHES=LOCAL_CACHES, REPLICA_DATABASES=[],
+    PUBLIC_BASE_URL='https://foodgram.example'
+)
+class ResponseCacheTests(TemporaryFilesMixin, APITransactionTestCase):
+    '''
+    Anonymous recipe responses are served from the "responses" cache
+    whatever the Host header, until a recipe change bumps the version.
+    '''
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        self.author = User.objects.create_user(
+            email='cook@example.com', username='cook', password='secret-42',
+            first_name='Иван', last_name='Петров'
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Борщ', text='Варить', cooking_time=90,
+            image=ContentFile(b'image', name='borsch.png')
+        )
+        User.objects.filter(pk=self.author.pk).update(recipes_count=1)
+        self.author.refresh_from_db()
+
+    def assert_cached(self, path):
+        first = self.client.get(path)
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(0):
+            second = self.client.get(path, HTTP_HOST='attacker.example')
+        self.assertEqual(second.data, first.data)
+        return second.data
+
+    def test_list(self):
+        data = self.assert_cached('/api/recipes/')
+        self.assertEqual(data['results'][0]['name'], 'Борщ')
+        self.assertTrue(data['results'][0]['image'].startswith(
+            'https://foodgram.example/media/recipes/'
+        ))
+        self.recipe.name = 'Щи'
+        self.recipe.save()
+        response = self.client.get('/api/recipes/')
+        self.assertEqual(response.data['results'][0]['name'], 'Щи')
+
+    def test_detail(self):
+        path = f'/api/recipes/{self.recipe.pk}/'
+        self.assertEqual(self.assert_cached(path)['author']['first_name'],
+                         'Иван')
+        self.author.first_name = 'Пётр'
+        self.author.save()
+        self.assertEqual(
+            self.client.get(path).data['author']['first_name'], 'Пётр'
+        )
+
+    def test_authenticated_requests_are_not_cached(self):
+        self.client.get('/api/recipes/')
+        self.client.force_authenticate(self.author)
+        response = self.client.get('/api/recipes/', HTTP_HOST='web')
+        self.assertTrue(response.data['results'][0]['image'].startswith(
+            'http://web/media/recipes/'
+        ))
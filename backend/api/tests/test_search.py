@@ -0,0 +1,96 @@
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.test import TransactionTestCase
+from django.test.utils import override_settings
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+from recipes.search import search_recipes
+
+from ..endpoints import NO_CACHES
+from .base import TemporaryFilesMixin
+
+User = get_user_model()
+
+
+@override_settings(CACHES=NO_CACHES, REPLICA_DATABASES=[])
+class SearchTests(TemporaryFilesMixin, TransactionTestCase):
+    '''
+    The full-text index is updated on commit; a query matches
+    recipes where every word starts a word of the name, the text
+    or an ingredient, and ranks name matches first.
+    '''
+
+    def setUp(self):
+        self.author = User.objects.create_user(
+            email='cook@example.com', username='cook', password='secret-42',
+            first_name='Иван', last_name='Петров'
+        )
+        self.sauce = Ingredient.objects.create(
+            name='Борщевая заправка', measurement_unit='г'
+        )
+        self.borsch = self.create('Борщ украинский', 'Варить два часа')
+        self.soup = self.create('Суп', 'Почти борщ, но без свёклы')
+        self.salad = self.create('Салат', 'Нарезать', self.sauce)
+
+    def create(self, name, text, *ingredients):
+        recipe = Recipe.objects.create(
+            author=self.author, name=name, text=text, cooking_time=30,
+            image=ContentFile(b'image', name='recipe.png')
+        )
+        for ingredient in ingredients:
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredients=ingredient, amount=1
+            )
+        return recipe
+
+    def search(self, query):
+        return list(search_recipes(Recipe.objects.all(), query))
+
+    def test_ranking(self):
+        self.assertEqual(
+            self.search('борщ'), [self.borsch, self.soup, self.salad]
+        )
+
+    def test_prefix_matching(self):
+        self.assertEqual(len(self.search('бор')), 3)
+        self.assertEqual(self.search('укр'), [self.borsch])
+        self.assertEqual(self.search('орщ'), [])
+
+    def test_every_word_must_match(self):
+        self.assertEqual(self.search('борщ укра'), [self.borsch])
+        self.assertEqual(self.search('салат заправ'), [self.salad])
+        self.assertEqual(self.search('салат свёкла'), [])
+        self.assertEqual(self.search('"!'), [])
+
+    def test_api(self):
+        response = self.client.get('/api/recipes/', {'search': 'Заправ'})
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [self.salad.id]
+        )
+
+    def test_changes_are_indexed_on_commit(self):
+        with transaction.atomic():
+            self.sauce.name = 'Томатная паста'
+            self.sauce.save()
+            self.assertEqual(self.search('томат'), [])
+        self.assertEqual(self.search('томат'), [self.salad])
+        self.assertEqual(self.search('борщевая'), [])
+
+    def test_rolled_back_changes_are_not_indexed(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.soup.name = 'Рассольник'
+            self.soup.save()
+            raise RuntimeError
+        self.assertEqual(self.search('рассольник'), [])
+        self.soup.refresh_from_db()
+        self.soup.text = 'Рассольник на обед'
+        self.soup.save()
+        self.assertEqual(self.search('рассольник'), [self.soup])
+
+    def test_deleted_recipe_leaves_the_index(self):
+        with transaction.atomic():
+            self.borsch.name = 'Борщ зелёный'
+            self.borsch.save()
+            self.borsch.delete()
+        self.assertEqual(self.search('борщ'), [self.soup, self.salad])
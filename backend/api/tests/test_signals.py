@@ -0,0 +1,29 @@
+from unittest import mock
+
+from django.db import transaction
+from django.test import TransactionTestCase
+
+from ..signals import schedule
+
+
+class ScheduleTests(TransactionTestCase):
+
+    def test_runs_once_per_transaction(self):
+        callback = mock.Mock()
+        with transaction.atomic():
+            for _ in range(3):
+                schedule(callback)
+            callback.assert_not_called()
+        callback.assert_called_once_with()
+        schedule(callback)
+        self.assertEqual(callback.call_count, 2)
+
+    def test_runs_after_a_rolled_back_transaction(self):
+        callback = mock.Mock()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            schedule(callback)
+            raise RuntimeError
+        callback.assert_not_called()
+        with transaction.atomic():
+            schedule(callback)
+        callback.assert_called_once_with()
@@ -0,0 +1,65 @@
+from django.test.utils import override_settings
+from recipes.models import Favorite, Tag
+from rest_framework.test import APITestCase
+
+from ..endpoints import NO_CACHES
+from .base import TemporaryFilesMixin, create_recipe, create_user
+
+
+@override_settings(CACHES=NO_CACHES, REPLICA_DATABASES=[])
+class TagFilterTests(TemporaryFilesMixin, APITestCase):
+    '''
+    ?tags= matches recipes with any of the tags through tags_mask,
+    tags without a bit through RecipeTag, and rejects unknown slugs.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('cook')
+        lunch, dinner, extra = (
+            Tag.objects.create(name=name, color=color, slug=slug)
+            for name, color, slug in (
+                ('Обед', '#E26C2D', 'lunch'),
+                ('Ужин', '#8775D2', 'dinner'),
+                ('Десерт', '#49B64E', 'dessert'),
+            )
+        )
+        Tag.objects.filter(pk=extra.pk).update(bit=None)
+        extra.refresh_from_db()
+        cls.soup = create_recipe(cls.user, 'Суп', tags=[lunch])
+        cls.steak = create_recipe(cls.user, 'Стейк', tags=[dinner])
+        cls.borsch = create_recipe(cls.user, 'Борщ', tags=[lunch, dinner])
+        cls.cake = create_recipe(cls.user, 'Торт', tags=[extra])
+        cls.bread = create_recipe(cls.user, 'Хлеб')
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def names(self, query):
+        response = self.client.get(f'/api/recipes/?{query}')
+        self.assertEqual(response.status_code, 200, response.data)
+        return sorted(recipe['name'] for recipe in response.data['results'])
+
+    def test_tags(self):
+        for query, names in (
+            ('tags=lunch', ['Борщ', 'Суп']),
+            ('tags=lunch&tags=dinner', ['Борщ', 'Стейк', 'Суп']),
+            ('tags=dessert', ['Торт']),
+            ('tags=dinner&tags=dessert', ['Борщ', 'Стейк', 'Торт']),
+            ('tags=', ['Борщ', 'Стейк', 'Суп', 'Торт', 'Хлеб']),
+        ):
+            with self.subTest(query=query):
+                self.assertEqual(self.names(query), names)
+
+    def test_tags_with_user_flags(self):
+        Favorite.objects.create(user=self.user, recipe=self.borsch)
+        Favorite.objects.create(user=self.user, recipe=self.cake)
+        self.assertEqual(
+            self.names('tags=lunch&tags=dessert&is_favorited=1'),
+            ['Борщ', 'Торт']
+        )
+
+    def test_unknown_tag(self):
+        response = self.client.get('/api/recipes/?tags=lunch&tags=brunch')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('tags', response.data)
@@ -0,0 +1,83 @@
+from django.test.utils import override_settings
+from recipes.models import Favorite, Ingredient, ShoppingCart, ShoppingListItem
+from rest_framework.test import APITestCase
+from users.models import Subscription
+
+from ..endpoints import NO_CACHES
+from .base import TemporaryFilesMixin, create_recipe, create_user
+
+
+@override_settings(CACHES=NO_CACHES, REPLICA_DATABASES=[])
+class ToggleTests(TemporaryFilesMixin, APITestCase):
+    '''
+    Favorite, shopping cart and subscribe answer 201 or 204 when the
+    row changed, 400 when it was already there or missing and 404
+    when the recipe or author does not exist.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('buyer')
+        cls.author = create_user('cook')
+        beet = Ingredient.objects.create(name='Свёкла', measurement_unit='г')
+        cls.recipe = create_recipe(cls.author, 'Борщ', {beet: 300})
+        cls.missing = cls.recipe.pk + 100
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def assert_toggle(self, path, missing_path, model, target, counter):
+        for method, status in (
+            ('post', 201), ('post', 400), ('delete', 204), ('delete', 400),
+        ):
+            with self.subTest(method=method, status=status):
+                response = getattr(self.client, method)(path)
+                self.assertEqual(response.status_code, status)
+                if status == 201:
+                    self.assertEqual(response.data['id'], target.pk)
+                if status == 400:
+                    self.assertIn('errors', response.data)
+                added = method == 'post'
+                self.assertEqual(model.objects.exists(), added)
+                target.refresh_from_db()
+                self.assertEqual(getattr(target, counter), int(added))
+        for method in ('post', 'delete'):
+            response = getattr(self.client, method)(missing_path)
+            self.assertEqual(response.status_code, 404)
+        self.assertFalse(model.objects.exists())
+
+    def test_favorite(self):
+        self.assert_toggle(
+            f'/api/recipes/{self.recipe.pk}/favorite/',
+            f'/api/recipes/{self.missing}/favorite/',
+            Favorite, self.recipe, 'favorites_count'
+        )
+
+    def test_shopping_cart(self):
+        path = f'/api/recipes/{self.recipe.pk}/shopping_cart/'
+        self.assert_toggle(
+            path, f'/api/recipes/{self.missing}/shopping_cart/',
+            ShoppingCart, self.recipe, 'in_carts_count'
+        )
+        self.assertFalse(ShoppingListItem.objects.exists())
+        self.assertEqual(self.client.get(path).status_code, 405)
+
+    def test_subscribe(self):
+        self.assert_toggle(
+            f'/api/users/{self.author.pk}/subscribe/',
+            f'/api/users/{self.author.pk + 100}/subscribe/',
+            Subscription, self.author, 'followers_count'
+        )
+        response = self.client.post(f'/api/users/{self.user.pk}/subscribe/')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Subscription.objects.exists())
+
+    def test_anonymous(self):
+        self.client.force_authenticate(None)
+        for path in (
+            f'/api/recipes/{self.recipe.pk}/favorite/',
+            f'/api/recipes/{self.recipe.pk}/shopping_cart/',
+            f'/api/users/{self.author.pk}/subscribe/',
+        ):
+            with self.subTest(path=path):
+                self.assertEqual(self.client.post(path).status_code, 401)
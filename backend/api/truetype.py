@@ -0,0 +1,215 @@
+import struct
+from functools import lru_cache
+
+from django.utils.functional import cached_property
+
+SUBSET_TABLES = (
+    b'OS/2', b'cvt ', b'fpgm', b'glyf', b'head', b'hhea', b'hmtx', b'loca',
+    b'maxp', b'prep',
+)
+ARG_1_AND_2_ARE_WORDS = 0x1
+WE_HAVE_A_SCALE = 0x8
+MORE_COMPONENTS = 0x20
+WE_HAVE_AN_X_AND_Y_SCALE = 0x40
+WE_HAVE_A_TWO_BY_TWO = 0x80
+
+
+def checksum(data):
+    data += b'\0' * (-len(data) % 4)
+    return sum(struct.unpack(f'>{len(data) // 4}I', data)) & 0xFFFFFFFF
+
+
+class TrueTypeFont:
+    '''
+    Reads the metrics and character map of a TrueType font and builds
+    subsets of it for embedding in PDF documents. Only the tables
+    a PDF viewer needs to render glyphs by their ids are parsed.
+    '''
+
+    def __init__(self, data):
+        self.data = data
+        count, = struct.unpack_from('>H', data, 4)
+        self.tables = {}
+        for position in range(12, 12 + 16 * count, 16):
+            tag, _, offset, length = struct.unpack_from(
+                '>4sIII', data, position
+            )
+            self.tables[tag] = (offset, length)
+        head = self.table(b'head')
+        self.units_per_em, = struct.unpack_from('>H', head, 18)
+        self.bbox = struct.unpack_from('>4h', head, 36)
+        self.long_offsets = struct.unpack_from('>h', head, 50)[0] == 1
+        hhea = self.table(b'hhea')
+        self.ascent, self.descent = struct.unpack_from('>2h', hhea, 4)
+        metrics, = struct.unpack_from('>H', hhea, 34)
+        self.glyph_count, = struct.unpack_from('>H', self.table(b'maxp'), 4)
+        self.advances = [
+            advance for advance, _ in struct.iter_unpack(
+                '>Hh', self.table(b'hmtx')[:4 * metrics]
+            )
+        ]
+        self.advances += [self.advances[-1]] * (
+            self.glyph_count - metrics
+        )
+        self.glyph_offsets = self.read_loca()
+
+    def table(self, tag):
+        offset, length = self.tables[tag]
+        return self.data[offset:offset + length]
+
+    def read_loca(self):
+        loca = self.table(b'loca')
+        if self.long_offsets:
+            return struct.unpack_from(f'>{self.glyph_count + 1}I', loca)
+        return [
+            offset * 2 for offset in
+            struct.unpack_from(f'>{self.glyph_count + 1}H', loca)
+        ]
+
+    @cached_property
+    def cmap(self):
+        '''{code point: glyph id} from the Windows Unicode BMP subtable.'''
+        cmap = self.table(b'cmap')
+        count, = struct.unpack_from('>H', cmap, 2)
+        for position in range(4, 4 + 8 * count, 8):
+            platform, encoding, offset = struct.unpack_from(
+                '>HHI', cmap, position
+            )
+            kind, = struct.unpack_from('>H', cmap, offset)
+            if (platform, encoding, kind) == (3, 1, 4):
+                return self.read_cmap_format4(cmap, offset)
+        raise ValueError('The font has no Unicode character map.')
+
+    @staticmethod
+    def read_cmap_format4(cmap, offset):
+        segments = struct.unpack_from('>H', cmap, offset + 6)[0] // 2
+        ends_at = offset + 14
+        starts_at = ends_at + 2 * segments + 2
+        deltas_at = starts_at + 2 * segments
+        ranges_at = deltas_at + 2 * segments
+        mapping = {}
+        for segment in range(segments):
+            end, start, delta, range_offset = (
+                struct.unpack_from(f'>{kind}', cmap, at + 2 * segment)[0]
+                for kind, at in (
+                    ('H', ends_at), ('H', starts_at), ('h', deltas_at),
+                    ('H', ranges_at),
+                )
+            )
+            for code in range(start, min(end, 0xFFFE) + 1):
+                if range_offset:
+                    glyph, = struct.unpack_from(
+                        '>H', cmap,
+                        ranges_at + 2 * segment + range_offset
+                        + 2 * (code - start)
+                    )
+                    if not glyph:
+                        continue
+                else:
+                    glyph = code
+                glyph = (glyph + delta) & 0xFFFF
+                if glyph:
+                    mapping[code] = glyph
+        return mapping
+
+    def glyph(self, char):
+        '''Glyph id of a character, 0 (the missing glyph) if there is none.'''
+        return self.cmap.get(ord(char), 0)
+
+    def width(self, glyph):
+        '''Advance width of a glyph in thousandths of the font size.'''
+        return round(self.advances[glyph] * 1000 / self.units_per_em)
+
+    def scale(self, value):
+        return round(value * 1000 / self.units_per_em)
+
+    def glyph_data(self, glyph):
+        start, end = self.glyph_offsets[glyph], self.glyph_offsets[glyph + 1]
+        offset = self.tables[b'glyf'][0]
+        return self.data[offset + start:offset + end]
+
+    def components(self, glyph):
+        '''Ids of the glyphs a composite glyph is made of.'''
+        data = self.glyph_data(glyph)
+        if len(data) < 10 or struct.unpack_from('>h', data, 0)[0] >= 0:
+            return []
+        found, position, flags = [], 10, MORE_COMPONENTS
+        while flags & MORE_COMPONENTS:
+            flags, component = struct.unpack_from('>HH', data, position)
+            found.append(component)
+            position += 4 + (4 if flags & ARG_1_AND_2_ARE_WORDS else 2)
+            if flags & WE_HAVE_A_SCALE:
+                position += 2
+            elif flags & WE_HAVE_AN_X_AND_Y_SCALE:
+                position += 4
+            elif flags & WE_HAVE_A_TWO_BY_TWO:
+                position += 8
+        return found
+
+    def subset(self, glyphs):
+        '''
+        Font file keeping the outlines of the given glyphs only.
+        Glyph ids do not change, the other glyphs are left empty,
+        so the subset is used with the same ids and metrics.
+        '''
+        keep, pending = {0}, list(glyphs)
+        while pending:
+            glyph = pending.pop()
+            if glyph not in keep:
+                keep.add(glyph)
+                pending += self.components(glyph)
+        glyf, offsets = bytearray(), []
+        for glyph in range(self.glyph_count):
+            offsets.append(len(glyf))
+            if glyph in keep:
+                glyf += self.glyph_data(glyph)
+                glyf += b'\0' * (-len(glyf) % 4)
+        offsets.append(len(glyf))
+        head = bytearray(self.table(b'head'))
+        head[8:12] = bytes(4)
+        head[50:52] = struct.pack('>h', 1)
+        tables = {
+            tag: self.table(tag) for tag in SUBSET_TABLES
+            if tag in self.tables
+        }
+        tables.update({
+            b'glyf': bytes(glyf),
+            b'head': bytes(head),
+            b'loca': struct.pack(f'>{len(offsets)}I', *offsets),
+        })
+        return self.build(tables)
+
+    def build(self, tables):
+        count = len(tables)
+        power = 1 << (count.bit_length() - 1)
+        header = self.data[:4] + struct.pack(
+            '>HHHH', count, power * 16, power.bit_length() - 1,
+            (count - power) * 16
+        )
+        directory, body = [], bytearray()
+        offset = len(header) + 16 * count
+        for tag in sorted(tables):
+            data = tables[tag]
+            directory.append(struct.pack(
+                '>4sIII', tag, checksum(data), offset + len(body), len(data)
+            ))
+            body += data + b'\0' * (-len(data) % 4)
+        return header + b''.join(directory) + bytes(body)
+
+
+@lru_cache(maxsize=None)
+def load_font(path):
+    '''
+    Reads a font file once per process. Raises OSError if it cannot
+    be read and ValueError if it is not a usable TrueType font.
+    '''
+    with open(path, 'rb') as file:
+        data = file.read()
+    try:
+        font = TrueTypeFont(data)
+        mapped = bool(font.cmap)
+    except (KeyError, IndexError, struct.error) as error:
+        raise ValueError(f'{path} is not a TrueType font: {error!r}')
+    if not mapped:
+        raise ValueError(f'{path} maps no characters.')
+    return font
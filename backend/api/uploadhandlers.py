@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler
+
+from .parsers import RequestTooLarge
+
+
+class LimitedUploadHandler(FileUploadHandler):
+    '''
+    First handler in the chain: rejects an uploaded file with 413
+    as soon as it exceeds settings.RECIPE_IMAGE_MAX_SIZE and passes
+    the chunks on to the default handlers, which spool large files
+    to disk.
+    '''
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.limit = settings.RECIPE_IMAGE_MAX_SIZE
+        self.received = 0
+
+    def handle_raw_input(self, input_data, meta, content_length,
+                         boundary, encoding=None):
+        if content_length > self.limit + settings.MAX_JSON_BODY_SIZE:
+            raise RequestTooLarge()
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.limit:
+            raise RequestTooLarge(f'Uploaded file exceeds {self.limit} bytes.')
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
@@ -2,7 +2,7 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from .views import (CustomUserViewSet, IngredientViewSet, RecipeViewSet,
-                    TagViewSet)
+                    ReferenceView, TagViewSet)
 
 app_name = 'api'
 
@@ -16,7 +16,7 @@ subscriptions = CustomUserViewSet.as_view({'get': 'subscriptions', })
 
 urlpatterns = (
     path('users/subscriptions/', subscriptions, name='subscriptions'),
+    path('reference/', ReferenceView.as_view(), name='reference'),
     path('auth/', include('djoser.urls.authtoken')),
-    path('', include('djoser.urls')),
     path('', include(router.urls)),
 )
@@ -1,30 +1,69 @@
+from functools import partial
+
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseForbidden
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.exceptions import MethodNotAllowed, ValidationError
 from rest_framework.permissions import (SAFE_METHODS, AllowAny,
                                         IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 from users.models import Subscription
 
+from .cache import cached_response_data, reference_payload, reference_response
 from .filters import IngredientFilter, RecipeFilter
-from .paginators import PageLimitPagination
+from .metrics import metrics_allowed, registry, render_metrics
+from .paginators import RecipePagination, UserPagination
 from .permissions import AuthorOrReadOnly
-from .serializers import (CustomUserCreateSerializer, CustomUserSerializer,
-                          IngredientSerializer, RecipeCreateUpdateSerializer,
-                          RecipeGetSerializer, RecipeShortSerializer,
+from .renderers import CSVRenderer, PDFRenderer, PlainTextRenderer
+from .replicas import ReplicaReadMixin
+from .search import get_ingredient_index
+from .serializers import (CustomUserCreateSerializer, IngredientSerializer,
+                          RecipeCreateUpdateSerializer, RecipeGetSerializer,
+                          RecipeIdsSerializer, RecipeShortSerializer,
                           SubscriptionSerializer, TagSerializer)
-from .services import download_cart
+from .services import (add_recipes_to_shopping_list, change_counter,
+                       download_cart, insert_ignore, lock_user, recipe_amounts,
+                       recipe_amounts_changed,
+                       remove_recipes_from_shopping_list)
 
 User = get_user_model()
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+def get_limit_param(request, name):
+    '''
+    Reads a non-negative integer query parameter.
+    Returns None if the parameter is not given.
+    '''
+    value = request.query_params.get(name)
+    if value is None:
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        value = -1
+    if value < 0:
+        raise ValidationError({name: 'Must be a non-negative integer.'})
+    return value
+
+
+def tags_data():
+    return TagSerializer(Tag.objects.order_by('name'), many=True).data
+
+
+def ingredients_data():
+    return get_ingredient_index().search('')
+
+
+class TagViewSet(ReplicaReadMixin, ReadOnlyModelViewSet):
     '''
     ViewSet to handle requests to the '.../api/tags/' endpoint.
     Only read requests are allowed.
@@ -34,9 +73,15 @@ class TagViewSet(ReadOnlyModelViewSet):
     serializer_class = TagSerializer
     permission_classes = [AllowAny]
     pagination_class = None
+    query_budget = 3
+
+    def list(self, request, *args, **kwargs):
+        return reference_response(
+            request, *reference_payload(('tags',), tags_data)
+        )
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(ReplicaReadMixin, ReadOnlyModelViewSet):
     '''
     ViewSet to handle requests to the '.../api/ingredients/' endpoint.
     Only read requests are allowed.
@@ -48,24 +93,67 @@ class IngredientViewSet(ReadOnlyModelViewSet):
     filter_backends = (IngredientFilter,)
     search_fields = ('^name',)
     pagination_class = None
+    query_budget = 3
+
+    def list(self, request, *args, **kwargs):
+        '''
+        Answers from the shared in-memory search index
+        instead of scanning the Ingredient table.
+        The unfiltered list is served from the reference cache.
+        '''
+        query = request.query_params.get(IngredientFilter.search_param, '')
+        limit = get_limit_param(request, 'limit')
+        if not query and limit is None:
+            return reference_response(
+                request, *reference_payload(('ingredients',), ingredients_data)
+            )
+        return Response(get_ingredient_index().search(query, limit=limit))
 
 
-class CustomUserViewSet(UserViewSet):
+class ReferenceView(APIView):
+    '''
+    View to handle requests to the '.../api/reference/' endpoint.
+    Returns all tags and ingredients in one cached response.
+    Permission is given to any user.
+    '''
+    permission_classes = [AllowAny]
+    query_budget = 3
+
+    def get(self, request):
+        return reference_response(request, *reference_payload(
+            ('tags', 'ingredients'),
+            lambda: {'tags': tags_data(), 'ingredients': ingredients_data()}
+        ))
+
+
+class CustomUserViewSet(ReplicaReadMixin, UserViewSet):
     '''
     ViewSet to handle requests to the '.../api/users/' endpoint.
     Permission to read is given to any user.
     Permission to write is given to authenticated users only.
     '''
-    pagination_class = PageLimitPagination
+    pagination_class = UserPagination
     queryset = User.objects.all()
     permission_classes = [IsAuthenticatedOrReadOnly]
     lookup_field = 'id'
     lookup_url_kwarg = 'id'
+    query_budget = {
+        'list': 4, 'retrieve': 3, 'me': 2, 'subscriptions': 5,
+        'subscribe': 8,
+    }
 
     def get_serializer_class(self):
         if self.action in ('create', 'update', 'partial_update'):
             return CustomUserCreateSerializer
-        return CustomUserSerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        return super().get_queryset().with_subscription(self.request.user)
+
+    def get_subscription_queryset(self):
+        return self.get_queryset().with_recipes(
+            get_limit_param(self.request, 'recipes_limit')
+        )
 
     @action(
         detail=True,
@@ -75,39 +163,51 @@ class CustomUserViewSet(UserViewSet):
     def subscribe(self, request, **kwargs):
         user = request.user
         author_id = kwargs.get('id')
-        author = get_object_or_404(User, id=author_id)
-        subscription = Subscription.objects.filter(
-            user=user,
-            author=author
-        )
         if request.method == 'POST':
-            if user == author:
-                return Response(
-                    {'errors': 'It\'s not allowed to subscribe to yourself.'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            if subscription.exists():
-                return Response(
-                    {'errors': 'You are already subscribed to the user'},
-                    status=status.HTTP_400_BAD_REQUEST
+            return self.add_subscription(user, author_id)
+        with transaction.atomic():
+            deleted, _ = Subscription.objects.filter(
+                user=user, author_id=author_id
+            ).delete()
+            if deleted:
+                change_counter(
+                    User.objects.filter(id=author_id), 'followers_count', -1
                 )
-            serializer = SubscriptionSerializer(
-                author,
-                context={'request': request},
-            )
-            Subscription.objects.create(
-                user=user, author=author
-            )
+        if deleted:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(User, id=author_id)
+        return Response(
+            {'errors': 'You are not subscribed to the user'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    def add_subscription(self, user, author_id):
+        if str(user.id) == str(author_id):
             return Response(
-                serializer.data, status=status.HTTP_201_CREATED
+                {'errors': 'It\'s not allowed to subscribe to yourself.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        with transaction.atomic():
+            subscribed = insert_ignore(
+                Subscription, user=user, author=author_id
             )
-        if not subscription.exists():
+            if subscribed:
+                change_counter(
+                    User.objects.filter(id=author_id), 'followers_count', 1
+                )
+        if not subscribed:
+            get_object_or_404(User, id=author_id)
             return Response(
-                {'errors': 'You are not subscribed to the user'},
+                {'errors': 'You are already subscribed to the user'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        subscription.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        serializer = SubscriptionSerializer(
+            self.get_subscription_queryset().get(id=author_id),
+            context={'request': self.request},
+        )
+        return Response(
+            serializer.data, status=status.HTTP_201_CREATED
+        )
 
     @action(
         detail=False,
@@ -115,7 +215,7 @@ class CustomUserViewSet(UserViewSet):
         methods=['get']
     )
     def subscriptions(self, request):
-        queryset = User.objects.filter(
+        queryset = self.get_subscription_queryset().filter(
             author__user=request.user
         )
         page = self.paginate_queryset(queryset)
@@ -125,51 +225,166 @@ class CustomUserViewSet(UserViewSet):
             )
             return self.get_paginated_response(serializer.data)
         serializer = SubscriptionSerializer(
-            queryset, many=True
+            queryset, many=True, context={'request': request}
         )
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class RecipeViewSet(ModelViewSet):
+class RecipeViewSet(ReplicaReadMixin, ModelViewSet):
     '''
     ViewSet to handle requests to the '.../api/recipes/' endpoint.
     Permission policy is moderated by a custom permission class.
     '''
-    queryset = Recipe.objects.all().order_by('-pub_date')
+    queryset = Recipe.objects.all().order_by('-pub_date', '-id')
     permission_classes = (AuthorOrReadOnly,)
-    pagination_class = PageLimitPagination
+    pagination_class = RecipePagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    query_budget = {
+        'list': 8, 'retrieve': 6, 'create': 22, 'update': 20,
+        'partial_update': 20, 'destroy': 20, 'favorite': 8,
+        'shopping_cart': 14, 'favorite_batch': 8, 'shopping_cart_batch': 14,
+        'download_shopping_cart': 3,
+    }
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+        return queryset.with_related().with_user_flags(self.request.user)
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeGetSerializer
         return RecipeCreateUpdateSerializer
 
-    @staticmethod
-    def add_or_delete_object(model, recipe, request):
-        current_object = model.objects.filter(
-            user=request.user, recipe=recipe
+    def cached_for_anonymous(self, request, view):
+        '''
+        Serves anonymous requests from the shared response cache,
+        since their responses do not depend on the user.
+        '''
+        if not request.user.is_anonymous:
+            return view()
+        return Response(cached_response_data(request, lambda: view().data))
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_for_anonymous(
+            request, partial(super().list, request, *args, **kwargs)
         )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_for_anonymous(
+            request, partial(super().retrieve, request, *args, **kwargs)
+        )
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            recipe_amounts_changed(instance, recipe_amounts(instance), {})
+            instance.delete()
+            change_counter(
+                User.objects.filter(id=instance.author_id),
+                'recipes_count', -1
+            )
+
+    @staticmethod
+    def add_or_delete_object(model, counter, pk, request,
+                             on_add=None, on_delete=None):
+        '''
+        Adds or removes a recipe with a single statement.
+        Errors are derived from the number of affected rows,
+        the recipe is read only to build the response.
+        '''
+        with transaction.atomic():
+            lock_user(request.user)
+            if request.method == 'POST':
+                changed = insert_ignore(model, user=request.user, recipe=pk)
+                callback, delta = on_add, 1
+            elif request.method == 'DELETE':
+                changed, _ = model.objects.filter(
+                    user=request.user, recipe_id=pk
+                ).delete()
+                callback, delta = on_delete, -1
+            else:
+                raise MethodNotAllowed(request.method)
+            if changed:
+                change_counter(Recipe.objects.filter(id=pk), counter, delta)
+            if changed and callback is not None:
+                callback(request.user, (int(pk),))
+        if not changed:
+            get_object_or_404(Recipe, id=pk)
+            return Response(
+                {'errors': (
+                    'It\'s already added' if request.method == 'POST'
+                    else 'It\'s not added'
+                )},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         if request.method == 'POST':
-            if current_object.exists():
-                return Response(
-                    {'errors': 'It\'s already added'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            model.objects.create(user=request.user, recipe=recipe)
-            serializer = RecipeShortSerializer(recipe)
+            serializer = RecipeShortSerializer(
+                get_object_or_404(Recipe, id=pk)
+            )
             return Response(
                 serializer.data, status=status.HTTP_201_CREATED
             )
-        if request.method == 'DELETE':
-            if current_object.exists():
-                current_object.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(
-            {'errors': 'It\'s not added'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @staticmethod
+    def add_or_delete_objects(model, counter, request,
+                              on_add=None, on_delete=None):
+        '''
+        Adds or removes a list of recipes in a few queries
+        and reports the outcome for every recipe id. The recipes and
+        the user's rows are read after locking the user, so concurrent
+        requests do not both count a recipe as changed; the recipes
+        stay locked, in id order, until their counters are updated,
+        so none of them is deleted in between.
+        '''
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        current_objects = model.objects.filter(user=request.user)
+        with transaction.atomic():
+            lock_user(request.user)
+            existing = set(
+                Recipe.objects.select_for_update().filter(
+                    id__in=recipe_ids
+                ).order_by('id').values_list('id', flat=True)
+            )
+            added = set(
+                current_objects.filter(
+                    recipe_id__in=existing
+                ).values_list('recipe_id', flat=True)
+            )
+            if request.method == 'POST':
+                changed = existing - added
+                model.objects.bulk_create(
+                    (model(user=request.user, recipe_id=recipe_id)
+                     for recipe_id in changed),
+                    ignore_conflicts=True
+                )
+                callback, delta = on_add, 1
+                labels = ('added', 'already added')
+            else:
+                changed = added
+                current_objects.filter(recipe_id__in=changed).delete()
+                callback, delta = on_delete, -1
+                labels = ('removed', 'not added')
+            if changed:
+                change_counter(
+                    Recipe.objects.filter(id__in=changed), counter, delta
+                )
+            if changed and callback is not None:
+                callback(request.user, changed)
+        return Response({'results': [
+            {
+                'id': recipe_id,
+                'status': (
+                    'not found' if recipe_id not in existing
+                    else labels[recipe_id not in changed]
+                )
+            }
+            for recipe_id in recipe_ids
+        ]})
 
     @action(
         detail=True,
@@ -177,24 +392,72 @@ class RecipeViewSet(ModelViewSet):
         methods=['post', 'delete']
     )
     def favorite(self, request, pk):
-        recipe = get_object_or_404(Recipe, id=pk)
         return self.add_or_delete_object(
-            Favorite, recipe=recipe, request=request
+            Favorite, 'favorites_count', pk=pk, request=request
         )
 
     @action(
         detail=True,
         permission_classes=(IsAuthenticated,),
-        methods=['post', 'get', 'delete'],
+        methods=['post', 'delete'],
         pagination_class=None
     )
     def shopping_cart(self, request, pk):
-        recipe = get_object_or_404(Recipe, id=pk)
         return self.add_or_delete_object(
-            ShoppingCart, recipe=recipe, request=request
+            ShoppingCart, 'in_carts_count', pk=pk, request=request,
+            on_add=add_recipes_to_shopping_list,
+            on_delete=remove_recipes_from_shopping_list
         )
 
-    @action(detail=False, permission_classes=(IsAuthenticated,))
+    @action(
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        methods=['post', 'delete'],
+        url_path='favorite'
+    )
+    def favorite_batch(self, request):
+        return self.add_or_delete_objects(
+            Favorite, 'favorites_count', request=request
+        )
+
+    @action(
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        methods=['post', 'delete'],
+        url_path='shopping_cart'
+    )
+    def shopping_cart_batch(self, request):
+        return self.add_or_delete_objects(
+            ShoppingCart, 'in_carts_count', request=request,
+            on_add=add_recipes_to_shopping_list,
+            on_delete=remove_recipes_from_shopping_list
+        )
+
+    @action(
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(PlainTextRenderer, CSVRenderer, PDFRenderer)
+    )
     def download_shopping_cart(self, request):
+        '''
+        Streams the shopping list. The file format is chosen
+        with the "format" query parameter: txt (default), csv or pdf.
+        '''
         user = request.user
-        return download_cart(user=user)
+        return download_cart(
+            user=user, file_format=request.accepted_renderer.format
+        )
+
+
+def metrics_view(request):
+    '''
+    Request metrics of all worker processes in the Prometheus text
+    format. Not proxied by nginx; inside the container network it
+    also requires a loopback address or the METRICS_TOKEN.
+    '''
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        render_metrics(registry.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -0,0 +1,65 @@
+import os
+
+from api.metrics import timed
+from django.db.backends.postgresql import base
+from psycopg2 import connect
+
+from .creation import DatabaseCreation
+from .pool import ConnectionPool, pools, pools_lock
+
+POOL_DEFAULTS = {
+    'MAX_SIZE': 10,
+    'TIMEOUT': 10,
+    'MAX_LIFETIME': 1800,
+    'MAX_IDLE': 300,
+    'CHECK_AFTER': 1,
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    '''
+    PostgreSQL backend that takes connections from a per-process
+    ConnectionPool and gives them back instead of closing them,
+    so a request does not pay for connecting and authenticating.
+    The pool is configured by the POOL key of the database settings
+    (see POOL_DEFAULTS); with the default CONN_MAX_AGE of 0 Django
+    returns the connection to the pool after every request, so the
+    threads of a worker share the pool.
+    Pools are keyed by process id: a forked worker opens its own
+    connections and never touches the ones inherited from the parent.
+    '''
+    creation_class = DatabaseCreation
+
+    def get_pool(self, conn_params):
+        key = (os.getpid(), self.alias, repr(sorted(conn_params.items())))
+        with pools_lock:
+            if key not in pools:
+                options = {
+                    **POOL_DEFAULTS, **self.settings_dict.get('POOL', {})
+                }
+                pools[key] = ConnectionPool(
+                    lambda: connect(**conn_params),
+                    max_size=options['MAX_SIZE'],
+                    timeout=options['TIMEOUT'],
+                    max_lifetime=options['MAX_LIFETIME'],
+                    max_idle=options['MAX_IDLE'],
+                    check_after=options['CHECK_AFTER'],
+                )
+            return pools[key]
+
+    def get_new_connection(self, conn_params):
+        with timed('connect'):
+            self.pool = self.get_pool(conn_params)
+            connection = self.pool.getconn()
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = options.get(
+            'isolation_level', connection.isolation_level
+        )
+        if self.isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.putconn(self.connection)
@@ -0,0 +1,19 @@
+from django.db.backends.postgresql import creation
+
+from .pool import close_pools
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    '''
+    PostgreSQL refuses to drop or copy a database that has connections,
+    so the pooled connections to the test database are closed first.
+    '''
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        close_pools(self.connection.alias)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+    def _clone_test_db(self, suffix, verbosity, keepdb=False):
+        self.connection.close()
+        close_pools(self.connection.alias)
+        super()._clone_test_db(suffix, verbosity, keepdb)
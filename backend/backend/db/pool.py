@@ -0,0 +1,223 @@
+import os
+import random
+import threading
+import time
+from collections import Counter, deque
+
+import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+GAUGES = ('max_size', 'size', 'idle', 'in_use', 'waiting')
+COUNTERS = (
+    'created', 'closed', 'checkouts', 'timeouts', 'failed_health_checks',
+    'wait_seconds',
+)
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+def pool_stats():
+    '''Statistics of the pools of this process, by database alias.'''
+    pid = os.getpid()
+    with pools_lock:
+        current = [
+            (alias, pool) for (owner, alias, _), pool in pools.items()
+            if owner == pid
+        ]
+    return {alias: pool.stats() for alias, pool in current}
+
+
+def close_pools(alias):
+    '''
+    Closes the pools of the database alias in this process: their idle
+    connections now, the connections in use once they are given back.
+    '''
+    pid = os.getpid()
+    with pools_lock:
+        keys = [key for key in pools if key[:2] == (pid, alias)]
+        closing = [pools.pop(key) for key in keys]
+    for pool in closing:
+        pool.close()
+
+
+class ConnectionPool:
+    '''
+    Thread-safe pool of at most "max_size" psycopg2 connections
+    opened by "connect". Idle connections are reused last in,
+    first out, so the pool shrinks back after a burst: a connection
+    idle for "max_idle" seconds is closed, as is every connection
+    after about "max_lifetime" seconds (with a jitter, so they do not
+    all reconnect at once). A connection idle for "check_after"
+    seconds or more is checked with "SELECT 1" before it is reused.
+    When all connections are in use, a request for one waits up to
+    "timeout" seconds.
+    '''
+
+    def __init__(self, connect, max_size, timeout, max_lifetime, max_idle,
+                 check_after):
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.check_after = check_after
+        self.lock = threading.Condition()
+        self.idle = deque()
+        self.deadlines = {}
+        self.size = 0
+        self.waiting = 0
+        self.closed = False
+        self.counters = Counter()
+
+    def getconn(self):
+        started = time.monotonic()
+        while True:
+            with self.lock:
+                entry = self.reserve(started)
+            if entry is None:
+                connection = self.open()
+                break
+            connection, returned = entry
+            if self.usable(connection, returned):
+                break
+            self.discard(connection)
+        with self.lock:
+            self.counters['checkouts'] += 1
+            self.counters['wait_seconds'] += time.monotonic() - started
+        return connection
+
+    def reserve(self, started):
+        '''
+        Pops an idle connection, or returns None after reserving a slot
+        for a new one. Must be called with the lock held.
+        '''
+        while not self.idle and self.size >= self.max_size:
+            remaining = self.timeout - (time.monotonic() - started)
+            if remaining <= 0:
+                self.counters['timeouts'] += 1
+                raise psycopg2.OperationalError(
+                    f'All {self.max_size} pooled connections stayed busy '
+                    f'for {self.timeout} seconds.'
+                )
+            self.waiting += 1
+            try:
+                self.lock.wait(remaining)
+            finally:
+                self.waiting -= 1
+        if self.idle:
+            return self.idle.pop()
+        self.size += 1
+        return None
+
+    def open(self):
+        try:
+            connection = self.connect()
+        except Exception:
+            with self.lock:
+                self.size -= 1
+                self.lock.notify()
+            raise
+        lifetime = self.max_lifetime * random.uniform(0.9, 1)
+        with self.lock:
+            self.deadlines[connection] = time.monotonic() + lifetime
+            self.counters['created'] += 1
+        return connection
+
+    def usable(self, connection, returned):
+        now = time.monotonic()
+        if connection.closed or now >= self.deadlines[connection]:
+            return False
+        if now - returned < self.check_after:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+        except psycopg2.Error:
+            with self.lock:
+                self.counters['failed_health_checks'] += 1
+            return False
+        return True
+
+    def putconn(self, connection):
+        '''
+        Takes a connection back. An open transaction is rolled back;
+        a broken or expired connection is closed.
+        '''
+        if (
+            not connection.closed
+            and connection.get_transaction_status() != TRANSACTION_STATUS_IDLE
+        ):
+            try:
+                connection.rollback()
+            except psycopg2.Error:
+                pass
+        if (
+            self.closed
+            or connection.closed
+            or connection.get_transaction_status() != TRANSACTION_STATUS_IDLE
+            or time.monotonic() >= self.deadlines.get(connection, 0)
+        ):
+            self.discard(connection)
+            return
+        with self.lock:
+            self.idle.append((connection, time.monotonic()))
+            stale = self.take_stale()
+            self.lock.notify()
+        for stale_connection in stale:
+            self.discard(stale_connection)
+
+    def take_stale(self):
+        '''
+        Removes the connections that stayed idle too long or expired
+        from the bottom of the idle stack. Must be called with the lock
+        held; the connections are closed by the caller.
+        '''
+        now = time.monotonic()
+        stale = []
+        while self.idle:
+            connection, returned = self.idle[0]
+            if (
+                now - returned < self.max_idle
+                and now < self.deadlines[connection]
+            ):
+                break
+            self.idle.popleft()
+            stale.append(connection)
+        return stale
+
+    def close(self):
+        '''
+        Closes the idle connections; the connections in use are closed
+        when they are given back.
+        '''
+        with self.lock:
+            self.closed = True
+            idle = [connection for connection, _ in self.idle]
+            self.idle.clear()
+        for connection in idle:
+            self.discard(connection)
+
+    def discard(self, connection):
+        with self.lock:
+            self.deadlines.pop(connection, None)
+            self.size -= 1
+            self.counters['closed'] += 1
+            self.lock.notify()
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+    def stats(self):
+        with self.lock:
+            return {
+                'max_size': self.max_size,
+                'size': self.size,
+                'idle': len(self.idle),
+                'in_use': self.size - len(self.idle),
+                'waiting': self.waiting,
+                **{name: self.counters[name] for name in COUNTERS},
+            }
@@ -1,3 +1,4 @@
+from api.views import metrics_view
 from django.contrib import admin
 from django.urls import include, path
 from django.views.generic import TemplateView
@@ -9,5 +10,6 @@ urlpatterns = [
         'redoc/',
         TemplateView.as_view(template_name='redoc.html'),
         name='redoc'
-    )
+    ),
+    path('metrics', metrics_view, name='metrics'),
 ]
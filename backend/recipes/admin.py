@@ -1,15 +1,43 @@
+from contextlib import contextmanager
+
+from api.admin_filters import input_filter
+from api.services import (add_recipes_to_shopping_list, change_counter,
+                          recipe_amounts, recipe_amounts_changed,
+                          remove_recipes_from_shopping_list)
 from django.contrib import admin
 from django.contrib.auth import get_user_model
+from django.db import transaction
 
 from .models import (Favorite, Ingredient, Recipe, RecipeIngredient, RecipeTag,
                      ShoppingCart, Tag)
 
+AUTHOR_FILTER = input_filter('author__email', 'author email')
+RECIPE_FILTER = input_filter('recipe__name', 'recipe')
+USER_FILTER = input_filter('user__email', 'user email')
+
 User = get_user_model()
 
 
+@contextmanager
+def shopping_lists_follow(recipe_ids):
+    '''
+    Propagates the ingredient changes of the given recipes made
+    in the block to the shopping lists of the users who have them
+    in the cart.
+    '''
+    old_amounts = {
+        recipe_id: recipe_amounts(recipe_id)
+        for recipe_id in set(recipe_ids)
+    }
+    yield
+    for recipe_id, amounts in old_amounts.items():
+        recipe_amounts_changed(recipe_id, amounts)
+
+
 class RecipeIngredientInline(admin.TabularInline):
     model = RecipeIngredient
     min_num = 1
+    autocomplete_fields = ('ingredients',)
 
 
 class RecipeTagInline(admin.TabularInline):
@@ -18,40 +46,152 @@ class RecipeTagInline(admin.TabularInline):
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author')
-    list_filter = ('author', 'name', 'tags')
-    search_fields = ('author', 'name', 'tags')
-    read_only_fields = ('favorite_score',)
+    list_display = ('name', 'author', 'favorites_count', 'in_carts_count')
+    list_filter = (AUTHOR_FILTER, 'tags')
+    list_select_related = ('author',)
+    search_fields = ('name', 'author__username', 'author__email')
+    readonly_fields = ('favorites_count', 'in_carts_count')
+    autocomplete_fields = ('author',)
+    show_full_result_count = False
     inlines = (RecipeIngredientInline, RecipeTagInline)
 
-    def favorite_score(self, obj):
-        return User.objects.filter(is_favorited=obj).count()
+    def save_model(self, request, obj, form, change):
+        '''
+        Keeps the authors' recipes_count in sync; the ingredient
+        amounts are compared once the inlines are saved.
+        '''
+        old_author_id = None
+        obj.old_amounts = {}
+        if change:
+            old_author_id = Recipe.objects.filter(pk=obj.pk).values_list(
+                'author_id', flat=True
+            ).get()
+            obj.old_amounts = recipe_amounts(obj)
+        super().save_model(request, obj, form, change)
+        if old_author_id != obj.author_id:
+            change_counter(
+                User.objects.filter(id=obj.author_id), 'recipes_count', 1
+            )
+            change_counter(
+                User.objects.filter(id=old_author_id), 'recipes_count', -1
+            )
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        Recipe.objects.filter(pk=form.instance.pk).update_tags_mask()
+        recipe_amounts_changed(form.instance, form.instance.old_amounts)
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            recipe_amounts_changed(obj, recipe_amounts(obj), {})
+            super().delete_model(request, obj)
+            change_counter(
+                User.objects.filter(id=obj.author_id), 'recipes_count', -1
+            )
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            for recipe in queryset:
+                self.delete_model(request, recipe)
 
 
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('name', 'measurement_unit')
-    list_filter = ('name',)
+    list_filter = (input_filter('measurement_unit', 'measurement unit'),)
     search_fields = ('name',)
+    show_full_result_count = False
 
 
 class RecipeIngredientAdmin(admin.ModelAdmin):
     list_display = ('recipe', 'ingredients', 'amount')
-    list_filter = ('recipe', 'ingredients')
+    list_filter = (
+        RECIPE_FILTER, input_filter('ingredients__name', 'ingredient')
+    )
+    list_select_related = ('recipe', 'ingredients')
+    autocomplete_fields = ('recipe', 'ingredients')
+    show_full_result_count = False
+
+    def save_model(self, request, obj, form, change):
+        recipe_ids = [obj.recipe_id]
+        if change:
+            recipe_ids += RecipeIngredient.objects.filter(
+                pk=obj.pk
+            ).values_list('recipe_id', flat=True)
+        with shopping_lists_follow(recipe_ids):
+            super().save_model(request, obj, form, change)
+
+    def delete_model(self, request, obj):
+        with shopping_lists_follow([obj.recipe_id]):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic(), shopping_lists_follow(
+            queryset.values_list('recipe_id', flat=True)
+        ):
+            super().delete_queryset(request, queryset)
 
 
 class TagAdmin(admin.ModelAdmin):
     list_display = ('name', 'color', 'slug')
     list_filter = ('name', 'slug')
+    search_fields = ('name', 'slug')
 
 
-class ShoppingCartAdmin(admin.ModelAdmin):
-    list_display = ('user', 'recipe')
-    list_filter = ('user', 'recipe')
-
-
-class FavoriteAdmin(admin.ModelAdmin):
+class UserRecipeAdmin(admin.ModelAdmin):
+    '''
+    Admin of a user-recipe relation counted in the "counter" column
+    of Recipe. Adding, changing or deleting rows updates the counter
+    as the API does.
+    '''
     list_display = ('user', 'recipe')
-    list_filter = ('user', 'recipe')
+    list_filter = (USER_FILTER, RECIPE_FILTER)
+    list_select_related = ('user', 'recipe')
+    autocomplete_fields = ('user', 'recipe')
+    show_full_result_count = False
+    counter = None
+
+    def added(self, obj):
+        change_counter(
+            Recipe.objects.filter(id=obj.recipe_id), self.counter, 1
+        )
+
+    def removed(self, obj):
+        change_counter(
+            Recipe.objects.filter(id=obj.recipe_id), self.counter, -1
+        )
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            self.removed(self.model.objects.get(pk=obj.pk))
+        super().save_model(request, obj, form, change)
+        self.added(obj)
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            super().delete_model(request, obj)
+            self.removed(obj)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            for obj in queryset:
+                self.delete_model(request, obj)
+
+
+class ShoppingCartAdmin(UserRecipeAdmin):
+    '''Also keeps the users' shopping lists in sync.'''
+    counter = 'in_carts_count'
+
+    def added(self, obj):
+        super().added(obj)
+        add_recipes_to_shopping_list(obj.user, (obj.recipe_id,))
+
+    def removed(self, obj):
+        super().removed(obj)
+        remove_recipes_from_shopping_list(obj.user, (obj.recipe_id,))
+
+
+class FavoriteAdmin(UserRecipeAdmin):
+    counter = 'favorites_count'
 
 
 admin.site.register(Ingredient, IngredientAdmin)
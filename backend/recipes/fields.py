@@ -0,0 +1,28 @@
+from django.db import models
+from django.db.models import Lookup
+
+MASK_BITS = 63
+
+
+def bitmask(bits):
+    '''Returns the integer with the given bits set; None bits are skipped.'''
+    mask = 0
+    for bit in bits:
+        if bit is not None:
+            mask |= 1 << bit
+    return mask
+
+
+class BitmaskField(models.BigIntegerField):
+    '''Integer column holding a set of flags, one per bit.'''
+
+
+@BitmaskField.register_lookup
+class HasAnyBit(Lookup):
+    '''"field__hasany=mask" matches rows sharing a bit with the mask.'''
+    lookup_name = 'hasany'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'({lhs} & {rhs}) <> 0', lhs_params + rhs_params
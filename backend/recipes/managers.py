@@ -0,0 +1,81 @@
+from collections import defaultdict
+
+from django.db.models import (BooleanField, Exists, OuterRef, Prefetch,
+                              QuerySet, Value)
+
+UPDATE_BATCH = 1000
+
+
+class RecipeQuerySet(QuerySet):
+    '''
+    QuerySet that loads everything RecipeGetSerializer needs
+    in a constant number of queries.
+    '''
+
+    def with_related(self):
+        '''Joins the author and prefetches tags and ingredient amounts.'''
+        from .models import RecipeIngredient, Tag
+
+        return self.defer('search_vector').select_related(
+            'author'
+        ).prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.all()),
+            Prefetch(
+                'recipe_amount',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredients'
+                )
+            )
+        )
+
+    def with_user_flags(self, user):
+        '''
+        Annotates "favorited", "in_shopping_cart" and
+        "author_subscribed" flags for the given user.
+        '''
+        from users.models import Subscription
+
+        from .models import Favorite, ShoppingCart
+
+        if user is None or user.is_anonymous:
+            false = Value(False, output_field=BooleanField())
+            return self.annotate(
+                favorited=false,
+                in_shopping_cart=false,
+                author_subscribed=false
+            )
+        return self.annotate(
+            favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            author_subscribed=Exists(
+                Subscription.objects.filter(
+                    user=user, author=OuterRef('author')
+                )
+            )
+        )
+
+    def update_tags_mask(self):
+        '''
+        Recomputes "tags_mask" of the recipes from their tags,
+        with one UPDATE per distinct mask.
+        '''
+        from .models import RecipeTag
+
+        masks = dict.fromkeys(self.values_list('pk', flat=True), 0)
+        rows = RecipeTag.objects.filter(
+            recipe__in=self.values('pk'), tag__bit__isnull=False
+        ).values_list('recipe_id', 'tag__bit')
+        for recipe_id, bit in rows.iterator():
+            masks[recipe_id] |= 1 << bit
+        groups = defaultdict(list)
+        for recipe_id, mask in masks.items():
+            groups[mask].append(recipe_id)
+        for mask, ids in groups.items():
+            for start in range(0, len(ids), UPDATE_BATCH):
+                self.model.objects.filter(
+                    pk__in=ids[start:start + UPDATE_BATCH]
+                ).update(tags_mask=mask)
@@ -0,0 +1,32 @@
+# Generated by Django 2.2.16 on 2026-10-18 01:51
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+from recipes.search import (create_search_index, drop_search_index,
+                            update_search_index)
+
+
+def forwards(apps, schema_editor):
+    create_search_index(schema_editor)
+    update_search_index(using=schema_editor.connection.alias)
+
+
+def backwards(apps, schema_editor):
+    drop_search_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_auto_20221019_1457'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(forwards, backwards),
+    ]
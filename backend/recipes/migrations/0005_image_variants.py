@@ -0,0 +1,54 @@
+# Generated by Django 2.2.16 on 2026-10-18 01:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def enqueue_existing_images(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    ImageVariantJob = apps.get_model('recipes', 'ImageVariantJob')
+    ImageVariantJob.objects.bulk_create(
+        (
+            ImageVariantJob(recipe_id=recipe_id)
+            for recipe_id in Recipe.objects.exclude(
+                image=''
+            ).values_list('id', flat=True).iterator()
+        ),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_thumbnail',
+            field=models.ImageField(blank=True, editable=False, upload_to='', verbose_name='Thumbnail'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_webp',
+            field=models.ImageField(blank=True, editable=False, upload_to='', verbose_name='WebP image'),
+        ),
+        migrations.CreateModel(
+            name='ImageVariantJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('running', 'running'), ('failed', 'failed')], default='pending', max_length=16, verbose_name='status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='attempts')),
+                ('error', models.TextField(blank=True, verbose_name='error')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='updated')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_jobs', to='recipes.Recipe', verbose_name='recipe')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='imagevariantjob',
+            index=models.Index(fields=['status', 'id'], name='image_job_queue_idx'),
+        ),
+        migrations.RunPython(enqueue_existing_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:17
+
+from django.db import migrations, models
+import recipes.fields
+from collections import defaultdict
+
+MASK_BITS = 63
+
+
+def fill_tags_mask(apps, schema_editor):
+    Tag = apps.get_model('recipes', 'Tag')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeTag = apps.get_model('recipes', 'RecipeTag')
+    bits = {}
+    for bit, tag_id in enumerate(
+        Tag.objects.order_by('id').values_list('id', flat=True)[:MASK_BITS]
+    ):
+        Tag.objects.filter(id=tag_id).update(bit=bit)
+        bits[tag_id] = bit
+    masks = defaultdict(int)
+    for recipe_id, tag_id in RecipeTag.objects.values_list(
+        'recipe_id', 'tag_id'
+    ).iterator():
+        if tag_id in bits:
+            masks[recipe_id] |= 1 << bits[tag_id]
+    groups = defaultdict(list)
+    for recipe_id, mask in masks.items():
+        groups[mask].append(recipe_id)
+    for mask, ids in groups.items():
+        for start in range(0, len(ids), 1000):
+            Recipe.objects.filter(
+                id__in=ids[start:start + 1000]
+            ).update(tags_mask=mask)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='tags_mask',
+            field=recipes.fields.BitmaskField(default=0, editable=False, verbose_name='Tags mask'),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, help_text='Номер бита тега в Recipe.tags_mask', null=True, unique=True, verbose_name='bit'),
+        ),
+        migrations.RunPython(fill_tags_mask, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:20
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_rows(model, owner, field, duplicates, keep):
+    '''
+    Moves the rows of duplicate ingredients to the kept one,
+    adding up amounts where the owner already has a row for it.
+    '''
+    for row in model.objects.filter(**{f'{field}__in': duplicates}):
+        kept = model.objects.filter(
+            **{owner: getattr(row, owner), field: keep}
+        ).first()
+        if kept is None:
+            setattr(row, field, keep)
+            row.save()
+        else:
+            kept.amount += row.amount
+            kept.save()
+            row.delete()
+
+
+def merge_duplicates(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    groups = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(total=Count('id'), keep=Min('id')).filter(total__gt=1)
+    for group in groups:
+        duplicates = list(Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(id=group['keep']).values_list('id', flat=True))
+        merge_rows(
+            RecipeIngredient, 'recipe_id', 'ingredients_id',
+            duplicates, group['keep']
+        )
+        merge_rows(
+            ShoppingListItem, 'user_id', 'ingredient_id',
+            duplicates, group['keep']
+        )
+        Ingredient.objects.filter(id__in=duplicates).delete()
+    if schema_editor.connection.vendor == 'postgresql':
+        # Check the deferred foreign keys now, before recipes_ingredient
+        # is altered in the same transaction.
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_tags_mask'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='ingredient',
+            name='ingredient_name_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
@@ -1,8 +1,12 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
+from .fields import MASK_BITS, BitmaskField
+from .managers import RecipeQuerySet
+
 User = get_user_model()
 
 
@@ -19,6 +23,14 @@ class Ingredient(models.Model):
         verbose_name='Единица измерения'
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient'
+            )
+        ]
+
     def __str__(self):
         return self.name
 
@@ -45,6 +57,13 @@ class Tag(models.Model):
         unique=True,
         verbose_name='Уникальный слаг'
     )
+    bit = models.PositiveSmallIntegerField(
+        verbose_name=_('bit'),
+        null=True,
+        unique=True,
+        editable=False,
+        help_text='Номер бита тега в Recipe.tags_mask'
+    )
 
     class Meta:
         verbose_name = 'Тег'
@@ -54,6 +73,23 @@ class Tag(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def free_bits(cls):
+        '''Returns the bits of Recipe.tags_mask not taken by a tag.'''
+        taken = set(
+            cls.objects.exclude(bit=None).values_list('bit', flat=True)
+        )
+        return [bit for bit in range(MASK_BITS) if bit not in taken]
+
+    def save(self, *args, **kwargs):
+        '''
+        Gives a new tag the lowest free bit. Tags created after
+        all bits are taken are matched by joins instead.
+        '''
+        if self.pk is None and self.bit is None:
+            self.bit = next(iter(self.free_bits()), None)
+        super().save(*args, **kwargs)
+
 
 class Recipe(models.Model):
     '''Model for creating recipe objects.'''
@@ -75,6 +111,16 @@ class Recipe(models.Model):
         help_text='Изображение для рецепта',
         upload_to='recipes/'
     )
+    image_thumbnail = models.ImageField(
+        verbose_name=_('Thumbnail'),
+        blank=True,
+        editable=False
+    )
+    image_webp = models.ImageField(
+        verbose_name=_('WebP image'),
+        blank=True,
+        editable=False
+    )
     text = models.TextField(
         verbose_name=_('Text'),
         blank=False,
@@ -105,6 +151,38 @@ class Recipe(models.Model):
         blank=False,
         auto_now_add=True
     )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name=_('Favorites'),
+        default=0,
+        editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name=_('In shopping carts'),
+        default=0,
+        editable=False
+    )
+    tags_mask = BitmaskField(
+        verbose_name=_('Tags mask'),
+        default=0,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_feed_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_feed_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -124,6 +202,7 @@ class RecipeIngredient(models.Model):
         Ingredient,
         related_name='ingredients_amount',
         blank=False,
+        db_index=False,
         on_delete=models.CASCADE)
     amount = models.PositiveIntegerField(
         verbose_name=_('amount'),
@@ -156,7 +235,8 @@ class RecipeTag(models.Model):
     tag = models.ForeignKey(
         Tag,
         on_delete=models.CASCADE,
-        blank=False
+        blank=False,
+        db_index=False
     )
 
     def __str__(self):
@@ -179,6 +259,7 @@ class ShoppingCart(models.Model):
     user = models.ForeignKey(
         User, on_delete=models.CASCADE,
         related_name='is_in_shopping_cart',
+        db_index=False,
         verbose_name=_('user')
     )
     recipe = models.ForeignKey(
@@ -204,6 +285,7 @@ class Favorite(models.Model):
     user = models.ForeignKey(
         User, on_delete=models.CASCADE,
         related_name='is_favorited',
+        db_index=False,
         verbose_name=_('user')
     )
     recipe = models.ForeignKey(
@@ -219,3 +301,83 @@ class Favorite(models.Model):
                 name='favorite_constraints'
             )
         ]
+
+
+class ShoppingListItem(models.Model):
+    '''
+    Total amount of an ingredient over every recipe
+    in a user's shopping cart. Maintained incrementally
+    whenever the cart or a recipe in it changes.
+    '''
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='shopping_list',
+        db_index=False,
+        verbose_name=_('user')
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name=_('ingredient')
+    )
+    amount = models.IntegerField(
+        verbose_name=_('amount'),
+        default=0
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='shopping_list_constraints'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user} {self.ingredient}: {self.amount}'
+
+
+class ImageVariantJob(models.Model):
+    '''
+    Queued job that renders the thumbnail and WebP variants
+    of a recipe image. Processed by the process_image_jobs command.
+    '''
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, _('pending')),
+        (RUNNING, _('running')),
+        (FAILED, _('failed')),
+    )
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE,
+        related_name='image_jobs',
+        verbose_name=_('recipe')
+    )
+    status = models.CharField(
+        max_length=16,
+        choices=STATUSES,
+        default=PENDING,
+        verbose_name=_('status')
+    )
+    attempts = models.PositiveIntegerField(
+        default=0,
+        verbose_name=_('attempts')
+    )
+    error = models.TextField(
+        blank=True,
+        verbose_name=_('error')
+    )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name=_('updated')
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='image_job_queue_idx')
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} {self.status}'
@@ -0,0 +1,188 @@
+import re
+import threading
+from collections import defaultdict
+from functools import partial
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections, transaction
+from django.db.models import F, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+UPDATE_BATCH_SIZE = 500
+
+INGREDIENT_NAMES_SQL = (
+    "SELECT {aggregate} FROM recipes_recipeingredient ri "
+    "JOIN recipes_ingredient i ON i.id = ri.ingredients_id "
+    "WHERE ri.recipe_id = r.id"
+)
+
+POSTGRESQL_UPDATE_SQL = (
+    "UPDATE recipes_recipe r SET search_vector = "
+    "setweight(to_tsvector(%(config)s, r.name), 'A') || "
+    "setweight(to_tsvector(%(config)s, r.text), 'B') || "
+    "setweight(to_tsvector(%(config)s, coalesce(("
+    + INGREDIENT_NAMES_SQL.format(aggregate="string_agg(i.name, ' ')")
+    + "), '')), 'C')"
+)
+
+SQLITE_INSERT_SQL = (
+    f"INSERT INTO {FTS_TABLE} (rowid, name, text, ingredients) "
+    "SELECT r.id, r.name, r.text, coalesce(("
+    + INGREDIENT_NAMES_SQL.format(aggregate="group_concat(i.name, ' ')")
+    + "), '') FROM recipes_recipe r"
+)
+
+
+def create_search_index(schema_editor):
+    '''
+    Creates the backend specific full-text index:
+    a GIN index over Recipe.search_vector on PostgreSQL
+    or an FTS5 shadow table on SQLite.
+    '''
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX recipes_recipe_search_vector_gin '
+            'ON recipes_recipe USING gin (search_vector)'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5('
+            "name, text, ingredients, tokenize = 'unicode61')"
+        )
+
+
+def drop_search_index(schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'DROP INDEX IF EXISTS recipes_recipe_search_vector_gin'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def update_search_index(recipe_ids=None, using='default'):
+    '''
+    Recomputes the indexed document of the given recipes
+    (of every recipe if "recipe_ids" is None).
+    '''
+    connection = connections[using]
+    if recipe_ids is not None:
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            params = {'config': SEARCH_CONFIG}
+            sql = POSTGRESQL_UPDATE_SQL
+            if recipe_ids is not None:
+                sql += ' WHERE r.id = ANY(%(ids)s)'
+                params['ids'] = recipe_ids
+            cursor.execute(sql, params)
+        elif connection.vendor == 'sqlite':
+            delete_sql = f'DELETE FROM {FTS_TABLE}'
+            insert_sql = SQLITE_INSERT_SQL
+            params = ()
+            if recipe_ids is not None:
+                placeholders = ', '.join('%s' for _ in recipe_ids)
+                delete_sql += f' WHERE rowid IN ({placeholders})'
+                insert_sql += f' WHERE r.id IN ({placeholders})'
+                params = recipe_ids
+            cursor.execute(delete_sql, params)
+            cursor.execute(insert_sql, params)
+
+
+class PendingSearchUpdates(threading.local):
+    '''Recipe ids whose document is recomputed on commit, by alias.'''
+
+    def __init__(self):
+        self.recipe_ids = defaultdict(set)
+
+
+pending_search_updates = PendingSearchUpdates()
+
+
+def flush_search_updates(using):
+    recipe_ids = sorted(pending_search_updates.recipe_ids.pop(using, ()))
+    for start in range(0, len(recipe_ids), UPDATE_BATCH_SIZE):
+        update_search_index(
+            recipe_ids[start:start + UPDATE_BATCH_SIZE], using=using
+        )
+
+
+def schedule_search_update(recipe_ids, using='default'):
+    '''
+    Recomputes the indexed document of the given recipes
+    once the current transaction is committed, together with
+    the other recipes scheduled in the same transaction: the first
+    flush on commit updates them all, the later ones find nothing.
+    A flush is queued on every call, so ids left over by a rolled
+    back transaction are updated by the next commit instead of
+    blocking it.
+    '''
+    pending_search_updates.recipe_ids[using].update(recipe_ids)
+    transaction.on_commit(partial(flush_search_updates, using), using=using)
+
+
+def remove_from_search_index(recipe_id, using='default'):
+    '''
+    Drops a deleted recipe from the SQLite shadow table
+    and from the update scheduled on commit.
+    '''
+    connection = connections[using]
+    pending_search_updates.recipe_ids[using].discard(recipe_id)
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', (recipe_id,)
+        )
+
+
+def search_recipes(queryset, query):
+    '''
+    Filters the queryset by a full-text query
+    and orders it by relevance. Every word of the query must match
+    the start of a word of the recipe, on PostgreSQL and SQLite alike.
+    '''
+    vendor = connections[queryset.db].vendor
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return queryset.none()
+    if vendor == 'postgresql':
+        search_query = SearchQuery(
+            ' & '.join(f"'{term}':*" for term in terms),
+            search_type='raw', config=SEARCH_CONFIG
+        )
+        return queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-search_rank', '-pub_date')
+    if vendor == 'sqlite':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        return queryset.extra(
+            where=(
+                f'recipes_recipe.id IN (SELECT rowid FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s)',
+            ),
+            params=(match,)
+        ).annotate(
+            search_rank=RawSQL(
+                f'SELECT -bm25({FTS_TABLE}, 10.0, 5.0, 1.0) '
+                f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'AND rowid = recipes_recipe.id',
+                (match,), output_field=FloatField()
+            )
+        ).order_by('-search_rank', '-pub_date')
+    condition = Q()
+    for term in terms:
+        condition &= (
+            Q(name__icontains=term)
+            | Q(text__icontains=term)
+            | Q(ingredients__name__icontains=term)
+        )
+    return queryset.filter(
+        id__in=queryset.model.objects.filter(condition).values('id')
+    )
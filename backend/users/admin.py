@@ -1,17 +1,56 @@
+from api.admin_filters import input_filter
+from api.services import change_counter
 from django.contrib import admin
+from django.db import transaction
 
 from .models import CustomUser, Subscription
 
 
 class UserAdmin(admin.ModelAdmin):
-    list_display = ('username', 'email', 'first_name', 'last_name')
-    list_filter = ('username', 'email')
+    list_display = (
+        'username', 'email', 'first_name', 'last_name',
+        'recipes_count', 'followers_count'
+    )
     search_fields = ('username', 'email')
+    readonly_fields = ('recipes_count', 'followers_count')
+    show_full_result_count = False
 
 
 class SubscriptionAdmin(admin.ModelAdmin):
     list_display = ('user', 'author')
-    list_filter = ('user', 'author')
+    list_filter = (
+        input_filter('user__email', 'user email'),
+        input_filter('author__email', 'author email')
+    )
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+    show_full_result_count = False
+
+    @staticmethod
+    def followers_changed(author_id, delta):
+        change_counter(
+            CustomUser.objects.filter(id=author_id), 'followers_count', delta
+        )
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            self.followers_changed(
+                Subscription.objects.filter(pk=obj.pk).values_list(
+                    'author_id', flat=True
+                ).get(), -1
+            )
+        super().save_model(request, obj, form, change)
+        self.followers_changed(obj.author_id, 1)
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            super().delete_model(request, obj)
+            self.followers_changed(obj.author_id, -1)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            for obj in queryset:
+                self.delete_model(request, obj)
 
 
 admin.site.register(CustomUser, UserAdmin)
@@ -1,8 +1,52 @@
 from django.contrib.auth.models import UserManager
-from django.db.models import Q
+from django.db.models import (BooleanField, Exists, OuterRef, Prefetch, Q,
+                              QuerySet, Subquery, Value)
 
 
-class CustomUserManager(UserManager):
+class CustomUserQuerySet(QuerySet):
+    '''
+    QuerySet with annotations used by the user serializers,
+    so that no per-row queries are needed while rendering.
+    '''
+
+    def with_subscription(self, user):
+        '''Annotates "is_subscribed" flag for the given user.'''
+        from .models import Subscription
+
+        if user is None or user.is_anonymous:
+            return self.annotate(
+                is_subscribed=Value(False, output_field=BooleanField())
+            )
+        return self.annotate(
+            is_subscribed=Exists(
+                Subscription.objects.filter(
+                    user=user, author=OuterRef('pk')
+                )
+            )
+        )
+
+    def with_recipes(self, limit=None):
+        '''
+        Prefetches the latest recipes of every user,
+        at most "limit" recipes per user.
+        '''
+        from recipes.models import Recipe
+
+        recipes = Recipe.objects.order_by('-pub_date', '-id')
+        if limit == 0:
+            recipes = recipes.none()
+        elif limit is not None:
+            recipes = recipes.filter(
+                id__in=Subquery(
+                    Recipe.objects.filter(
+                        author=OuterRef('author')
+                    ).order_by('-pub_date', '-id').values('id')[:limit]
+                )
+            )
+        return self.prefetch_related(Prefetch('recipes', queryset=recipes))
+
+
+class CustomUserManager(UserManager.from_queryset(CustomUserQuerySet)):
 
     def get_by_natural_key(self, username):
         return self.get(
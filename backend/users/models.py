@@ -40,6 +40,16 @@ class CustomUser(AbstractUser):
         max_length=150,
         blank=False
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name=_('recipes'),
+        default=0,
+        editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name=_('followers'),
+        default=0,
+        editable=False
+    )
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name', 'password']
 
@@ -59,6 +69,7 @@ class Subscription(models.Model):
         CustomUser,
         on_delete=models.CASCADE,
         null=True,
+        db_index=False,
         related_name='subscriber'
     )
     author = models.ForeignKey(